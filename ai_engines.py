@@ -0,0 +1,161 @@
+import subprocess
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from ai_json import iter_json_values
+
+class AIEngineError(Exception):
+    """Lỗi khi gọi 1 engine AI (giữ lại stderr / body để caller phân loại lỗi)."""
+    def __init__(self, engine, message):
+        super().__init__(message)
+        self.engine = engine
+
+class BaseEngine:
+    """
+    1 engine AI với giới hạn số lời gọi đồng thời.
+    Các thread vượt quá giới hạn sẽ chờ tới khi có slot trống.
+    """
+    def __init__(self, name, max_concurrency):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def call(self, prompt, model):
+        with self._slots:
+            return self._call(prompt, model)
+
+    def _call(self, prompt, model):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class CliEngine(BaseEngine):
+    """Spawn CLI (Node) cho mỗi prompt - chậm do cold start, dùng khi không có HTTP endpoint."""
+    def __init__(self, name, max_concurrency, command_fn, parse_fn):
+        super().__init__(name, max_concurrency)
+        self._command_fn = command_fn
+        self._parse_fn = parse_fn
+
+    def _call(self, prompt, model):
+        process = subprocess.Popen(
+            self._command_fn(model),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8"
+        )
+        try:
+            stdout, stderr = process.communicate(input=prompt, timeout=config.AI_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise AIEngineError(self.name, f"Timeout sau {config.AI_TIMEOUT}s")
+
+        if process.returncode != 0:
+            raise AIEngineError(self.name, stderr)
+        return self._parse_fn(stdout)
+
+class HttpEngine(BaseEngine):
+    """
+    Gọi 1 gateway HTTP cục bộ giữ sẵn worker "ấm" (không tốn cold start mỗi lần).
+    Giao thức: POST {"model": ..., "prompt": ...} -> {"response": "..."}
+    Connection được giữ keep-alive qua Session dùng chung.
+    """
+    def __init__(self, name, max_concurrency, endpoint):
+        super().__init__(name, max_concurrency)
+        self.endpoint = endpoint
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _call(self, prompt, model):
+        try:
+            response = self._session.post(
+                self.endpoint,
+                json={"model": model, "prompt": prompt},
+                timeout=config.AI_TIMEOUT,
+            )
+        except requests.RequestException as e:
+            raise AIEngineError(self.name, str(e))
+
+        if response.status_code != 200:
+            raise AIEngineError(self.name, f"HTTP {response.status_code}: {response.text}")
+        return response.json().get("response", "")
+
+    def close(self):
+        self._session.close()
+
+def gemini_command(model):
+    # Đường dẫn tới gemini CLI từ config
+    gemini_path = getattr(config, "GEMINI_CLI_PATH", "gemini")
+    return [gemini_path, "--model", model, "--output-format", "json"]
+
+def codex_command(model):
+    # Example: codex exec --model gpt-5.2 --skip-git-repo-check - <<'PROMPT'
+    codex_path = getattr(config, "CODEX_CLI_PATH", "codex")
+    return [codex_path, "exec", "--model", model, "--skip-git-repo-check", "-"]
+
+def parse_gemini_output(stdout):
+    """Gemini CLI (--output-format json) trả về {"response": "..."} sau vài dòng log."""
+    # Bỏ qua các dòng log (có thể chứa ngoặc nhọn), lấy object đầu tiên có khóa "response"
+    for value, truncated_start in iter_json_values(stdout):
+        if isinstance(value, dict) and "response" in value:
+            return value.get("response", "")
+    return None
+
+def parse_codex_output(stdout):
+    """
+    Codex output thường có header và footer.
+    Tìm dòng 'codex' và lấy phần sau đó cho đến khi thấy 'tokens used'.
+    """
+    content_lines = []
+    is_content = False
+    for line in stdout.splitlines():
+        if line.strip() == "codex":
+            is_content = True
+            continue
+        if line.strip() == "tokens used":
+            break
+        if is_content:
+            content_lines.append(line)
+
+    if not content_lines:
+        # Nếu không tìm thấy format chuẩn, trả về toàn bộ stdout để caller tự parse
+        return stdout.strip()
+
+    return "\n".join(content_lines).strip()
+
+_CLI_SPECS = {
+    "gemini": (gemini_command, parse_gemini_output),
+    "codex": (codex_command, parse_codex_output),
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def build_engine(name):
+    max_concurrency = config.AI_MAX_CONCURRENCY.get(name, 4)
+    endpoint = config.AI_HTTP_ENDPOINTS.get(name)
+    if endpoint:
+        return HttpEngine(name, max_concurrency, endpoint)
+    command_fn, parse_fn = _CLI_SPECS[name]
+    return CliEngine(name, max_concurrency, command_fn, parse_fn)
+
+def get_engine(name):
+    """Lấy engine dùng chung (tạo 1 lần / process) theo tên: 'gemini' hoặc 'codex'."""
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            engine = _engines[name] = build_engine(name)
+        return engine
+
+def reset_engines():
+    """Đóng và xóa các engine đã tạo (VD: sau khi đổi config lúc chạy benchmark)."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.close()
+        _engines.clear()
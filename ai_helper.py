@@ -1,129 +1,129 @@
-import subprocess
-import json
-import os
+import time
 import config
+from ai_engines import get_engine, AIEngineError
+from ai_cache import get_cache, ResponseCache
+from ai_router import get_router
+from token_budget import estimate_tokens, get_prompt_stats
+from metrics import get_metrics
 
-import threading
+HYBRID_ENGINES = ("gemini", "codex")
 
-# Counter để xoay vòng Engine (Round-robin)
-_engine_counter = 0
-_counter_lock = threading.Lock()
-
-def call_ai_cli(prompt, model=None, engine_override=None):
+def call_ai_cli(prompt, model=None, engine_override=None, use_cache=True):
     """
     Hàm gọi AI tùy theo cấu hình (Gemini hoặc Codex).
     Hỗ trợ engine_override cho phép ép luồng dùng AI cụ thể.
+    Câu trả lời được cache trên đĩa theo (engine, model, prompt); use_cache=False để bỏ qua cache.
     """
-    global _engine_counter
-    
     engine = engine_override or getattr(config, "AI_ENGINE", "gemini").lower()
-    
+
+    cache = get_cache() if use_cache else None
+    if cache is None:
+        return _dispatch(prompt, model, engine)
+
+    cache_model = _cache_model(engine, model)
+    key = cache_key(prompt, model, engine)
+    cached = cache.get(key)
+    get_metrics().inc("ai_cache_requests", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+
+    res = _dispatch(prompt, model, engine)
+    if res:
+        cache.put(key, engine, cache_model, res)
+    return res
+
+def discard_cached(prompt, model=None, engine_override=None):
+    """Xóa câu trả lời đã cache của 1 prompt (VD: caller không parse được) để lần sau gọi lại AI."""
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.delete(cache_key(prompt, model, engine_override))
+
+def cache_key(prompt, model=None, engine_override=None):
+    """
+    Key cache của 1 prompt (hoặc chuỗi bất kỳ caller tự cache theo, VD: điểm từng tiêu đề) theo engine / model cấu hình.
+    Ở chế độ hybrid, key theo cấu hình được yêu cầu chứ không theo engine thực sự trả lời,
+    để lần chạy lại trúng cache bất kể lần trước Gemini hay Codex đã xử lý.
+    """
+    engine = engine_override or getattr(config, "AI_ENGINE", "gemini").lower()
+    return ResponseCache.make_key(engine, _cache_model(engine, model), prompt)
+
+def cache_stats():
+    """Thống kê hit/miss của cache AI trong process hiện tại (None nếu cache tắt)."""
+    cache = get_cache()
+    return cache.stats() if cache else None
+
+def _cache_model(engine, model):
     if engine == "hybrid":
-        with _counter_lock:
-            # Xoay vòng giữa gemini và codex
-            current_choice = _engine_counter % 2
-            _engine_counter += 1
-        
-        if current_choice == 0:
-            res = call_gemini_cli(prompt, model or config.GEMINI_MODEL)
-            # Nếu Gemini lỗi (nhiều khả năng là 429), thử fallback sang Codex ngay
-            if res is None:
-                print("🔄 Gemini failed/limit, falling back to Codex...")
-                return call_codex_cli(prompt, config.CODEX_MODEL)
-            return res
-        else:
-            return call_codex_cli(prompt, config.CODEX_MODEL)
-            
-    if engine == "codex":
+        return "|".join(_engine_model(name, model) for name in HYBRID_ENGINES)
+    return _engine_model(engine, model)
+
+def _engine_model(name, model):
+    if name == "codex":
         # Nếu dùng Codex nhưng model truyền vào là của Gemini, ép sang Codex model
-        actual_model = model if model and not model.startswith("gemini") else config.CODEX_MODEL
-        return call_codex_cli(prompt, actual_model)
-    else:
-        return call_gemini_cli(prompt, model or config.GEMINI_MODEL)
+        return model if model and not model.startswith("gemini") else config.CODEX_MODEL
+    return model or config.GEMINI_MODEL
 
-def call_gemini_cli(prompt, model="gemini-2.5-pro"):
+def _dispatch(prompt, model, engine):
+    if engine == "hybrid":
+        # Chọn engine theo trọng số (latency, tỉ lệ thành công), bỏ qua engine đang bị ngắt mạch
+        router = get_router()
+        ordered = router.route(HYBRID_ENGINES)
+        for i, name in enumerate(ordered):
+            res = _call_engine(name, prompt, _engine_model(name, model))
+            if res:
+                for unused in ordered[i + 1:]:
+                    router.state(unused).breaker.release_probe()
+                return res
+            if i + 1 < len(ordered):
+                print(f"🔄 {name.capitalize()} failed/limit, falling back to {ordered[i + 1].capitalize()}...")
+        return None
+
+    # 1 engine cố định: vẫn chờ circuit breaker cho phép trước khi tiêu token của rate limiter
+    name = "codex" if engine == "codex" else "gemini"
+    get_router().route([name])
+    return _call_engine(name, prompt, _engine_model(name, model))
+
+def _call_engine(name, prompt, model):
     """
-    Calls the local 'gemini' CLI tool.
+    Gọi qua engine layer (CLI hoặc HTTP gateway), giới hạn concurrency theo từng engine.
+    Mỗi lời gọi đi qua rate limiter của engine và cập nhật thống kê cho router / circuit breaker.
     """
+    label = name.capitalize()
+    state = get_router().state(name)
+    state.bucket.acquire()
+    start = time.monotonic()
     try:
-        # Đường dẫn tới gemini CLI từ config
-        gemini_path = getattr(config, "GEMINI_CLI_PATH", "gemini")
-        process = subprocess.Popen(
-            [gemini_path, "--model", model, "--output-format", "json"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8"
-        )
-        
-        stdout, stderr = process.communicate(input=prompt)
-        
-        if process.returncode != 0:
-            print(f"❌ Gemini CLI Error: {stderr}")
-            return None
-        
-        json_start = stdout.find('{')
-        if json_start == -1:
-            return None
-            
-        json_str = stdout[json_start:]
-        response_data = json.loads(json_str)
-        return response_data.get("response", "")
-
+        res = get_engine(name).call(prompt, model)
+    except AIEngineError as e:
+        get_metrics().inc("ai_call_errors", engine=name, model=model)
+        state.record_failure(str(e))
+        print(f"❌ {label} Error: {e}")
+        return None
     except Exception as e:
-        print(f"❌ Lỗi khi thực thi Gemini CLI: {e}")
+        get_metrics().inc("ai_call_errors", engine=name, model=model)
+        state.record_failure(str(e))
+        print(f"❌ Lỗi khi thực thi {label}: {e}")
         return None
 
-def call_codex_cli(prompt, model="gpt-5.2"):
+    if not res:
+        get_metrics().inc("ai_call_errors", engine=name, model=model)
+        state.record_failure("empty response")
+        return None
+    elapsed = time.monotonic() - start
+    state.record_success(elapsed)
+    get_metrics().observe("ai_call_seconds", elapsed, engine=name, model=model)
+    get_prompt_stats().record(model, estimate_tokens(prompt), elapsed, len(res))
+    return res
+
+def call_gemini_cli(prompt, model="gemini-2.5-pro"):
     """
-    Calls the local 'codex' CLI tool.
-    Example: codex exec --model gpt-5.2 --skip-git-repo-check - <<'PROMPT'
+    Calls Gemini (local 'gemini' CLI or the configured HTTP gateway).
     """
-    try:
-        # Đường dẫn tới codex CLI từ config
-        codex_path = getattr(config, "CODEX_CLI_PATH", "codex")
-        process = subprocess.Popen(
-            [codex_path, "exec", "--model", model, "--skip-git-repo-check", "-"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8"
-        )
-        
-        stdout, stderr = process.communicate(input=prompt)
-        
-        if process.returncode != 0:
-            print(f"❌ Codex CLI Error: {stderr}")
-            return None
-        
-        # Codex output thường có header và footer
-        # Ta lấy nội dung sau dấu gạch ngang cuối cùng hoặc sau chữ 'codex'
-        lines = stdout.splitlines()
-        content_lines = []
-        is_content = False
-        
-        # Logic bóc tách: Lấy phần text thô ở cuối (trước phần token used)
-        # Hoặc đơn giản là trả về toàn bộ stdout và để caller tự parse JSON nếu cần.
-        # Codex thường trả về text trực tiếp.
-        
-        # Tìm dòng 'codex' và lấy phần sau đó cho đến khi thấy 'tokens used'
-        for i, line in enumerate(lines):
-            if line.strip() == "codex":
-                is_content = True
-                continue
-            if line.strip() == "tokens used":
-                break
-            if is_content:
-                content_lines.append(line)
-        
-        if not content_lines:
-            # Nếu không tìm thấy format chuẩn, lấy 5 dòng cuối cùng bỏ đi 2 dòng cuối
-            return stdout.strip()
-
-        return "\n".join(content_lines).strip()
+    return _call_engine("gemini", prompt, model)
 
-    except Exception as e:
-        print(f"❌ Lỗi khi thực thi Codex CLI: {e}")
-        return None
+def call_codex_cli(prompt, model="gpt-5.2"):
+    """
+    Calls Codex (local 'codex' CLI or the configured HTTP gateway).
+    """
+    return _call_engine("codex", prompt, model)
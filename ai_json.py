@@ -0,0 +1,155 @@
+import json
+from pydantic import ValidationError
+
+_CLOSING = {"}": "{", "]": "["}
+
+class AIJSONError(ValueError):
+    """Không tìm thấy JSON hợp lệ trong câu trả lời của AI."""
+    pass
+
+class ArrayResult:
+    """
+    Kết quả bóc JSON array:
+    - items: các phần tử hợp lệ (đã validate nếu có model)
+    - invalid: các phần tử sai định dạng (giữ nguyên dict gốc)
+    - truncated: array bị cắt cụt giữa chừng (đã giữ lại các phần tử hoàn chỉnh)
+    """
+    def __init__(self, items, invalid, truncated):
+        self.items = items
+        self.invalid = invalid
+        self.truncated = truncated
+
+def _find_end(text, start):
+    """
+    Quét từ text[start] ('{' hoặc '[') tới dấu đóng tương ứng, bỏ qua ngoặc nằm trong chuỗi.
+    Output: vị trí ngay sau dấu đóng; None nếu hết text (bị cắt cụt); -1 nếu ngoặc không khớp.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if not stack or stack[-1] != _CLOSING[char]:
+                return -1
+            stack.pop()
+            if not stack:
+                return i + 1
+    return None
+
+def _next_open(text, pos):
+    candidates = [i for i in (text.find("{", pos), text.find("[", pos)) if i != -1]
+    return min(candidates) if candidates else -1
+
+def iter_json_values(text):
+    """
+    Yield (value, truncated_start) cho từng giá trị JSON object/array cấp ngoài cùng trong text,
+    bỏ qua văn bản, markdown fence xung quanh. Gặp giá trị bị cắt cụt thì yield (None, vị trí bắt đầu) rồi dừng.
+    """
+    text = text or ""
+    pos = _next_open(text, 0)
+    while pos != -1:
+        end = _find_end(text, pos)
+        if end is None:
+            yield None, pos
+            return
+        value = None
+        if end != -1:
+            try:
+                value = json.loads(text[pos:end])
+            except ValueError:
+                end = -1
+        if end == -1:
+            # Không phải JSON (VD: "[1]" trong văn bản) -> thử từ ngoặc kế tiếp
+            pos = _next_open(text, pos + 1)
+            continue
+        yield value, None
+        pos = _next_open(text, end)
+
+def _salvage_array(text, start):
+    """Lấy các phần tử hoàn chỉnh của array bị cắt cụt bắt đầu tại text[start] == '['."""
+    items = []
+    pos = start + 1
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] not in "{[":
+            return items
+        end = _find_end(text, pos)
+        if end is None or end == -1:
+            return items
+        try:
+            items.append(json.loads(text[pos:end]))
+        except ValueError:
+            return items
+        pos = end
+
+def _validate(value, model):
+    if model is None:
+        return value
+    return model.model_validate(value)
+
+def extract_object(text, model=None):
+    """
+    JSON object đầu tiên trong câu trả lời (validate bằng pydantic model nếu có).
+    Raise AIJSONError nếu không có object nào / object không hợp lệ.
+    """
+    last_error = None
+    for value, truncated_start in iter_json_values(text):
+        if truncated_start is not None:
+            break
+        if not isinstance(value, dict):
+            continue
+        try:
+            return _validate(value, model)
+        except ValidationError as e:
+            last_error = e
+    raise AIJSONError(f"Không tìm thấy JSON object hợp lệ: {last_error or (text or '')[:100]!r}")
+
+def extract_array(text, model=None):
+    """
+    JSON array đầu tiên trong câu trả lời, validate từng phần tử.
+    - Array bị cắt cụt: giữ lại các phần tử hoàn chỉnh (truncated=True).
+    - Model trả về các object rời (không bọc trong array): coi như các phần tử.
+    Raise AIJSONError nếu không có phần tử nào.
+    """
+    raw_items = None
+    loose_objects = []
+    truncated = False
+    for value, truncated_start in iter_json_values(text):
+        if truncated_start is not None:
+            if text[truncated_start] == "[" and not loose_objects:
+                raw_items = _salvage_array(text, truncated_start)
+            truncated = True
+            break
+        if isinstance(value, list) and (model is None or any(isinstance(v, dict) for v in value)):
+            raw_items = value
+            break
+        if not isinstance(value, dict):
+            continue
+        loose_objects.append(value)
+
+    if raw_items is None:
+        raw_items = loose_objects
+    if not raw_items:
+        raise AIJSONError(f"Không tìm thấy JSON array: {(text or '')[:100]!r}")
+
+    items, invalid = [], []
+    for raw in raw_items:
+        try:
+            items.append(_validate(raw, model))
+        except ValidationError:
+            invalid.append(raw)
+    return ArrayResult(items, invalid, truncated)
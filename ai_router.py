@@ -0,0 +1,247 @@
+import re
+import time
+import random
+import threading
+import config
+
+# Dấu hiệu bị giới hạn quota trong stderr / body trả về của CLI hoặc gateway
+RATE_LIMIT_PATTERN = re.compile(r"\b429\b|quota|rate.?limit|resource.?exhausted|too many requests", re.IGNORECASE)
+RETRY_AFTER_PATTERN = re.compile(r"retry (?:in|after) ([\d.]+)\s*s", re.IGNORECASE)
+
+def is_rate_limited(error_text):
+    return bool(error_text) and RATE_LIMIT_PATTERN.search(error_text) is not None
+
+def parse_retry_after(error_text):
+    match = RETRY_AFTER_PATTERN.search(error_text or "")
+    return float(match.group(1)) if match else None
+
+class TokenBucket:
+    """
+    Token bucket tự điều chỉnh (AIMD): gặp 429 thì giảm nửa tốc độ,
+    mỗi lần thành công tăng dần lại tới mức cấu hình.
+    """
+    def __init__(self, rate_per_min, burst, min_rate_per_min):
+        self.max_rate = float(rate_per_min)
+        self.min_rate = float(min_rate_per_min)
+        self.rate = float(rate_per_min)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate / 60.0)
+        self._updated = now
+
+    def acquire(self):
+        """Chờ (block) tới khi có token."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) * 60.0 / self.rate)
+            time.sleep(min(max(wait, 0.01), 5))
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 1)
+
+    def on_rate_limited(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+class BreakerSignal:
+    """
+    Báo cho các thread đang chờ (Router.route) khi 1 circuit breaker đổi trạng thái / trả lại lượt thử.
+    Dùng số thế hệ để không lỡ tín hiệu xảy ra giữa lúc kiểm tra allow() và lúc bắt đầu chờ.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generation = 0
+
+    @property
+    def generation(self):
+        with self._cond:
+            return self._generation
+
+    def notify(self):
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def wait(self, generation, timeout):
+        """Chờ tới khi có tín hiệu mới sau `generation` hoặc hết timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._generation != generation, timeout)
+
+_breaker_signal = BreakerSignal()
+
+class CircuitBreaker:
+    """
+    closed -> (N lỗi liên tiếp) -> open -> (hết cooldown) -> half_open (cho 1 request thử)
+    -> thành công: closed / thất bại: open lại.
+    Lượt thử giữ quá probe_timeout giây (thread gọi bị treo / không báo kết quả) thì cho lượt thử khác.
+    """
+    def __init__(self, name, failure_threshold, cooldown, probe_timeout, signal=_breaker_signal):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._signal = signal
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and (not self._probe_in_flight or now - self._probe_started >= self.probe_timeout):
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+            return False
+
+    def release_probe(self):
+        """Trả lại lượt thử half_open đã giữ bởi allow() nhưng cuối cùng không dùng."""
+        with self._lock:
+            released = self.state == "half_open" and self._probe_in_flight
+            if released:
+                self._probe_in_flight = False
+        if released:
+            self._signal.notify()
+
+    def seconds_until_retry(self):
+        """Thời gian tối đa tới khi allow() có thể cho qua (half_open: tới khi lượt thử đang chạy bị coi là treo)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open":
+                return max(0.0, self.cooldown - (now - self._opened_at))
+            if self.state == "half_open" and self._probe_in_flight:
+                return max(0.0, self.probe_timeout - (now - self._probe_started))
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            changed = self.state != "closed"
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+        if changed:
+            self._signal.notify()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            changed = self.state == "half_open"
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"⛔ Circuit breaker {self.name} mở (sau {self._failures} lỗi), tạm ngưng {self.cooldown}s")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+        if changed:
+            # Lượt thử thất bại: thread đang chờ tính lại thời gian chờ theo cooldown mới
+            self._signal.notify()
+
+class EngineState:
+    """Rate limiter + circuit breaker + thống kê latency/tỉ lệ thành công (EWMA) của 1 engine."""
+    def __init__(self, name):
+        self.name = name
+        self.bucket = TokenBucket(
+            config.AI_RATE_LIMITS.get(name, 60),
+            burst=config.AI_MAX_CONCURRENCY.get(name, 4),
+            min_rate_per_min=config.AI_RATE_LIMIT_MIN,
+        )
+        self.breaker = CircuitBreaker(name, config.AI_BREAKER_FAILURES, config.AI_BREAKER_COOLDOWN, probe_timeout=config.AI_TIMEOUT)
+        self.latency_ewma = None
+        self.success_ewma = 1.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency):
+        alpha = config.AI_ROUTING_EWMA_ALPHA
+        with self._lock:
+            self.latency_ewma = latency if self.latency_ewma is None else (1 - alpha) * self.latency_ewma + alpha * latency
+            self.success_ewma = (1 - alpha) * self.success_ewma + alpha
+        self.bucket.on_success()
+        self.breaker.record_success()
+
+    def record_failure(self, error_text):
+        alpha = config.AI_ROUTING_EWMA_ALPHA
+        with self._lock:
+            self.success_ewma = (1 - alpha) * self.success_ewma
+        if is_rate_limited(error_text):
+            retry_after = parse_retry_after(error_text)
+            self.bucket.on_rate_limited(retry_after)
+            print(f"🐢 {self.name} bị giới hạn quota, giảm tốc còn {self.bucket.rate:.1f} req/phút")
+        self.breaker.record_failure()
+
+    def weight(self):
+        with self._lock:
+            # Chưa có số liệu latency -> coi như trung bình để engine mới vẫn được thử
+            latency = self.latency_ewma if self.latency_ewma is not None else config.AI_ROUTING_DEFAULT_LATENCY
+            return max(self.success_ewma, 0.01) / max(latency, 0.1)
+
+class Router:
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def state(self, name):
+        with self._lock:
+            state = self._states.get(name)
+            if state is None:
+                state = self._states[name] = EngineState(name)
+            return state
+
+    def route(self, candidates):
+        """
+        Thứ tự engine nên thử: engine đầu được chọn ngẫu nhiên theo trọng số
+        (success_rate / latency), các engine còn lại làm fallback.
+        Chỉ gồm engine có circuit breaker cho phép; nếu tất cả đang mở / đang chờ lượt thử half_open
+        thì chờ tới khi engine sớm nhất hết cooldown hoặc lượt thử đang chạy báo kết quả.
+        """
+        announced = False
+        while True:
+            generation = _breaker_signal.generation
+            allowed = [name for name in candidates if self.state(name).breaker.allow()]
+            if allowed:
+                break
+            wait = min(self.state(name).breaker.seconds_until_retry() for name in candidates)
+            if not announced:
+                print(f"⏳ Tất cả engine đang tạm ngưng, chờ tối đa {wait:.0f}s...")
+                announced = True
+            _breaker_signal.wait(generation, max(wait, 0.05))
+
+        ordered = []
+        pool = list(allowed)
+        while pool:
+            weights = [self.state(name).weight() for name in pool]
+            choice = random.choices(pool, weights=weights)[0]
+            ordered.append(choice)
+            pool.remove(choice)
+        return ordered
+
+_router = Router()
+
+def get_router():
+    return _router
+
+def reset_router():
+    """Xóa rate limiter / circuit breaker / thống kê của mọi engine (VD: giữa các lượt benchmark, sau khi đổi config)."""
+    with _router._lock:
+        _router._states.clear()
@@ -4,7 +4,7 @@ import os
 TEST_MODE = False  # Chuyển thành False khi chạy thật
 TEST_LIMIT = 50    # Số lượng bài tối đa lấy từ mỗi nguồn khi ở chế độ TEST
 TEST_RANDOM = False # Nếu True, trong mode TEST sẽ chọn bài ngẫu nhiên thay vì bài mới nhất
-USE_SSH_TUNNEL = True # TRUE khi chạy ở Local Mac, FALSE khi chạy ở VPS
+USE_SSH_TUNNEL = os.getenv("USE_SSH_TUNNEL", "True").lower() == "true" # TRUE khi chạy ở Local Mac, FALSE khi chạy ở VPS (hoặc Postgres local của infrastructure/postgres)
 
 # --- Cấu hình chung ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,6 +21,9 @@ STEP3_FILE = os.path.join(DATA_DIR, "data_step3.json")
 ANALYSIS_DB_FILE = os.path.join(DATA_DIR, "analysis_db.json")   # DB lưu phân tích từng bài báo
 DAILY_INSIGHTS_FILE = os.path.join(DATA_DIR, "daily_insights.json") # DB lưu insight theo ngày
 HISTORY_FILE = os.path.join(DATA_DIR, "processed_history.json")
+FEED_STATE_FILE = os.path.join(DATA_DIR, "feed_state.json") # ETag/Last-Modified của từng nguồn RSS (conditional GET)
+RUN_REPORT_DIR = os.path.join(DATA_DIR, "run_reports") # Run report JSON (thời gian từng bước, latency AI/scrape/DB)
+METRICS_PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "") # VD: /var/lib/node_exporter/textfile/news.prom (để trống: không xuất)
 
 # --- RSS URLs ---
 RSS_URLS = [
@@ -31,6 +34,22 @@ RSS_URLS = [
     "https://rss.nytimes.com/services/xml/rss/nyt/Economy.xml",
     "https://tuoitre.vn/rss/kinh-doanh.rss",
 ]
+RSS_FETCH_WORKERS = 16 # Số nguồn RSS tải song song
+RSS_TIMEOUT = 20       # Timeout (giây) cho mỗi request RSS
+RSS_POLL_INTERVAL = 600 # Chế độ chạy nền: số giây giữa 2 lần quét 1 nguồn RSS
+RSS_POLL_INTERVALS = {  # ...riêng cho từng nguồn (nguồn ít bài mới thì quét thưa hơn)
+    "https://rss.nytimes.com/services/xml/rss/nyt/Business.xml": 1800,
+    "https://rss.nytimes.com/services/xml/rss/nyt/Economy.xml": 1800,
+}
+
+# --- Database Pool Config ---
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 10     # Số connection tối đa dùng chung cho mọi step / worker thread
+DB_POOL_PING_AFTER = 30   # Connection idle quá N giây sẽ được ping (SELECT 1) trước khi giao cho caller
+
+# --- Work Queue (nhiều worker / máy cùng xử lý bảng articles) ---
+WORK_LEASE_SECONDS = 600  # Lease giữ bài; worker chết thì sau N giây bài được worker khác lấy lại
+WORK_CLAIM_LIMIT = int(os.getenv("WORK_CLAIM_LIMIT", "0")) or None # Số bài tối đa mỗi bước giữ 1 lần (None: tất cả). Đặt nhỏ khi chạy nhiều worker để chia việc
 
 # --- AI CLI Config ---
 AI_ENGINE = "gemini" # Hoặc "gemini", "codex", "hybrid"
@@ -43,6 +62,28 @@ FILTER_MODEL = "gemini-3-flash-preview"
 CODEX_MODEL = "gpt-5.2"
 IMPORTANCE_THRESHOLD = 7 # Điểm tối thiểu (1-10) để lấy bài báo
 
+# Step 2: Lọc tin theo batch song song
+FILTER_WORKERS = 4                 # Số batch gửi AI cùng lúc
+FILTER_BATCH_MAX_ITEMS = 50        # Số tiêu đề tối đa mỗi batch
+FILTER_PROMPT_TOKEN_BUDGET = 3000  # Số token tối đa cho phần danh sách tiêu đề trong 1 prompt
+FILTER_BATCH_RETRIES = 1           # Số lần hỏi lại các bài AI bỏ sót / trả sai định dạng trong batch
+
+# Giới hạn token cho phần nội dung trong 1 prompt theo model (ngân sách của từng bước không vượt quá giá trị này)
+MODEL_PROMPT_TOKEN_LIMITS = {
+    "gemini-3-pro-preview": 16000,
+    "gemini-3-flash-preview": 8000,
+    "gpt-5.2": 16000,
+}
+DEFAULT_PROMPT_TOKEN_LIMIT = 8000
+
+# Prefilter cục bộ trước khi gửi AI chấm điểm
+PREFILTER_ENABLED = True
+PREFILTER_DROP_PROBABILITY = 0.05      # Loại tin nếu classifier ước tính xác suất đạt ngưỡng < giá trị này
+PREFILTER_DUPLICATE_THRESHOLD = 0.8    # Jaccard (bigram tiêu đề) để coi là tin trùng lặp
+PREFILTER_MIN_TRAINING_SAMPLES = 300   # Số bài đã chấm tối thiểu để bật classifier
+PREFILTER_TRAINING_DAYS = 60           # Học từ điểm AI trong N ngày gần nhất
+PREFILTER_AUDIT_RATE = 0.05            # Tỉ lệ tin bị loại vẫn gửi AI để đo độ lệch
+
 # Paths to CLI tools (Differentiates between Local Mac and VPS)
 if USE_SSH_TUNNEL:
     # Local Mac Paths
@@ -53,17 +94,93 @@ else:
     GEMINI_CLI_PATH = "/home/rizao/.nvm/versions/node/v24.13.0/bin/gemini"
     CODEX_CLI_PATH = "/home/linuxbrew/.linuxbrew/bin/codex"
 
+# Engine layer: nếu có HTTP gateway giữ worker "ấm" thì gọi qua HTTP keep-alive,
+# nếu không sẽ spawn CLI cho mỗi prompt như cũ.
+AI_HTTP_ENDPOINTS = {
+    "gemini": os.getenv("GEMINI_HTTP_ENDPOINT", ""), # VD: http://127.0.0.1:8787/generate
+    "codex": os.getenv("CODEX_HTTP_ENDPOINT", ""),
+}
+AI_MAX_CONCURRENCY = {"gemini": 4, "codex": 4} # Số lời gọi đồng thời tối đa cho mỗi engine
+AI_TIMEOUT = 600 # Timeout (giây) cho 1 lời gọi AI
+
+# Rate limiter (token bucket tự giảm tốc khi gặp 429) + Circuit breaker cho từng engine
+AI_RATE_LIMITS = {"gemini": 60, "codex": 60} # Số request / phút tối đa
+AI_RATE_LIMIT_MIN = 2                         # Tốc độ thấp nhất khi liên tục bị 429
+AI_BREAKER_FAILURES = 3                       # Số lỗi liên tiếp trước khi ngắt mạch
+AI_BREAKER_COOLDOWN = 60                      # Giây tạm ngưng engine bị ngắt mạch
+AI_ROUTING_EWMA_ALPHA = 0.2                   # Hệ số làm mượt thống kê latency / tỉ lệ thành công
+AI_ROUTING_DEFAULT_LATENCY = 10.0             # Latency giả định (giây) khi engine chưa có số liệu
+
+# Cache câu trả lời AI (chạy lại cùng ngày gần như không tốn lời gọi AI)
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_BYPASS", "False").lower() != "true" # AI_CACHE_BYPASS=true để tắt cache
+AI_CACHE_FILE = os.path.join(DATA_DIR, "ai_cache.sqlite3")
+AI_CACHE_TTL = 3 * 24 * 3600            # Giây
+AI_CACHE_MAX_ENTRIES = 50000
+AI_CACHE_MAX_BYTES = 500 * 1024 * 1024  # 500MB
+
+# --- Story Clustering (gom tin trùng trước khi cào / phân tích) ---
+DEDUP_WINDOW_HOURS = 48          # So khớp với các bài trong N giờ gần nhất
+DEDUP_TITLE_THRESHOLD = 0.5      # Jaccard (ước lượng MinHash) của tiêu đề
+DEDUP_CONTENT_THRESHOLD = 0.5    # Jaccard (ước lượng MinHash) của nội dung
+DEDUP_CONTENT_CHARS = 2000       # Chỉ so khớp N ký tự đầu của nội dung
+
 # --- Scraping Config ---
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 SCRAPE_TIMEOUT = 15
-SCRAPE_SLEEP = 2
+SCRAPE_SLEEP = 0.5                 # Khoảng cách tối thiểu (giây) giữa 2 lần bắt đầu request tới cùng 1 host
+SCRAPE_CONCURRENCY = 50            # Tổng số request đồng thời
+SCRAPE_PER_HOST_CONCURRENCY = 4    # Số request đồng thời tối đa tới 1 host
+SCRAPE_MAX_RETRIES = 3             # Retry khi lỗi mạng / 429 / 5xx
+SCRAPE_BACKOFF_BASE = 1.0          # Giây, backoff = base * 2^lần_thử * jitter(0.5-1.5)
+SCRAPE_PARSE_WORKERS = os.cpu_count() or 2 # Số process bóc tách HTML (CPU-bound)
+SCRAPE_HTML_QUEUE_SIZE = 100       # Số trang HTML tối đa chờ bóc tách (giới hạn bộ nhớ)
+SCRAPE_COMMIT_BATCH = 20           # Ghi DB sau mỗi N bài cào xong
+SCRAPE_COMMIT_INTERVAL = 5.0       # ...hoặc sau N giây, tùy điều kiện nào tới trước
+SCRAPE_MAX_ATTEMPTS = 3            # Số lần cào lỗi trước khi chuyển 'scrape_failed'
 MIN_ARTICLE_LENGTH = 100
 
+# --- HTML ARCHIVE (lưu HTML thô đã tải để bóc tách lại offline) ---
+HTML_ARCHIVE_ENABLED = True
+HTML_ARCHIVE_DIR = os.path.join(DATA_DIR, "html_archive")
+HTML_ARCHIVE_SEGMENT_BYTES = 256 * 1024 * 1024 # Sang segment mới khi segment hiện tại vượt kích thước này
+HTML_ARCHIVE_ZSTD_LEVEL = 3
+HTML_ARCHIVE_MIN_BYTES = 2048                   # Trang nhỏ hơn coi là hỏng (cắt cụt / trang lỗi), không lưu
+HTML_ARCHIVE_CHALLENGE_MAX_BYTES = 100 * 1024   # Trang nhỏ hơn mà có dấu hiệu captcha / chặn bot thì không lưu
+HTML_ARCHIVE_QUEUE_SIZE = 200                   # Số trang chờ ghi archive tối đa
+HTML_ARCHIVE_WRITE_BATCH = 50                   # Số trang mỗi lần ghi (1 lần fsync)
+HTML_ARCHIVE_WRITE_INTERVAL = 2.0               # Giây, ghi lô chưa đủ trang sau khoảng này
+
 # --- Report Config ---
 MAX_ARTICLES_PER_REPORT = 5
-MAX_CHARS_PER_ARTICLE = 5000
+ANALYSIS_ARTICLE_TOKEN_BUDGET = 1800 # Số token (ước lượng) tối đa cho nội dung 1 bài: giữ đoạn đầu + câu nhiều số liệu, không cắt ngang câu
+ANALYSIS_COMMIT_BATCH = 20         # Ghi kết quả phân tích vào DB sau mỗi N bài
+ANALYSIS_COMMIT_INTERVAL = 5.0     # ...hoặc sau N giây, tùy điều kiện nào tới trước
+ANALYSIS_WORKERS = 6               # Số thread gọi AI phân tích song song
+ANALYSIS_BATCH_MODE = True         # Gộp nhiều bài vào 1 prompt phân tích (False: 1 bài/prompt)
+ANALYSIS_BATCH_MAX_ITEMS = 8       # Số bài tối đa trong 1 prompt phân tích
+ANALYSIS_PROMPT_TOKEN_BUDGET = 12000 # Ngân sách token (ước lượng) cho phần nội dung bài trong 1 prompt
+ANALYSIS_BATCH_RETRIES = 1         # Số lần gom bài lỗi thành batch mới trước khi phân tích riêng từng bài
+ANALYSIS_MAX_ATTEMPTS = 3          # Số lượt phân tích lỗi trước khi chuyển 'analysis_failed'
+INSIGHT_GROUP_MAX_ARTICLES = 40    # Số bài tối đa trong 1 nhóm insight trung gian (nhóm lớn hơn được chia nhỏ)
 REPORT_TITLE_PREFIX = "Báo Cáo Điểm Tin Tài Chính"
 
+# --- PIPELINE ---
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "batch") # "batch": chạy lần lượt từng bước; "stream": lọc/cào/phân tích chạy gối nhau
+PIPELINE_SCRAPE_QUEUE_SIZE = 200   # Số bài tối đa chờ cào (đầy thì bước lọc tạm dừng)
+PIPELINE_ANALYSIS_QUEUE_SIZE = 50  # Số bài tối đa chờ phân tích (đầy thì bước cào tạm dừng)
+PIPELINE_ANALYSIS_WORKERS = 4      # Số luồng phân tích, mỗi luồng xử lý 1 micro-batch tại 1 thời điểm
+PIPELINE_ANALYSIS_LINGER = 2.0     # Giây chờ gom thêm bài vào micro-batch phân tích
+PIPELINE_COMMIT_BATCH = 5          # Lô ghi nội dung nhỏ hơn chế độ batch để bài sớm sang bước phân tích
+PIPELINE_COMMIT_INTERVAL = 1.0     # ...hoặc sau N giây
+PIPELINE_DEDUP = True              # Gom cụm tin trùng theo tiêu đề sau mỗi batch lọc
+
+# --- DAEMON (python daemon.py) ---
+DAEMON_PROCESS_INTERVAL = 300      # Giây giữa 2 lần lọc / cào / phân tích các bài mới
+DAEMON_INSIGHT_INTERVAL = 3600     # Giây giữa 2 lần tổng hợp lại insight ngày (chỉ tính lại nhóm ngành có bài mới)
+DAEMON_NOTIFY_HOURS = [7]          # Giờ (theo giờ máy) gửi insight ngày qua Telegram
+DAEMON_MAX_SLEEP = 30              # Giây ngủ tối đa giữa 2 lần kiểm tra lịch
+DAEMON_METRICS_INTERVAL = 3600     # Giây giữa 2 lần ghi run report + reset số liệu (kể cả khi không có bài để xử lý)
+
 # --- Telegram Config ---
 ENABLE_TELEGRAM = os.getenv("ENABLE_TELEGRAM", "True").lower() == "true"
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
@@ -0,0 +1,179 @@
+import time
+import signal
+import threading
+from datetime import datetime
+import config
+import step1_fetch
+import step4_report
+import notifier
+import pipeline
+from daily_brief import run_stages, write_run_report
+from database_manager import get_db
+from insights import generate_daily_insights
+from metrics import get_metrics, reset_metrics
+from work_queue import count_pending
+
+# Nguồn sắp đến hạn trong khoảng này được quét chung 1 lần (giây)
+POLL_GRACE = 1.0
+
+class Job:
+    """1 việc chạy định kỳ của tiến trình nền (mặc định chạy ngay ở vòng đầu tiên)."""
+    def __init__(self, name, interval, func, run_now=True):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = 0.0 if run_now else time.monotonic() + interval
+
+    def run(self):
+        started = time.monotonic()
+        try:
+            self.func()
+        finally:
+            # Lịch cố định theo thời điểm bắt đầu; chạy quá giờ thì vòng sau chạy ngay
+            self.next_run = started + self.interval
+
+class FeedPoller(Job):
+    """Quét RSS theo chu kỳ riêng của từng nguồn (config.RSS_POLL_INTERVALS), mỗi lần chỉ quét các nguồn đến hạn."""
+    def __init__(self):
+        super().__init__("fetch", None, None)
+        self.next_poll = {url: 0.0 for url in config.RSS_URLS}
+
+    @staticmethod
+    def poll_interval(url):
+        return config.RSS_POLL_INTERVALS.get(url, config.RSS_POLL_INTERVAL)
+
+    def run(self):
+        now = time.monotonic()
+        due = [url for url, next_poll in self.next_poll.items() if next_poll <= now + POLL_GRACE]
+        for url in due:
+            self.next_poll[url] = now + self.poll_interval(url)
+        self.next_run = min(self.next_poll.values())
+
+        metrics = get_metrics()
+        with metrics.stage("fetch"):
+            total, new_count = step1_fetch.fetch_rss(due)
+        metrics.inc("articles_new", new_count)
+
+def process_new_articles():
+    """
+    Lọc -> cào -> phân tích các bài chưa xử lý (theo status trong DB, không quét lại bài đã xong).
+    Mỗi lần xử lý là 1 chu kỳ: ghi run report (kèm các lần quét RSS trước đó) rồi bắt đầu bộ số liệu mới.
+    """
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            pending_count = count_pending(cur)
+    if not pending_count:
+        return
+
+    print(f"\n🔄 [Daemon] {pending_count} bài chờ xử lý.")
+    metrics = get_metrics()
+    try:
+        if config.PIPELINE_MODE == "stream":
+            with metrics.stage("pipeline"):
+                _, analyzed_count = pipeline.run_streaming(insight=False)
+            metrics.set("articles_analyzed", analyzed_count)
+        else:
+            run_stages(metrics, insight=False)
+    finally:
+        write_run_report(metrics)
+        reset_metrics()
+
+def roll_metrics():
+    """
+    Ghi run report cho số liệu tích lũy từ lần reset trước (quét RSS, tổng hợp insight, query DB...)
+    rồi bắt đầu bộ số liệu mới. Lúc không có bài để xử lý, process_new_articles không reset
+    nên nếu không có việc này số liệu trong tiến trình chạy lâu sẽ tăng mãi.
+    """
+    metrics = get_metrics()
+    if metrics.stages or metrics.samples or metrics.counters:
+        write_run_report(metrics)
+    reset_metrics()
+
+class InsightPublisher:
+    """
+    Tổng hợp lại insight ngày (chỉ nhóm ngành có bài mới tốn lời gọi AI) và gửi Telegram
+    1 lần cho mỗi mốc giờ trong config.DAEMON_NOTIFY_HOURS.
+    """
+    def __init__(self):
+        # Các mốc giờ đã qua trước khi tiến trình khởi động không gửi bù
+        self.last_slot = self.current_slot()
+
+    @staticmethod
+    def current_slot():
+        now = datetime.now()
+        passed = [hour for hour in config.DAEMON_NOTIFY_HOURS if hour <= now.hour]
+        return (now.date(), max(passed)) if passed else None
+
+    def __call__(self):
+        metrics = get_metrics()
+        with metrics.stage("insight"):
+            with get_db() as conn:
+                daily_insight = generate_daily_insights(conn)
+                if not daily_insight or not step4_report.save_daily_insight(conn, daily_insight):
+                    return
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT count(*) FROM articles
+                        WHERE status = 'analyzed'
+                        AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'
+                    """)
+                    analyzed_count = cur.fetchone()[0]
+
+        slot = self.current_slot()
+        if slot is None or slot == self.last_slot:
+            return
+        print("\n🔔 Sending Telegram notification...")
+        with metrics.stage("notify"):
+            msg = notifier.format_daily_insight_message(daily_insight, analyzed_count)
+            notifier.send_telegram_message(msg)
+        self.last_slot = slot
+
+class Scheduler:
+    """
+    Chạy lần lượt các Job đến hạn trong 1 thread (các bước dùng chung DB pool, AI cache...).
+    SIGTERM / SIGINT: dừng sau khi việc đang chạy hoàn tất; nhận tín hiệu lần 2 thì thoát ngay.
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.stop_event = threading.Event()
+
+    def stop(self, signum, frame):
+        if self.stop_event.is_set():
+            print("⛔ [Daemon] Thoát ngay.")
+            raise SystemExit(1)
+        print(f"\n🛑 [Daemon] Nhận {signal.Signals(signum).name}, dừng sau khi việc đang chạy hoàn tất...")
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            for job in self.jobs:
+                if self.stop_event.is_set():
+                    break
+                if job.next_run > time.monotonic():
+                    continue
+                try:
+                    job.run()
+                except Exception as e:
+                    print(f"❌ [Daemon] Việc '{job.name}' lỗi: {e}")
+            next_run = min(job.next_run for job in self.jobs)
+            self.stop_event.wait(min(max(0.0, next_run - time.monotonic()), config.DAEMON_MAX_SLEEP))
+
+def main():
+    print("🛰️ KHỞI ĐỘNG TIẾN TRÌNH NỀN TỔNG HỢP TIN 🛰️")
+    print(f"   RSS: {len(config.RSS_URLS)} nguồn, mặc định {config.RSS_POLL_INTERVAL}s/lần | "
+          f"xử lý bài mới: {config.DAEMON_PROCESS_INTERVAL}s | insight: {config.DAEMON_INSIGHT_INTERVAL}s | "
+          f"pipeline: {config.PIPELINE_MODE}")
+
+    scheduler = Scheduler([
+        FeedPoller(),
+        Job("process", config.DAEMON_PROCESS_INTERVAL, process_new_articles),
+        Job("insight", config.DAEMON_INSIGHT_INTERVAL, InsightPublisher()),
+        Job("metrics", config.DAEMON_METRICS_INTERVAL, roll_metrics, run_now=False),
+    ])
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    scheduler.run()
+    print("👋 Đã dừng tiến trình nền.")
+
+if __name__ == "__main__":
+    main()
@@ -4,23 +4,76 @@ import step3_scrape
 import step4_report
 import config
 import notifier
+import pipeline
+from ai_helper import cache_stats
+from token_budget import get_prompt_stats
+from metrics import get_metrics
 
 def main():
+    metrics = get_metrics()
+    try:
+        run(metrics)
+    finally:
+        write_run_report(metrics)
+
+def write_run_report(metrics):
+    """Ghi run report JSON (và file Prometheus nếu được cấu hình), kể cả khi pipeline dừng giữa chừng."""
+    metrics.report()
+    try:
+        path = metrics.write_report()
+        print(f"📄 Run report: {path}")
+        if config.METRICS_PROMETHEUS_FILE:
+            metrics.write_prometheus(config.METRICS_PROMETHEUS_FILE)
+    except Exception as e:
+        print(f"⚠️ Không ghi được run report: {e}")
+
+def run_stages(metrics, insight=True):
+    """
+    Bước 2-4 chạy tuần tự. Output: (daily_insight, analyzed_count).
+    Bước 3-4 luôn chạy (kể cả khi bước 2 không chọn thêm bài) để xử lý nốt bài tồn đọng:
+    bài cào lỗi còn 'filtered_in', bài phân tích lỗi còn 'scraped'.
+    """
+    # BƯỚC 2: LỌC TIN (GEMINI) -> UPDATE STATUS 'filtered_in'
+    print("\n[2/4] Filtering News...")
+    with metrics.stage("filter"):
+        selected_urls = step2_filter.filter_news()
+    metrics.set("articles_selected", len(selected_urls or []))
+    if not selected_urls:
+        print("ℹ️ Không có bài mới được chọn sau khi lọc, chỉ xử lý bài tồn đọng.")
+
+    # BƯỚC 3: CÀO NỘI DUNG -> UPDATE STATUS 'scraped'
+    print("\n[3/4] Scraping Content...")
+    with metrics.stage("scrape"):
+        scraped_urls = step3_scrape.scrape_articles()
+    metrics.set("articles_scraped", len(scraped_urls or []))
+    if not scraped_urls:
+        print("ℹ️ Không cào thêm được bài nào, chỉ phân tích bài tồn đọng.")
+
+    # BƯỚC 4: TỔNG HỢP BÁO CÁO -> UPDATE STATUS 'analyzed' & INSERT INSIGHTS
+    print("\n[4/4] Writing Report...")
+    with metrics.stage("analyze"):
+        daily_insight, analyzed_count = step4_report.generate_report(insight)
+    metrics.set("articles_analyzed", analyzed_count)
+    return daily_insight, analyzed_count
+
+def run(metrics):
     print("🚀 BẮT ĐẦU QUY TRÌNH TỔNG HỢP TIN SÁNG (DB-DRIVEN) 🚀")
     if config.TEST_MODE:
         print("⚠️ ĐANG CHẠY CHẾ ĐỘ TEST")
 
     # BƯỚC 1: LẤY RSS -> DB
     print("\n[1/4] Fetching RSS...")
-    total, new_count = step1_fetch.fetch_rss()
+    with metrics.stage("fetch"):
+        total, new_count = step1_fetch.fetch_rss()
+    metrics.set("articles_new", new_count)
     
-    # Kiểm tra xem có bài nào status 'fetched' đang chờ xử lý không
+    # Kiểm tra xem có bài nào đang chờ lọc / cào / phân tích không (kể cả bài lỗi từ lần chạy trước)
     pending_count = 0
     from database_manager import get_db
+    from work_queue import count_pending
     with get_db() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT count(*) FROM articles WHERE status = 'fetched' AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'")
-            pending_count = cur.fetchone()[0]
+            pending_count = count_pending(cur)
 
     if new_count == 0 and pending_count == 0 and not config.TEST_MODE:
         print("☕ Không có tin nào mới và không có tin chờ xử lý. Nghỉ ngơi thôi!")
@@ -29,28 +82,25 @@ def main():
     if pending_count > 0:
         print(f"🔄 Tìm thấy {pending_count} tin đang chờ xử lý từ trước.")
 
-    # BƯỚC 2: LỌC TIN (GEMINI) -> UPDATE STATUS 'filtered_in'
-    print("\n[2/4] Filtering News...")
-    selected_urls = step2_filter.filter_news()
-    if not selected_urls:
-        print("❌ Không có bài báo nào được chọn sau khi lọc.")
-        return
-
-    # BƯỚC 3: CÀO NỘI DUNG -> UPDATE STATUS 'scraped'
-    print("\n[3/4] Scraping Content...")
-    scraped_urls = step3_scrape.scrape_articles()
-    if not scraped_urls:
-        print("❌ Không có bài báo nào cào được nội dung.")
-        return
-
-    # BƯỚC 4: TỔNG HỢP BÁO CÁO -> UPDATE STATUS 'analyzed' & INSERT INSIGHTS
-    print("\n[4/4] Writing Report...")
-    daily_insight, analyzed_count = step4_report.generate_report()
+    if config.PIPELINE_MODE == "stream":
+        # BƯỚC 2-4 chạy gối nhau: bài được cào / phân tích ngay khi bước trước commit xong
+        print("\n[2-4/4] Streaming Filter -> Scrape -> Analyze...")
+        with metrics.stage("pipeline"):
+            daily_insight, analyzed_count = pipeline.run_streaming()
+        metrics.set("articles_analyzed", analyzed_count)
+    else:
+        daily_insight, analyzed_count = run_stages(metrics)
 
     if daily_insight:
         print("\n🔔 Sending Telegram notification...")
-        msg = notifier.format_daily_insight_message(daily_insight, analyzed_count)
-        notifier.send_telegram_message(msg)
+        with metrics.stage("notify"):
+            msg = notifier.format_daily_insight_message(daily_insight, analyzed_count)
+            notifier.send_telegram_message(msg)
+
+    get_prompt_stats().report()
+    stats = cache_stats()
+    if stats:
+        print(f"\n💾 AI cache: {stats['hits']} hit / {stats['misses']} miss ({stats['hit_rate']:.0%})")
 
     print("\n🎉 HOÀN THÀNH NHIỆM VỤ!")
 
@@ -1,9 +1,17 @@
 import os
+import time
+import atexit
+import threading
+from collections import Counter
 import psycopg2
+import psycopg2.pool
+import psycopg2.extensions
+from psycopg2.extras import execute_values
 import paramiko
 from sshtunnel import SSHTunnelForwarder
 from dotenv import load_dotenv
 import config
+from metrics import get_metrics
 
 # Load environment variables
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -11,66 +19,330 @@ load_dotenv(os.path.join(BASE_DIR, ".env")) # Load root .env if exists
 load_dotenv(os.path.join(BASE_DIR, "infrastructure/postgres/.env"))
 load_dotenv(os.path.join(BASE_DIR, "infrastructure/ssh/.env"))
 
+# Pool + Tunnel dùng chung cho toàn bộ process (mọi step, mọi thread)
+_tunnel = None
+_pool = None
+_pool_slots = None      # Semaphore để getconn() chờ thay vì ném PoolError khi hết connection
+_last_used = {}         # id(conn) -> thời điểm trả về pool lần cuối (để quyết định có cần ping không)
+_in_use = Counter()     # pool -> số connection đang giao cho caller
+_retired_pools = set()  # Pool cũ bị thay khi tunnel kết nối lại, đóng hẳn khi caller trả hết connection
+_pool_lock = threading.RLock()
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor ghi lại số lần / thời gian round trip tới DB (mỗi execute, kể cả từng trang của execute_values)."""
+    def execute(self, query, vars=None):
+        start = time.monotonic()
+        try:
+            return super().execute(query, vars)
+        finally:
+            get_metrics().observe("db_query_seconds", time.monotonic() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.monotonic()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            get_metrics().observe("db_query_seconds", time.monotonic() - start)
+
+class TimedConnection(psycopg2.extensions.connection):
+    """Connection dùng TimedCursor mặc định và đo thời gian commit."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = TimedCursor
+
+    def commit(self):
+        start = time.monotonic()
+        try:
+            return super().commit()
+        finally:
+            get_metrics().observe("db_commit_seconds", time.monotonic() - start)
+
 class DatabaseManager:
+    """
+    Context manager lấy 1 connection từ pool dùng chung.
+    Mỗi `with get_db() as conn` nhận 1 connection riêng, nên các worker thread
+    có thể ghi DB song song. Phần chưa commit sẽ bị rollback khi trả connection.
+    """
     def __init__(self):
         self.tunnel = None
         self.conn = None
-        
+        self._pool = None
+
         # Database configs
         self.db_name = os.getenv("POSTGRES_DB")
         self.db_user = os.getenv("POSTGRES_USER")
         self.db_pass = os.getenv("POSTGRES_PASSWORD")
         self.db_host = os.getenv("DB_HOST", "localhost")
         self.db_port = int(os.getenv("DB_PORT", 5432))
-        
+
         # SSH configs (only used if tunnel is enabled)
         self.ssh_host = os.getenv("SSH_HOST")
         self.ssh_user = os.getenv("SSH_USER")
         self.ssh_pass = os.getenv("SSH_PASSWORD")
         self.proxy_cmd = os.getenv("PROXY_COMMAND")
 
-    def __enter__(self):
-        # Quyết định kết nối trực tiếp hay qua Tunnel
-        # Ở VPS, config.USE_SSH_TUNNEL phải là False
-        if config.USE_SSH_TUNNEL:
-            print(f"🌉 [LOCAL MODE] Đang mở SSH Tunnel tới {self.ssh_host}...")
-            proxy = paramiko.ProxyCommand(self.proxy_cmd.replace('%h', self.ssh_host))
-            
-            self.tunnel = SSHTunnelForwarder(
-                (self.ssh_host, 22),
-                ssh_username=self.ssh_user,
-                ssh_password=self.ssh_pass,
-                ssh_proxy=proxy,
-                remote_bind_address=('localhost', 5432),
-                local_bind_address=('127.0.0.1', 0) # Use dynamic port
-            )
-            self.tunnel.start()
-            
-            connect_host = '127.0.0.1'
-            connect_port = self.tunnel.local_bind_port
-            print(f"✅ Tunnel opened at {connect_host}:{connect_port}")
-        else:
-            print(f"🚀 [SERVER MODE] Kết nối trực tiếp tới Database ({self.db_host}:{self.db_port})...")
-            connect_host = self.db_host
-            connect_port = self.db_port
-
-        # Kết nối tới Postgres
-        self.conn = psycopg2.connect(
-            dbname=self.db_name,
-            user=self.db_user,
-            password=self.db_pass,
-            host=connect_host,
-            port=connect_port,
-            connect_timeout=10
+    def _open_tunnel(self):
+        print(f"🌉 [LOCAL MODE] Đang mở SSH Tunnel tới {self.ssh_host}...")
+        proxy = paramiko.ProxyCommand(self.proxy_cmd.replace('%h', self.ssh_host))
+
+        tunnel = SSHTunnelForwarder(
+            (self.ssh_host, 22),
+            ssh_username=self.ssh_user,
+            ssh_password=self.ssh_pass,
+            ssh_proxy=proxy,
+            remote_bind_address=('localhost', 5432),
+            local_bind_address=('127.0.0.1', 0) # Use dynamic port
         )
-        return self.conn
+        tunnel.start()
+        print(f"✅ Tunnel opened at 127.0.0.1:{tunnel.local_bind_port}")
+        return tunnel
+
+    def _ensure_pool(self):
+        """Tạo (hoặc tạo lại khi tunnel chết) pool dùng chung. Trả về (pool, slots)."""
+        global _tunnel, _pool, _pool_slots
+        with _pool_lock:
+            # Quyết định kết nối trực tiếp hay qua Tunnel
+            # Ở VPS, config.USE_SSH_TUNNEL phải là False
+            if config.USE_SSH_TUNNEL and _tunnel is not None and not _tunnel.is_active:
+                print("⚠️ SSH Tunnel bị ngắt, đang kết nối lại...")
+                _retire_pool_locked()
+
+            if _pool is not None:
+                return _pool, _pool_slots
+
+            if config.USE_SSH_TUNNEL:
+                _tunnel = self._open_tunnel()
+                connect_host = '127.0.0.1'
+                connect_port = _tunnel.local_bind_port
+            else:
+                print(f"🚀 [SERVER MODE] Kết nối trực tiếp tới Database ({self.db_host}:{self.db_port})...")
+                connect_host = self.db_host
+                connect_port = self.db_port
+
+            # Kết nối tới Postgres
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                config.DB_POOL_MIN_CONN,
+                config.DB_POOL_MAX_CONN,
+                dbname=self.db_name,
+                user=self.db_user,
+                password=self.db_pass,
+                host=connect_host,
+                port=connect_port,
+                connect_timeout=10,
+                connection_factory=TimedConnection
+            )
+            _pool_slots = threading.BoundedSemaphore(config.DB_POOL_MAX_CONN)
+            return _pool, _pool_slots
+
+    def _is_healthy(self, conn):
+        """Kiểm tra connection trước khi giao cho caller (chỉ ping nếu đã idle lâu)."""
+        if conn.closed:
+            return False
+        last_used = _last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < config.DB_POOL_PING_AFTER:
+            # Connection mới tạo hoặc vừa được dùng gần đây
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def __enter__(self):
+        last_error = None
+        # Mỗi lần thử bỏ đi tối đa 1 connection hỏng, nên số lần thử đủ để quét hết pool
+        for _ in range(config.DB_POOL_MAX_CONN + 1):
+            pool, slots = self._ensure_pool()
+            slots.acquire()
+            try:
+                conn = pool.getconn()
+            except Exception as e:
+                slots.release()
+                last_error = e
+                continue
+
+            if self._is_healthy(conn):
+                with _pool_lock:
+                    current = pool is _pool
+                    if current:
+                        _in_use[pool] += 1
+                if current:
+                    self._pool, self._slots = pool, slots
+                    self.conn = conn
+                    self.tunnel = _tunnel
+                    return self.conn
+                # Pool vừa bị thay (tunnel kết nối lại) trong lúc lấy connection -> lấy từ pool mới
+                _release(pool, conn, close=True)
+                slots.release()
+                continue
+
+            # Connection hỏng -> bỏ đi, thử lại (pool/tunnel sẽ được tạo lại nếu cần)
+            print("⚠️ Connection DB không còn sống, đang kết nối lại...")
+            _last_used.pop(id(conn), None)
+            _release(pool, conn, close=True)
+            slots.release()
+            last_error = psycopg2.OperationalError("stale connection")
+
+        raise last_error
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.conn:
-            self.conn.close()
-        if self.tunnel:
-            self.tunnel.stop()
-            print("🔌 SSH Tunnel closed.")
+            close = self.conn.closed != 0
+            if not close:
+                try:
+                    # Giữ nguyên hành vi cũ: phần chưa commit không được lưu
+                    self.conn.rollback()
+                except psycopg2.Error:
+                    close = True
+            if not close:
+                _last_used[id(self.conn)] = time.monotonic()
+            else:
+                _last_used.pop(id(self.conn), None)
+            _release(self._pool, self.conn, close=close)
+            _checkin(self._pool)
+            self._slots.release()
+            self.conn = None
+
+class BatchWriter:
+    """
+    Gom các dòng kết quả và ghi theo lô bằng execute_values, commit sau mỗi lô.
+    Lô được ghi khi đủ max_rows dòng hoặc đã quá max_interval giây kể từ lần ghi trước,
+    và luôn được ghi nốt khi thoát khỏi `with` (kể cả khi có exception).
+    on_flush(rows) được gọi sau khi lô đã commit (VD: chuyển tiếp sang bước sau của pipeline).
+    returning=True: SQL có `RETURNING <cột đầu của dòng>`, chỉ các dòng được trả về mới tính là đã ghi
+    (VD: câu UPDATE có điều kiện, dòng không còn khớp bị bỏ qua và đếm vào `skipped`).
+    Lỗi DB: thử lại 1 lần, vẫn lỗi thì giữ lại các dòng (ghi cùng lô sau) rồi ném lỗi cho caller log.
+    """
+    def __init__(self, conn, sql, template=None, max_rows=50, max_interval=5.0, on_flush=None, returning=False):
+        self.conn = conn
+        self.sql = sql
+        self.template = template
+        self.max_rows = max_rows
+        self.max_interval = max_interval
+        self.on_flush = on_flush
+        self.returning = returning
+        self.written = 0
+        self.skipped = 0
+        self._rows = []
+        self._last_flush = time.monotonic()
+
+    @property
+    def pending(self):
+        """Số dòng chưa ghi được (kể cả các dòng giữ lại sau lỗi)."""
+        return len(self._rows)
+
+    def add(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.max_rows:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        if self._rows and time.monotonic() - self._last_flush >= self.max_interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        for attempt in range(2):
+            try:
+                with self.conn.cursor() as cur:
+                    returned = execute_values(cur, self.sql, rows, template=self.template, page_size=len(rows), fetch=self.returning)
+                self.conn.commit()
+                break
+            except Exception:
+                try:
+                    self.conn.rollback()
+                except psycopg2.Error:
+                    pass # Connection đã đóng: lần thử lại cũng lỗi, các dòng được giữ lại bên dưới
+                if attempt:
+                    self._rows = rows + self._rows
+                    raise
+                get_metrics().inc("db_batch_retries")
+        if self.returning:
+            kept = {r[0] for r in returned}
+            self.skipped += sum(1 for row in rows if row[0] not in kept)
+            rows = [row for row in rows if row[0] in kept]
+        self.written += len(rows)
+        if self.on_flush is not None:
+            self.on_flush(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.flush()
+        except Exception:
+            if exc_type is None:
+                raise
+            # Không che mất lỗi gốc đang được ném ra
+
+def _release(pool, conn, close=False):
+    if pool.closed:
+        # Pool đã đóng (process kết thúc) -> đóng connection
+        if not conn.closed:
+            conn.close()
+        return
+    # Pool cũ (tunnel đã kết nối lại) -> đóng connection thay vì trả lại pool
+    pool.putconn(conn, close=close or pool in _retired_pools)
+
+def _checkin(pool):
+    """Caller đã trả connection: pool cũ không còn connection nào đang dùng thì đóng hẳn."""
+    with _pool_lock:
+        _in_use[pool] -= 1
+        if pool in _retired_pools and _in_use[pool] <= 0:
+            _retired_pools.discard(pool)
+            del _in_use[pool]
+            pool.closeall()
+
+def _retire_pool_locked():
+    """
+    Tunnel kết nối lại: bỏ pool hiện tại để _ensure_pool tạo pool mới.
+    Không closeall() ngay: thread khác có thể đang giữ connection của pool cũ (đang chạy query / giữa transaction).
+    Connection đang dùng được đóng khi caller trả về (_release), trả hết thì đóng pool (_checkin).
+    """
+    global _pool, _pool_slots
+    if _pool is not None:
+        if _in_use[_pool] > 0:
+            _retired_pools.add(_pool)
+        else:
+            _in_use.pop(_pool, None)
+            _pool.closeall()
+        _pool = None
+        _pool_slots = None
+        _last_used.clear()
+    _close_tunnel_locked()
+
+def _close_pool_locked():
+    global _pool, _pool_slots
+    for pool in list(_retired_pools) + ([_pool] if _pool is not None else []):
+        pool.closeall()
+    _retired_pools.clear()
+    _in_use.clear()
+    _pool = None
+    _pool_slots = None
+    _last_used.clear()
+    _close_tunnel_locked()
+
+def _close_tunnel_locked():
+    global _tunnel
+    if _tunnel is not None:
+        _tunnel.stop()
+        _tunnel = None
+        print("🔌 SSH Tunnel closed.")
+
+def close_pool():
+    """Đóng toàn bộ connection và SSH Tunnel (tự động gọi khi process kết thúc)."""
+    with _pool_lock:
+        _close_pool_locked()
+
+atexit.register(close_pool)
 
 def get_db():
     return DatabaseManager()
@@ -0,0 +1,248 @@
+import re
+import zlib
+import random
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from psycopg2.extras import execute_values
+import config
+
+# Tham số MinHash/LSH: 16 band x 4 hàng -> ngưỡng ứng viên xấp xỉ Jaccard 0.5
+NUM_PERM = 64
+BANDS = 16
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1234) # Seed cố định để chữ ký ổn định giữa các lần chạy
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+NUMBER_RE = re.compile(r"\d+")
+
+def normalize_text(text):
+    return " ".join(TOKEN_RE.findall(unicodedata.normalize("NFC", text or "").lower()))
+
+def title_shingles(title):
+    """Tiêu đề ngắn, mỗi báo viết khác nhau đôi chút -> dùng character 3-gram."""
+    text = normalize_text(title)
+    return {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+
+def title_numbers_compatible(title_a, title_b):
+    """
+    Tiêu đề gần giống nhau nhưng khác số (ngày, giá, tỷ lệ) thường là 2 tin khác nhau,
+    VD: "Giá vàng hôm nay 17/10" và "Giá vàng hôm nay 18/10".
+    Chỉ coi là cùng tin khi 1 bên không có số hoặc số của bên này nằm trọn trong bên kia.
+    """
+    numbers_a = set(NUMBER_RE.findall(title_a or ""))
+    numbers_b = set(NUMBER_RE.findall(title_b or ""))
+    return not numbers_a or not numbers_b or numbers_a <= numbers_b or numbers_b <= numbers_a
+
+def content_shingles(content):
+    """Nội dung bài: word 5-gram (bài đăng lại gần như giữ nguyên câu chữ)."""
+    tokens = normalize_text(content).split()
+    if len(tokens) < 5:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + 5]) for i in range(len(tokens) - 4)}
+
+def minhash(shingles):
+    hashes = [zlib.crc32(sh.encode("utf-8")) for sh in shingles] or [0]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+def estimated_jaccard(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+class MinHashIndex:
+    """LSH index: chỉ so sánh các cặp trùng ít nhất 1 band thay vì so từng cặp."""
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.rows = NUM_PERM // BANDS
+        self.signatures = {}
+        self.buckets = defaultdict(list)
+
+    def _band_keys(self, signature):
+        for band in range(BANDS):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def query(self, signature):
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+        return [key for key in candidates if estimated_jaccard(signature, self.signatures[key]) >= self.threshold]
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self.buckets[band_key].append(key)
+
+def assign_clusters(items, shingle_fn, threshold, compatible=None):
+    """
+    Gom các bài gần trùng thành cụm theo complete linkage: bài chỉ vào cụm khi giống MỌI bài trong cụm
+    (không nối chuỗi A~B, B~C thành 1 cụm, VD: tin "Giá vàng hôm nay" của nhiều ngày liên tiếp).
+    items: [(key, text, priority)] - priority nhỏ hơn được ưu tiên làm đại diện (xét trước, mở cụm).
+    compatible(text_a, text_b): điều kiện thêm ngoài độ giống (VD: title_numbers_compatible).
+    Output: {key: representative_key} cho các bài thuộc cụm có từ 2 bài trở lên.
+    """
+    index = MinHashIndex(threshold)
+    texts = {}
+    cluster_of = {}
+    clusters = defaultdict(list) # Bài đầu tiên của cụm (priority nhỏ nhất) -> các bài trong cụm
+    for key, text, priority in sorted(items, key=lambda item: item[2]):
+        texts[key] = text
+        signature = minhash(shingle_fn(text))
+        best, best_score = None, 0
+        for rep in {cluster_of[other] for other in index.query(signature)}:
+            members = clusters[rep]
+            score = min(estimated_jaccard(signature, index.signatures[m]) for m in members)
+            if score < threshold or score <= best_score:
+                continue
+            if compatible is not None and not all(compatible(text, texts[m]) for m in members):
+                continue
+            best, best_score = rep, score
+        cluster_of[key] = best if best is not None else key
+        clusters[cluster_of[key]].append(key)
+        index.add(key, signature)
+
+    assignment = {}
+    for rep, members in clusters.items():
+        if len(members) < 2:
+            continue
+        for key in members:
+            assignment[key] = rep
+    return assignment
+
+SAVE_CLUSTERS_SQL = """
+    UPDATE articles
+    SET cluster_id = v.cluster_id,
+        status = CASE WHEN v.is_duplicate THEN 'duplicate' ELSE articles.status END,
+        updated_at = NOW()
+    FROM (VALUES %s) AS v(url, cluster_id, is_duplicate)
+    WHERE articles.url = v.url
+"""
+
+def cluster_updates(rows, pending_status, assignment):
+    """
+    rows: [(url, status, cluster_id)] -> [(url, cluster_id, is_duplicate)] cần ghi.
+    Chỉ ghi cho các bài đang chờ xử lý (pending_status) và đại diện của cụm chúng;
+    các bài cũ khác giữ nguyên cụm / trạng thái.
+    Cụm mới dùng cluster_id sẵn có của đại diện (nếu có), nếu không thì lấy URL đại diện
+    và ghi cluster_id đó cho cả đại diện (để tra cụm từ bài nào cũng ra).
+    """
+    existing_cluster = {url: cluster_id for url, _, cluster_id in rows if cluster_id}
+    updates = []
+    reps = set()
+    for url, status, _ in rows:
+        if status != pending_status or url not in assignment:
+            continue
+        rep = assignment[url]
+        updates.append((url, existing_cluster.get(rep, rep), url != rep))
+        reps.add(rep)
+    updated = {url for url, _, _ in updates}
+    # Đại diện đã xử lý xong (bài cũ) chưa có cluster_id: chỉ ghi cluster_id, giữ nguyên status
+    updates.extend((rep, rep, False) for rep in reps if rep not in updated and rep not in existing_cluster)
+    return updates
+
+def _save_new_members(cur, rows, pending_status, assignment):
+    updates = cluster_updates(rows, pending_status, assignment)
+    if updates:
+        execute_values(cur, SAVE_CLUSTERS_SQL, updates, template="(%s, %s, %s::boolean)", page_size=len(updates))
+    return sum(1 for _, _, is_duplicate in updates if is_duplicate)
+
+# Đại diện của cụm lỗi hẳn ('scrape_failed' / 'analysis_failed') và cụm không còn bài nào đang xử lý / đã xong
+# -> bài 'duplicate' tốt nhất (điểm lọc cao, đăng sớm - cùng thứ tự với _priority) thay làm đại diện.
+# Bài đã có nội dung (trùng theo nội dung) quay lại 'scraped', còn lại quay lại 'filtered_in'.
+# Bỏ lease cũ để lượt giữ bài tiếp theo (của bất kỳ worker nào) lấy được ngay.
+PROMOTE_DUPLICATES_SQL = """
+    WITH failed AS (
+        SELECT DISTINCT cluster_id FROM articles
+        WHERE url = ANY(%s) AND status IN ('scrape_failed', 'analysis_failed') AND cluster_id IS NOT NULL
+    ),
+    orphaned AS (
+        SELECT cluster_id FROM failed
+        WHERE NOT EXISTS (
+            SELECT 1 FROM articles a
+            WHERE a.cluster_id = failed.cluster_id AND a.status IN ('filtered_in', 'scraped', 'analyzed')
+        )
+    ),
+    promoted AS (
+        SELECT DISTINCT ON (a.cluster_id) a.url
+        FROM articles a JOIN orphaned USING (cluster_id)
+        WHERE a.status = 'duplicate'
+        ORDER BY a.cluster_id, a.filter_score DESC NULLS LAST, a.published_date NULLS LAST, a.url
+    )
+    UPDATE articles
+    SET status = CASE WHEN EXISTS (SELECT 1 FROM article_content c WHERE c.url = articles.url)
+                      THEN 'scraped' ELSE 'filtered_in' END,
+        claimed_by = NULL,
+        claim_expires_at = NULL,
+        updated_at = NOW()
+    FROM promoted
+    WHERE articles.url = promoted.url
+    RETURNING articles.url
+"""
+
+def promote_duplicates(cur, failed_urls):
+    """
+    Gọi sau khi ghi lỗi cào / phân tích: cụm có đại diện vừa lỗi hẳn thì đưa bài trùng tiếp theo lên thay,
+    để tin đó không bị bỏ mất. Output: số bài được đưa lại vào hàng đợi.
+    """
+    if not failed_urls:
+        return 0
+    cur.execute(PROMOTE_DUPLICATES_SQL, (list(failed_urls),))
+    return cur.rowcount
+
+def promote_on_failure(conn):
+    """on_flush cho BatchWriter ghi lỗi (lô đã commit): đưa bài trùng lên thay đại diện lỗi hẳn rồi commit."""
+    def on_flush(rows):
+        with conn.cursor() as cur:
+            promoted = promote_duplicates(cur, [row[0] for row in rows])
+        conn.commit()
+        if promoted:
+            print(f"🧬 {promoted} cụm tin có đại diện lỗi: đưa bài trùng tiếp theo vào hàng đợi thay thế.")
+    return on_flush
+
+def _priority(status, done_statuses, filter_score, published_date):
+    # Bài đã xử lý (đã tốn chi phí cào / phân tích) luôn được làm đại diện
+    return (
+        0 if status in done_statuses else 1,
+        -(filter_score or 0),
+        published_date or datetime.max,
+    )
+
+def cluster_before_scrape(cur):
+    """
+    Gom cụm theo tiêu đề các bài 'filtered_in' cùng các bài đã cào / phân tích gần đây.
+    Bài không phải đại diện chuyển sang 'duplicate' để không bị cào và phân tích lại.
+    Output: số bài bị đánh dấu trùng.
+    """
+    cur.execute("""
+        SELECT url, title, status, cluster_id, filter_score, published_date
+        FROM articles
+        WHERE status IN ('filtered_in', 'scraped', 'analyzed')
+        AND published_date >= (NOW() AT TIME ZONE 'UTC') - make_interval(hours => %s)
+    """, (config.DEDUP_WINDOW_HOURS,))
+    rows = cur.fetchall()
+    items = [
+        (url, title, _priority(status, ('scraped', 'analyzed'), score, published))
+        for url, title, status, cluster_id, score, published in rows
+    ]
+    assignment = assign_clusters(items, title_shingles, config.DEDUP_TITLE_THRESHOLD, compatible=title_numbers_compatible)
+    return _save_new_members(cur, [(r[0], r[2], r[3]) for r in rows], 'filtered_in', assignment)
+
+def cluster_before_analysis(cur):
+    """
+    Gom cụm theo nội dung các bài 'scraped' cùng các bài đã phân tích gần đây.
+    Output: số bài bị đánh dấu trùng.
+    """
+    cur.execute("""
+        SELECT url, LEFT(content, %s), status, cluster_id, filter_score, published_date
+        FROM articles
+        JOIN article_content USING (url)
+        WHERE status IN ('scraped', 'analyzed')
+        AND content IS NOT NULL
+        AND published_date >= (NOW() AT TIME ZONE 'UTC') - make_interval(hours => %s)
+    """, (config.DEDUP_CONTENT_CHARS, config.DEDUP_WINDOW_HOURS))
+    rows = cur.fetchall()
+    items = [
+        (url, content, _priority(status, ('analyzed',), score, published))
+        for url, content, status, cluster_id, score, published in rows
+    ]
+    assignment = assign_clusters(items, content_shingles, config.DEDUP_CONTENT_THRESHOLD)
+    return _save_new_members(cur, [(r[0], r[2], r[3]) for r in rows], 'scraped', assignment)
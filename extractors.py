@@ -0,0 +1,162 @@
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+import lxml.html
+from newspaper import Article
+import config
+
+class SiteExtractor:
+    """
+    Bóc tách nhanh theo XPath cho 1 trang báo đã biết cấu trúc.
+    lead: đoạn sapo/mô tả (lấy phần tử đầu tiên khớp)
+    body: danh sách XPath các đoạn văn, dùng XPath đầu tiên có kết quả
+    """
+    def __init__(self, lead=(), body=()):
+        self.lead = lead
+        self.body = body
+
+    def extract(self, html):
+        tree = lxml.html.fromstring(html)
+        # Bỏ script/style/chú thích ảnh nhúng trong thân bài
+        for node in tree.xpath("//script|//style|//noscript|//figure"):
+            node.drop_tree()
+
+        parts = []
+        for xpath in self.lead:
+            nodes = tree.xpath(xpath)
+            if nodes:
+                parts.append(_clean(nodes[0].text_content()))
+                break
+
+        for xpath in self.body:
+            paragraphs = [_clean(node.text_content()) for node in tree.xpath(xpath)]
+            paragraphs = [p for p in paragraphs if p]
+            if paragraphs:
+                parts.extend(paragraphs)
+                break
+
+        return "\n\n".join(p for p in parts if p)
+
+def _clean(text):
+    return " ".join((text or "").split())
+
+# Registry theo domain (khớp cả subdomain như www., m.)
+SITE_EXTRACTORS = {
+    "cafef.vn": SiteExtractor(
+        lead=["//h2[contains(@class,'sapo')]"],
+        body=["//div[@data-role='content']//p", "//div[contains(@class,'detail-content')]//p", "//div[@id='mainContent']//p"],
+    ),
+    "cafebiz.vn": SiteExtractor(
+        lead=["//h2[contains(@class,'sapo')]"],
+        body=["//div[contains(@class,'detail-content')]//p", "//div[@data-role='content']//p"],
+    ),
+    "vnexpress.net": SiteExtractor(
+        lead=["//p[contains(@class,'description')]"],
+        body=["//article[contains(@class,'fck_detail')]//p[contains(@class,'Normal')]", "//article[contains(@class,'fck_detail')]//p"],
+    ),
+    "tuoitre.vn": SiteExtractor(
+        lead=["//h2[contains(@class,'detail-sapo')]"],
+        body=["//div[contains(@class,'detail-content')]//p"],
+    ),
+    "nytimes.com": SiteExtractor(
+        body=["//section[@name='articleBody']//p"],
+    ),
+}
+
+def find_site_extractor(url):
+    host = urlparse(url).netloc.lower().split(":")[0]
+    for domain, extractor in SITE_EXTRACTORS.items():
+        if host == domain or host.endswith("." + domain):
+            return extractor
+    return None
+
+def extract_generic(url, html):
+    """Fallback: newspaper3k (chậm hơn), chọn stopwords tiếng Việt cho báo .vn để không bị cắt cụt."""
+    host = urlparse(url).netloc.lower().split(":")[0]
+    article = Article(url, language="vi" if host.endswith(".vn") else "en")
+    article.set_html(html)
+    article.parse()
+    return article.text
+
+def extract_content(url, html):
+    """
+    Bóc tách nội dung bài báo từ HTML (CPU-bound, chạy trong process con).
+    Ưu tiên extractor theo trang, chỉ dùng newspaper khi không có hoặc kết quả quá ngắn.
+    Output: (url, content, error)
+    """
+    try:
+        content = None
+        extractor = find_site_extractor(url)
+        if extractor is not None:
+            try:
+                content = extractor.extract(html)
+            except Exception:
+                # VD: HTML có khai báo encoding mà lxml không nhận dạng dưới dạng str -> để newspaper xử lý
+                content = None
+
+        if not content or len(content) < config.MIN_ARTICLE_LENGTH:
+            content = extract_generic(url, html)
+
+        if not content or len(content) < config.MIN_ARTICLE_LENGTH:
+            return (url, None, f"Content too short ({len(content) if content else 0} chars)")
+
+        return (url, content, None)
+
+    except Exception as e:
+        return (url, None, str(e))
+
+class ExtractorPool:
+    """
+    Process pool chạy extract_content.
+    - Process con tạo bằng forkserver (spawn nếu không có), không fork thẳng từ process đang chạy
+      nhiều thread (thread tải HTML, SSH tunnel): process con fork ra có thể kẹt ở lock bị sao chép lúc đang bị giữ.
+    - 1 process con chết đột ngột (VD: hết RAM vì HTML bất thường) làm hỏng cả pool (BrokenProcessPool):
+      các bài đang bóc tách trả về lỗi (được cào lại lần sau) và pool được tạo lại cho các bài tiếp theo.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            # Process con fork từ forkserver đã import sẵn lxml / newspaper
+            self._context.set_forkserver_preload([__name__])
+        self._generation = 0
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+
+    def _restart(self, generation):
+        if generation != self._generation:
+            return # Pool đã được tạo lại bởi 1 future khác của cùng pool hỏng
+        print("⚠️ Process bóc tách bị dừng đột ngột, tạo lại process pool...")
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._generation += 1
+        self._pool = self._new_pool()
+
+    def submit(self, url, html):
+        try:
+            future = self._pool.submit(extract_content, url, html)
+        except BrokenProcessPool:
+            self._restart(self._generation)
+            future = self._pool.submit(extract_content, url, html)
+        future.pool_generation = self._generation
+        return future
+
+    def result(self, future, url):
+        """Kết quả (url, content, error) của future từ submit()."""
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._restart(future.pool_generation)
+            return (url, None, "Process bóc tách bị dừng đột ngột")
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
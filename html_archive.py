@@ -0,0 +1,234 @@
+import os
+import re
+import time
+import glob
+import queue
+import zlib
+import fcntl
+import sqlite3
+import hashlib
+import threading
+import config
+
+try:
+    import zstandard
+except ImportError: # Chưa cài zstandard -> vẫn chạy được với zlib (codec lưu theo từng blob)
+    zstandard = None
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+
+# Dấu hiệu trang chặn bot / captcha (chỉ xét ở trang nhỏ: bài thật có thể nhúng reCAPTCHA ở form bình luận)
+CHALLENGE_RE = re.compile(r"captcha|cf-challenge|challenge-platform|<title>\s*(just a moment|attention required)", re.IGNORECASE)
+
+def is_archivable(html):
+    """
+    Lưu mọi trang HTML 2xx, kể cả trang extractor hiện tại bóc tách lỗi (để sửa extractor rồi bóc tách lại),
+    chỉ bỏ các trang chắc chắn hỏng: quá nhỏ (bị cắt cụt, trang lỗi) hoặc trang captcha.
+    """
+    if not html or len(html) < config.HTML_ARCHIVE_MIN_BYTES:
+        return False
+    return not (len(html) < config.HTML_ARCHIVE_CHALLENGE_MAX_BYTES and CHALLENGE_RE.search(html))
+
+class HtmlArchive:
+    """
+    Kho lưu HTML thô đã tải, định danh theo nội dung (sha256):
+    - segment-NNNNNN.dat: file chỉ ghi nối (append-only) chứa các blob nén zstd
+    - index.sqlite3: url -> digest, digest -> (segment, offset, length, codec)
+    HTML giống nhau chỉ lưu 1 lần. Cho phép bóc tách lại hoàn toàn offline.
+    """
+    def __init__(self, root=None, segment_bytes=None):
+        self.root = root or config.HTML_ARCHIVE_DIR
+        self.segment_bytes = segment_bytes or config.HTML_ARCHIVE_SEGMENT_BYTES
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), timeout=30, check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                raw_size INTEGER NOT NULL,
+                codec TEXT NOT NULL
+            )
+        """)
+        self._index.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._index.execute("CREATE INDEX IF NOT EXISTS idx_urls_fetched_at ON urls(fetched_at)")
+        self._index.commit()
+
+        if zstandard is not None:
+            self._codec = CODEC_ZSTD
+            self._compressor = zstandard.ZstdCompressor(level=config.HTML_ARCHIVE_ZSTD_LEVEL)
+            self._decompressor = zstandard.ZstdDecompressor()
+        else:
+            self._codec = CODEC_ZLIB
+
+    def _compress(self, raw):
+        if self._codec == CODEC_ZSTD:
+            return self._compressor.compress(raw)
+        return zlib.compress(raw, 6)
+
+    def _decompress(self, data, codec):
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Blob nén bằng zstd nhưng chưa cài thư viện zstandard")
+            return self._decompressor.decompress(data)
+        return zlib.decompress(data)
+
+    def _current_segment(self):
+        segments = sorted(glob.glob(os.path.join(self.root, "segment-*.dat")))
+        if segments and os.path.getsize(segments[-1]) < self.segment_bytes:
+            return segments[-1]
+        number = int(os.path.basename(segments[-1])[8:14]) + 1 if segments else 1
+        return os.path.join(self.root, f"segment-{number:06d}.dat")
+
+    def _append(self, blobs):
+        """
+        Ghi nối các blob vào segment hiện tại (khóa file để nhiều process ghi cùng lúc vẫn an toàn),
+        1 lần fsync cho cả lô. Output: (segment, [offset của từng blob])
+        """
+        path = self._current_segment()
+        offsets = []
+        with open(path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                for data in blobs:
+                    offsets.append(offset)
+                    f.write(data)
+                    offset += len(data)
+                f.flush()
+                # Blob phải nằm trên đĩa trước khi index (commit ngay sau) trỏ tới nó
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return os.path.basename(path), offsets
+
+    def put(self, url, html):
+        """Lưu HTML của url. Output: digest (sha256 hex)."""
+        return self.put_many([(url, html)])[0]
+
+    def put_many(self, pages):
+        """Lưu HTML của nhiều url: 1 lần ghi segment + fsync, 1 lần commit index. Output: [digest]"""
+        encoded = []
+        for url, html in pages:
+            raw = html.encode("utf-8")
+            encoded.append((url, raw, hashlib.sha256(raw).hexdigest()))
+        with self._lock:
+            new_blobs = {}
+            for _, raw, digest in encoded:
+                if digest in new_blobs:
+                    continue
+                if not self._index.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone():
+                    new_blobs[digest] = (self._compress(raw), len(raw))
+            if new_blobs:
+                # Ghi blob trước rồi mới ghi index: crash giữa chừng chỉ để lại vài byte thừa
+                segment, offsets = self._append([data for data, _ in new_blobs.values()])
+                self._index.executemany(
+                    "INSERT OR IGNORE INTO blobs (digest, segment, offset, length, raw_size, codec) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(digest, segment, offset, len(data), raw_size, self._codec)
+                     for (digest, (data, raw_size)), offset in zip(new_blobs.items(), offsets)],
+                )
+            now = time.time()
+            self._index.executemany(
+                "INSERT OR REPLACE INTO urls (url, digest, fetched_at) VALUES (?, ?, ?)",
+                [(url, digest, now) for url, _, digest in encoded],
+            )
+            self._index.commit()
+        return [digest for _, _, digest in encoded]
+
+    def get_blob(self, digest):
+        with self._lock:
+            row = self._index.execute(
+                "SELECT segment, offset, length, codec FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+        if row is None:
+            return None
+        segment, offset, length, codec = row
+        with open(os.path.join(self.root, segment), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        return self._decompress(data, codec).decode("utf-8")
+
+    def get_html(self, url):
+        """HTML đã lưu của url, None nếu chưa có."""
+        with self._lock:
+            row = self._index.execute("SELECT digest FROM urls WHERE url = ?", (url,)).fetchone()
+        return self.get_blob(row[0]) if row else None
+
+    def iter_urls(self, since=None):
+        """Danh sách url đã lưu (lọc theo thời điểm tải >= since, epoch giây)."""
+        with self._lock:
+            rows = self._index.execute(
+                "SELECT url FROM urls WHERE fetched_at >= ? ORDER BY fetched_at", (since or 0,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def stats(self):
+        with self._lock:
+            urls = self._index.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            blobs, raw_size, stored = self._index.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(length), 0) FROM blobs"
+            ).fetchone()
+        return {"urls": urls, "blobs": blobs, "raw_bytes": raw_size, "stored_bytes": stored}
+
+    def close(self):
+        with self._lock:
+            self._index.close()
+
+class ArchiveWriter:
+    """
+    Ghi HTML vào archive trên thread riêng để thread tải / vòng bóc tách không phải chờ nén + fsync.
+    Gom tối đa HTML_ARCHIVE_WRITE_BATCH trang (hoặc HTML_ARCHIVE_WRITE_INTERVAL giây) mỗi lần ghi.
+    Hàng đợi đầy thì submit() chờ (backpressure). close(): ghi nốt rồi dừng thread.
+    """
+    def __init__(self, archive):
+        self.archive = archive
+        self.written = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=config.HTML_ARCHIVE_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, url, html):
+        self._queue.put((url, html))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + config.HTML_ARCHIVE_WRITE_INTERVAL
+            while len(batch) < config.HTML_ARCHIVE_WRITE_BATCH:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.archive.put_many(batch)
+            self.written += len(batch)
+        except Exception as e:
+            # Archive chỉ là bản lưu phụ: lỗi ghi không được làm dừng bước cào
+            self.errors += len(batch)
+            print(f"⚠️ Không ghi được {len(batch)} trang vào HTML archive: {e}")
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,197 @@
+import hashlib
+import concurrent.futures
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+import config
+from ai_helper import call_ai_cli, discard_cached
+from models import DailyInsight, SectorInsight
+from ai_json import extract_object
+
+# Đổi khi sửa prompt để các partial cũ được tính lại
+PARTIAL_PROMPT_VERSION = "1"
+OTHER_SECTOR = "Khác"
+
+PARTIAL_PROMPT = """
+    Dựa trên {count} bài báo tài chính thuộc nhóm "{group}" sau đây, hãy rút ra các ý chính của nhóm.
+
+    Danh sách bài báo:
+    {articles}
+
+    Yêu cầu Output JSON (không markdown):
+    {{
+        "main_trends": ["Xu hướng chính của nhóm"],
+        "hidden_insights": ["Insight không hiển nhiên rút ra từ các bài trên"],
+        "hot_topics": ["Chủ đề nóng"],
+        "media_steering": "Truyền thông đang lái dư luận theo hướng nào (FUD, FOMO, hay Thận trọng)",
+        "sentiment": "Tâm lý chung của nhóm (Bullish/Bearish/Neutral) và lý do ngắn gọn"
+    }}
+    """
+
+MERGE_PROMPT = """
+    Dựa trên tổng hợp theo từng nhóm ngành của {count} bài báo tài chính sau đây, hãy tổng hợp thành Báo Cáo Chiến Lược Ngày.
+
+    Tổng hợp theo nhóm:
+    {partials}
+
+    Yêu cầu Output JSON (không markdown):
+    {{
+        "date": "{date}",
+        "main_trends": ["Xu hướng chính 1", "Xu hướng chính 2"],
+        "hidden_insights": ["Insight không hiển nhiên mà bạn nhận ra từ dữ liệu trên"],
+        "media_steering_analysis": "Phân tích xem truyền thông đang muốn lái dư luận theo hướng nào (FUD, FOMO, hay Thận trọng).",
+        "hot_topics": ["Chủ đề 1", "Chủ đề 2"],
+        "market_sentiment_overlay": "Nhận định chung về tâm lý thị trường (Bullish/Bearish/Neutral) và lý do."
+    }}
+    """
+
+SAVE_PARTIALS_SQL = """
+    INSERT INTO insight_partials (date, group_key, input_hash, article_count, partial, created_at)
+    VALUES %s
+    ON CONFLICT (date, group_key) DO UPDATE SET
+        input_hash = EXCLUDED.input_hash,
+        article_count = EXCLUDED.article_count,
+        partial = EXCLUDED.partial,
+        created_at = EXCLUDED.created_at
+"""
+
+def load_day_articles(cur):
+    """
+    Toàn bộ bài đã phân tích trong 24h qua (không chỉ các bài của lần chạy này).
+    Sắp theo thời gian đăng: bài mới rơi vào phần cuối của nhóm, các phần trước giữ nguyên (trúng cache insight).
+    """
+    cur.execute("""
+        SELECT url, title, summary, impact_analysis, tags
+        FROM articles
+        JOIN article_analysis USING (url)
+        WHERE status = 'analyzed'
+        AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'
+        ORDER BY published_date, url
+    """)
+    return cur.fetchall()
+
+def group_articles(rows):
+    """
+    Gom bài theo ngành đầu tiên trong tags.sectors; nhóm quá lớn được chia thành
+    nhiều phần INSIGHT_GROUP_MAX_ARTICLES bài (group_key: "Ngành#2").
+    Output: {group_key: [row, ...]}
+    """
+    by_sector = {}
+    for row in rows:
+        tags = row[4] or {}
+        sectors = [s for s in tags.get("sectors") or [] if s]
+        by_sector.setdefault(sectors[0] if sectors else OTHER_SECTOR, []).append(row)
+
+    groups = {}
+    size = config.INSIGHT_GROUP_MAX_ARTICLES
+    for sector, members in by_sector.items():
+        for part, start in enumerate(range(0, len(members), size)):
+            groups[sector if part == 0 else f"{sector}#{part + 1}"] = members[start:start + size]
+    return groups
+
+def render_article(idx, row):
+    url, title, summary, impact, tags = row
+    sentiment = (tags or {}).get("sentiment", "")
+    return "\n".join([
+        f"[{idx}] {title} (Sentiment: {sentiment})",
+        f"   Summary: {summary}",
+        f"   Impact: {impact}",
+    ])
+
+def input_hash(members):
+    digest = hashlib.sha256(PARTIAL_PROMPT_VERSION.encode("utf-8"))
+    for idx, row in enumerate(members):
+        digest.update(render_article(idx + 1, row).encode("utf-8"))
+    return digest.hexdigest()
+
+def generate_partial(group_key, members):
+    """Insight của 1 nhóm (Chạy trong Thread). Output: SectorInsight hoặc None nếu lỗi."""
+    prompt = PARTIAL_PROMPT.format(
+        count=len(members),
+        group=group_key.split("#")[0],
+        articles="\n\n".join(render_article(idx + 1, row) for idx, row in enumerate(members)),
+    )
+    try:
+        data = extract_object(call_ai_cli(prompt, model=config.GEMINI_MODEL))
+        return SectorInsight.model_validate({**data, "group": group_key, "article_count": len(members)})
+    except Exception as e:
+        discard_cached(prompt, model=config.GEMINI_MODEL)
+        print(f"  ❌ Lỗi tổng hợp nhóm '{group_key}': {e}")
+        return None
+
+def render_partial(partial):
+    lines = [f"## {partial.group} ({partial.article_count} bài)"]
+    lines.extend(f"- Xu hướng: {t}" for t in partial.main_trends)
+    lines.extend(f"- Insight: {t}" for t in partial.hidden_insights)
+    if partial.hot_topics:
+        lines.append(f"- Chủ đề nóng: {', '.join(partial.hot_topics)}")
+    if partial.media_steering:
+        lines.append(f"- Truyền thông: {partial.media_steering}")
+    if partial.sentiment:
+        lines.append(f"- Tâm lý: {partial.sentiment}")
+    return "\n".join(lines)
+
+def generate_daily_insights(conn):
+    """
+    Tổng hợp insight ngày theo 2 tầng:
+    1. Insight từng nhóm ngành, lưu ở bảng insight_partials kèm hash đầu vào;
+       lần chạy sau trong ngày chỉ tính lại nhóm có bài mới / thay đổi.
+    2. Gộp các insight nhóm thành DailyInsight (prompt nhỏ, cố định theo số nhóm).
+    """
+    today = datetime.now(timezone.utc).date()
+    with conn.cursor() as cur:
+        rows = load_day_articles(cur)
+        if not rows:
+            return None
+        groups = group_articles(rows)
+
+        cur.execute("SELECT group_key, input_hash, partial FROM insight_partials WHERE date = %s", (today,))
+        cached = {key: (digest, partial) for key, digest, partial in cur.fetchall()}
+
+    partials = {}
+    stale = {}
+    for key, members in groups.items():
+        digest = input_hash(members)
+        if key in cached and cached[key][0] == digest:
+            partials[key] = SectorInsight(**cached[key][1])
+        else:
+            stale[key] = (digest, members)
+
+    print(f"🧩 {len(groups)} nhóm insight cho {len(rows)} bài: dùng lại {len(partials)}, tính lại {len(stale)}.")
+    updates = []
+    if stale:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=config.ANALYSIS_WORKERS) as executor:
+            futures = {executor.submit(generate_partial, key, members): key for key, (digest, members) in stale.items()}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                partial = future.result()
+                if partial:
+                    partials[key] = partial
+                    updates.append((today, key, stale[key][0], partial.article_count, partial.model_dump_json(), datetime.now()))
+
+    with conn.cursor() as cur:
+        try:
+            if updates:
+                execute_values(cur, SAVE_PARTIALS_SQL, updates, template="(%s, %s, %s, %s, %s::jsonb, %s)", page_size=len(updates))
+            # Nhóm không còn tồn tại (VD: bài chuyển nhóm) thì bỏ partial cũ
+            cur.execute("DELETE FROM insight_partials WHERE date = %s AND NOT (group_key = ANY(%s))", (today, list(groups)))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ DB Error saving insight partials: {e}")
+
+    if not partials:
+        return None
+
+    # Thứ tự cố định -> prompt gộp giống hệt khi không nhóm nào thay đổi (trúng AI cache)
+    ordered = sorted(partials.values(), key=lambda p: (-p.article_count, p.group))
+    prompt = MERGE_PROMPT.format(
+        count=sum(p.article_count for p in ordered),
+        partials="\n\n".join(render_partial(p) for p in ordered),
+        date=today,
+    )
+    try:
+        return extract_object(call_ai_cli(prompt, model=config.GEMINI_MODEL), DailyInsight)
+    except Exception as e:
+        discard_cached(prompt, model=config.GEMINI_MODEL)
+        print(f"❌ Error generating insights: {e}")
+        return None
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import config
+
+# Bucket (giây) cho histogram latency khi xuất Prometheus
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _series_key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Metrics:
+    """
+    Thu thập số liệu của 1 lần chạy (thread-safe):
+    - stage: thời gian chạy từng bước
+    - observe: phân bố giá trị (latency AI / scrape / DB, độ sâu hàng đợi)
+    - inc: bộ đếm; set: giá trị cuối cùng (VD: số bài mỗi bước)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self.stages = []
+        self.counters = {}
+        self.gauges = {}
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            with self._lock:
+                self.stages.append({"stage": name, "seconds": round(time.monotonic() - start, 3), "status": status})
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self.samples.setdefault(_series_key(name, labels), []).append(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = _series_key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_series_key(name, labels)] = value
+
+    def summary(self):
+        """Dữ liệu run report (dict, sẵn sàng json.dumps)."""
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self.samples.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            stages = list(self.stages)
+
+        def rows(items, render):
+            return [{"name": name, "labels": dict(labels), **render(value)} for (name, labels), value in sorted(items.items())]
+
+        return {
+            "started_at": self.started_at.isoformat(),
+            "total_seconds": round(time.monotonic() - self._started, 3),
+            "stages": stages,
+            "counters": rows(counters, lambda v: {"value": v}),
+            "gauges": rows(gauges, lambda v: {"value": v}),
+            "distributions": rows(samples, lambda v: {
+                "count": len(v),
+                "sum": round(sum(v), 4),
+                "min": v[0],
+                "p50": _percentile(v, 0.5),
+                "p95": _percentile(v, 0.95),
+                "p99": _percentile(v, 0.99),
+                "max": v[-1],
+            }),
+        }
+
+    def write_report(self, directory=None):
+        """Ghi run report dạng JSON vào data/run_reports/<thời điểm bắt đầu>.json. Output: đường dẫn file."""
+        directory = directory or config.RUN_REPORT_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"run_{self.started_at.strftime('%Y%m%dT%H%M%SZ')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def write_prometheus(self, path):
+        """
+        Xuất định dạng textfile của Prometheus node_exporter (ghi ra file tạm rồi đổi tên
+        để collector không đọc phải file ghi dở).
+        """
+        with self._lock:
+            samples = {key: list(values) for key, values in self.samples.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            stages = list(self.stages)
+
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+
+        def family(name, kind, samples):
+            """1 metric family: dòng # TYPE rồi toàn bộ sample của nó (textfile collector từ chối series trùng)."""
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        # Bước chạy nhiều lần trong 1 chu kỳ (VD: fetch / insight của tiến trình nền) -> cộng dồn theo tên bước
+        stage_totals = {}
+        for stage in stages:
+            total = stage_totals.setdefault(stage["stage"], {"seconds": 0.0, "count": 0, "errors": 0})
+            total["seconds"] += stage["seconds"]
+            total["count"] += 1
+            total["errors"] += stage["status"] != "ok"
+        if stage_totals:
+            family("news_stage_seconds", "summary", [
+                line
+                for name, total in sorted(stage_totals.items())
+                for line in (f"news_stage_seconds_sum{fmt_labels([('stage', name)])} {round(total['seconds'], 3)}",
+                             f"news_stage_seconds_count{fmt_labels([('stage', name)])} {total['count']}")
+            ])
+            family("news_stage_errors_total", "counter", [
+                f"news_stage_errors_total{fmt_labels([('stage', name)])} {total['errors']}"
+                for name, total in sorted(stage_totals.items())
+            ])
+
+        def by_name(items):
+            grouped = {}
+            for (name, labels), value in sorted(items.items()):
+                grouped.setdefault(name, []).append((labels, value))
+            return grouped.items()
+
+        for name, series in by_name(counters):
+            family(f"news_{name}_total", "counter", [f"news_{name}_total{fmt_labels(labels)} {value}" for labels, value in series])
+        for name, series in by_name(gauges):
+            family(f"news_{name}", "gauge", [f"news_{name}{fmt_labels(labels)} {value}" for labels, value in series])
+        for name, series in by_name(samples):
+            # Latency -> histogram; giá trị khác (VD: độ sâu hàng đợi) -> summary theo phân vị
+            histogram = name.endswith("_seconds")
+            family_lines = []
+            for labels, values in series:
+                if histogram:
+                    for bucket in LATENCY_BUCKETS:
+                        count = sum(1 for v in values if v <= bucket)
+                        family_lines.append(f"news_{name}_bucket{fmt_labels(labels, [('le', bucket)])} {count}")
+                    family_lines.append(f"news_{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {len(values)}")
+                else:
+                    ordered = sorted(values)
+                    for q in (0.5, 0.95, 0.99):
+                        family_lines.append(f"news_{name}{fmt_labels(labels, [('quantile', q)])} {_percentile(ordered, q)}")
+                family_lines.append(f"news_{name}_sum{fmt_labels(labels)} {sum(values)}")
+                family_lines.append(f"news_{name}_count{fmt_labels(labels)} {len(values)}")
+            family(f"news_{name}", "histogram" if histogram else "summary", family_lines)
+        family("news_last_run_timestamp_seconds", "gauge", [f"news_last_run_timestamp_seconds {int(self.started_at.timestamp())}"])
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def report(self):
+        """In tóm tắt thời gian từng bước ra console."""
+        with self._lock:
+            stages = list(self.stages)
+        if not stages:
+            return
+        print("⏱️ Thời gian từng bước:")
+        for stage in stages:
+            print(f"   {stage['stage']:<12} {stage['seconds']:8.1f}s  {'' if stage['status'] == 'ok' else '❌'}")
+
+_metrics = Metrics()
+
+def get_metrics():
+    return _metrics
+
+def reset_metrics():
+    """Bắt đầu bộ số liệu mới (VD: mỗi chu kỳ của tiến trình chạy nền)."""
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
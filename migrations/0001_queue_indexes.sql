@@ -0,0 +1,21 @@
+-- migrate: no-transaction
+-- Index theo các query nóng của pipeline (status + khung published_date).
+-- CONCURRENTLY: không khóa ghi bảng articles trong lúc tạo index (không chạy được trong transaction).
+-- Nếu lỗi giữa chừng, index có thể ở trạng thái INVALID: DROP INDEX CONCURRENTLY rồi chạy lại migration.
+
+-- Hàng đợi bước 2-4 (WorkClaims.claim): status đang xử lý, ORDER BY published_date DESC, url.
+-- Partial index chỉ chứa bài chưa xử lý xong nên vẫn nhỏ khi bảng lớn dần.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_articles_queue
+    ON articles (status, published_date DESC, url)
+    WHERE status IN ('fetched', 'filtered_in', 'scraped');
+
+-- Bài đã xong trong khung thời gian (insight ngày, gom cụm tin trùng, đếm bài).
+-- Thay cho idx_articles_status (status là cột đầu của index này).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_articles_status_published
+    ON articles (status, published_date);
+
+-- Lọc theo thời gian không kèm status cụ thể (VD: tiêu đề đã xử lý trong 24h ở bước lọc).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_articles_published_date
+    ON articles (published_date);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_articles_status;
@@ -0,0 +1,71 @@
+-- Tách nội dung đã cào và kết quả phân tích ra khỏi bảng articles.
+-- Mỗi lần đổi status, Postgres ghi lại nguyên dòng articles; khi dòng còn chứa summary / tags / impact_analysis
+-- (và con trỏ TOAST của content) thì bảng phình to nhanh và quét hàng đợi chậm dần.
+-- Chạy trong 1 transaction: nên dừng pipeline / daemon trong lúc migrate (DROP COLUMN cần khóa ACCESS EXCLUSIVE).
+-- DROP COLUMN không ghi lại bảng: dung lượng cũ chỉ được trả sau VACUUM FULL articles (hoặc pg_repack) lúc ít tải.
+
+CREATE TABLE IF NOT EXISTS article_content (
+    url TEXT PRIMARY KEY REFERENCES articles(url) ON DELETE CASCADE,
+    content TEXT,
+    scraped_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS article_analysis (
+    url TEXT PRIMARY KEY REFERENCES articles(url) ON DELETE CASCADE,
+    summary TEXT,
+    tags JSONB,
+    author_intent TEXT,
+    impact_analysis TEXT,
+    analyzed_at TIMESTAMP,
+    model_version VARCHAR(50),
+    language VARCHAR(10) DEFAULT 'vi',
+    importance_score INT DEFAULT 5,
+    origin VARCHAR(10) DEFAULT 'VN'
+);
+
+CREATE INDEX IF NOT EXISTS idx_article_analysis_tags ON article_analysis USING GIN (tags);
+
+-- Chuyển dữ liệu từ layout cũ (database tạo mới từ schema.sql hiện tại không có các cột này -> bỏ qua)
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'articles' AND column_name = 'content'
+    ) THEN
+        INSERT INTO article_content (url, content, scraped_at)
+        SELECT url, content, scraped_at FROM articles
+        WHERE content IS NOT NULL
+        ON CONFLICT (url) DO NOTHING;
+
+        INSERT INTO article_analysis (url, summary, tags, author_intent, impact_analysis, analyzed_at,
+                                      model_version, language, importance_score, origin)
+        SELECT url, summary, tags, author_intent, impact_analysis, analyzed_at,
+               model_version, language, importance_score, origin
+        FROM articles
+        WHERE summary IS NOT NULL OR analyzed_at IS NOT NULL
+        ON CONFLICT (url) DO NOTHING;
+
+        ALTER TABLE articles
+            DROP COLUMN content,
+            DROP COLUMN scraped_at,
+            DROP COLUMN summary,
+            DROP COLUMN tags,
+            DROP COLUMN author_intent,
+            DROP COLUMN impact_analysis,
+            DROP COLUMN analyzed_at,
+            DROP COLUMN model_version,
+            DROP COLUMN language,
+            DROP COLUMN importance_score,
+            DROP COLUMN origin;
+    END IF;
+END $$;
+
+-- Xem toàn bộ thông tin 1 bài như layout cũ (báo cáo / truy vấn tay; pipeline không đọc view này)
+CREATE OR REPLACE VIEW articles_full AS
+SELECT a.*,
+       c.content, c.scraped_at,
+       n.summary, n.tags, n.author_intent, n.impact_analysis, n.analyzed_at,
+       n.model_version, n.language, n.importance_score, n.origin
+FROM articles a
+LEFT JOIN article_content c ON c.url = a.url
+LEFT JOIN article_analysis n ON n.url = a.url;
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
 from datetime import datetime, date, timezone
 from enum import Enum
@@ -22,6 +22,28 @@ class ArticleTags(BaseModel):
     keywords: List[str] = Field(default_factory=list, description="Từ khóa quan trọng")
     sentiment: Optional[SentimentEnum] = Field(default=SentimentEnum.UNKNOWN, description="Cảm xúc của bài báo")
 
+class FilterScore(BaseModel):
+    """1 phần tử kết quả lọc tin (step2)."""
+    id: int
+    score: int = Field(ge=0, le=10)
+    reason: str = ""
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def round_score(cls, value):
+        return max(0, min(10, int(round(float(value)))))
+
+class AnalysisResult(BaseModel):
+    """Phần AI trả về khi phân tích 1 bài (id chỉ có trong chế độ nhiều bài/prompt)."""
+    id: Optional[int] = None
+    summary: str = Field(min_length=1)
+    language: str = "vi"
+    importance_score: int = Field(default=5, ge=1, le=10)
+    origin: str = "VN"
+    tags: ArticleTags = Field(default_factory=ArticleTags)
+    author_intent: Optional[str] = None
+    impact_analysis: Optional[str] = None
+
 class ArticleAnalysis(BaseModel):
     url: str
     title: str
@@ -35,6 +57,16 @@ class ArticleAnalysis(BaseModel):
     analyzed_at: datetime = Field(default_factory=get_now_utc)
     model_version: str = Field(default=config.GEMINI_MODEL, description="Model AI sử dụng để phân tích")
 
+class SectorInsight(BaseModel):
+    """Insight trung gian của 1 nhóm ngành, được gộp lại thành DailyInsight."""
+    group: str
+    article_count: int = 0
+    main_trends: List[str] = Field(default_factory=list)
+    hidden_insights: List[str] = Field(default_factory=list)
+    hot_topics: List[str] = Field(default_factory=list)
+    media_steering: Optional[str] = None
+    sentiment: Optional[str] = None
+
 class DailyInsight(BaseModel):
     date: date
     main_trends: List[str] = Field(default_factory=list)
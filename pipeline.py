@@ -0,0 +1,357 @@
+import time
+import queue
+import threading
+import config
+from database_manager import get_db, BatchWriter
+from dedup import cluster_before_scrape, cluster_before_analysis, promote_on_failure
+from scrape_engine import Fetcher, interleave_by_host
+from html_archive import HtmlArchive
+from metrics import get_metrics
+from work_queue import WorkClaims
+from insights import generate_daily_insights
+import step2_filter
+import step3_scrape
+import step4_report
+
+_DONE = object() # Báo hiệu hết dữ liệu cho bước sau
+QUEUE_POLL_SECONDS = 0.5 # Chu kỳ kiểm tra cờ hủy khi chờ hàng đợi
+
+class PipelineAborted(Exception):
+    """1 bước của pipeline đã chết: các bước khác dừng thay vì chờ hàng đợi không còn ai đọc / ghi."""
+
+class StreamingPipeline:
+    """
+    Chạy lọc -> cào -> phân tích nối tiếp nhau qua các hàng đợi có giới hạn thay vì chờ từng bước xong hẳn:
+    - Batch lọc vừa commit xong thì các bài 'filtered_in' được đưa ngay sang bước cào.
+    - Lô nội dung vừa commit ('scraped') được đưa ngay sang bước phân tích.
+    Trạng thái trong DB vẫn là nguồn sự thật: bài chỉ được chuyển tiếp sau khi bước trước đã commit,
+    dừng giữa chừng thì lần chạy sau (batch hoặc stream) tiếp tục từ đúng trạng thái đó.
+    Bài được giữ (WorkClaims) xuyên suốt từ lúc lọc tới lúc phân tích xong.
+    1 bước lỗi -> bật cờ `abort`, mọi bước dừng (lô đã có vẫn được ghi), phiên giữ bài đóng lại
+    để worker khác lấy tiếp các bài còn dở.
+    """
+    def __init__(self):
+        self.scrape_queue = queue.Queue(maxsize=config.PIPELINE_SCRAPE_QUEUE_SIZE)
+        self.analysis_queue = queue.Queue(maxsize=config.PIPELINE_ANALYSIS_QUEUE_SIZE)
+        self.titles = {}
+        self.refetch = set() # Bài tồn đọng đã cào lỗi: tải lại, không đọc archive
+        self.claims = None
+        self.started = None
+        self.first_analysis_at = None
+        self.counts = {"selected": 0, "scraped": 0, "scrape_failed": 0, "analyzed": 0, "analysis_failed": 0, "ai_calls": 0}
+        self._lock = threading.Lock()
+        self.abort = threading.Event()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counts[key] += amount
+
+    def _check_abort(self):
+        if self.abort.is_set():
+            raise PipelineAborted()
+
+    def _put(self, q, item):
+        """put có giới hạn thời gian chờ: hàng đợi đầy và pipeline bị hủy thì raise PipelineAborted."""
+        while True:
+            self._check_abort()
+            try:
+                q.put(item, timeout=QUEUE_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q, timeout=None):
+        """get kiểm tra cờ hủy định kỳ. Output: item, _DONE nếu pipeline bị hủy. Hết timeout thì raise queue.Empty."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.abort.is_set():
+            wait = QUEUE_POLL_SECONDS if deadline is None else min(QUEUE_POLL_SECONDS, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    # --- Nguồn dữ liệu tồn đọng từ các lần chạy trước ---
+    def _claim_to_scrape(self, conn):
+        limit = config.TEST_LIMIT if config.TEST_MODE else None
+        return self.claims.claim(conn, 'filtered_in', columns="url, title, scrape_attempts", limit=limit)
+
+    def _claim_to_analyze(self, conn):
+        limit = config.TEST_LIMIT if config.TEST_MODE else None
+        return self.claims.claim(
+            conn, 'scraped',
+            columns="url, title, content, published_date",
+            join="LEFT JOIN article_content USING (url)",
+            where="AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'",
+            limit=limit,
+        )
+
+    def _load_backlog(self):
+        """Lượt đầu bài 'filtered_in' chưa cào và bài 'scraped' chưa phân tích (24h) từ các lần chạy trước."""
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                duplicate_count = cluster_before_scrape(cur) + cluster_before_analysis(cur)
+                conn.commit()
+                if duplicate_count:
+                    print(f"🧬 Bỏ qua {duplicate_count} bài trùng tin với bài khác (status='duplicate').")
+
+            to_scrape = self._claim_to_scrape(conn)
+            to_analyze = self._claim_to_analyze(conn)
+        return to_scrape, to_analyze
+
+    def _more_backlog(self, claim):
+        """
+        Các lượt tồn đọng tiếp theo (WORK_CLAIM_LIMIT giới hạn mỗi lượt) cho tới khi không còn bài để giữ.
+        Bài phiên này đang giữ (kể cả bài lỗi) không bị giữ lại lần nữa nên vòng lặp luôn kết thúc.
+        """
+        while not config.TEST_MODE and not self.abort.is_set():
+            with get_db() as conn:
+                rows = claim(conn)
+            if not rows:
+                return
+            yield rows
+
+    def _add_backlog_scrape(self, rows):
+        """Ghi nhận tiêu đề; bài đã cào lỗi trước đây thì tải lại thay vì đọc HTML cũ trong archive."""
+        for url, title, attempts in rows:
+            self.titles[url] = title
+            if attempts:
+                self.refetch.add(url)
+        return [url for url, _ in interleave_by_host_pairs([(url, title) for url, title, _ in rows])]
+
+    def _seed_analysis(self, rows):
+        """Đưa bài 'scraped' tồn đọng vào hàng đợi phân tích, hết lượt thì giữ tiếp lượt sau."""
+        for row in rows:
+            self._put(self.analysis_queue, row)
+        for rows in self._more_backlog(self._claim_to_analyze):
+            for row in rows:
+                self._put(self.analysis_queue, row)
+
+    # --- Bước lọc -> cào ---
+    def _on_selected(self, rows):
+        """Gọi trên thread lọc sau mỗi batch đã commit: gom cụm tin trùng rồi đẩy sang hàng đợi cào."""
+        if config.PIPELINE_DEDUP:
+            with get_db() as conn:
+                with conn.cursor() as cur:
+                    cluster_before_scrape(cur)
+                    conn.commit()
+                    cur.execute("SELECT url FROM articles WHERE url = ANY(%s) AND status = 'filtered_in'", ([url for url, _ in rows],))
+                    keep = {r[0] for r in cur.fetchall()}
+            rows = [(url, title) for url, title in rows if url in keep]
+
+        for url, title in interleave_by_host_pairs(rows):
+            self.titles[url] = title
+            self._count("selected")
+            self._put(self.scrape_queue, url) # Hàng đợi đầy -> thread lọc chờ (backpressure)
+            get_metrics().observe("pipeline_scrape_queue_depth", self.scrape_queue.qsize())
+
+    def _scrape_urls(self, backlog):
+        yield from self._add_backlog_scrape(backlog)
+        while True:
+            url = self._get(self.scrape_queue)
+            if url is _DONE:
+                break
+            yield url
+        # Bước lọc đã xong -> cào nốt các lượt tồn đọng còn lại
+        for rows in self._more_backlog(self._claim_to_scrape):
+            yield from self._add_backlog_scrape(rows)
+
+    # --- Bước cào -> phân tích ---
+    def _on_scraped(self, rows):
+        """Gọi sau khi lô nội dung đã commit: đẩy sang hàng đợi phân tích (chỉ các bài đã ghi được)."""
+        for url, content, _ in rows:
+            self._count("scraped")
+            self._put(self.analysis_queue, (url, self.titles.get(url, ""), content, None))
+            get_metrics().observe("pipeline_analysis_queue_depth", self.analysis_queue.qsize())
+
+    def _scrape_stage(self, backlog):
+        fetcher = Fetcher()
+        archive = HtmlArchive() if config.HTML_ARCHIVE_ENABLED else None
+        started = time.monotonic()
+        try:
+            with get_db() as conn:
+                with BatchWriter(conn, step3_scrape.SAVE_CONTENT_SQL, max_rows=config.PIPELINE_COMMIT_BATCH,
+                                 max_interval=config.PIPELINE_COMMIT_INTERVAL, on_flush=self._on_scraped, returning=True) as content_writer, \
+                        BatchWriter(conn, step3_scrape.SAVE_FAILURE_SQL, template=step3_scrape.SAVE_FAILURE_TEMPLATE, returning=True,
+                                    max_rows=config.SCRAPE_COMMIT_BATCH, max_interval=config.SCRAPE_COMMIT_INTERVAL,
+                                    on_flush=promote_on_failure(conn)) as failure_writer:
+
+                    def flush_due():
+                        self._check_abort() # Bước phân tích đã chết -> dừng cào, bài còn lại giữ 'filtered_in'
+                        content_writer.flush_if_due()
+                        failure_writer.flush_if_due()
+
+                    for url, content, error in step3_scrape.scrape_stream(self._scrape_urls(backlog), fetcher, archive,
+                                                                          on_idle=flush_due, refetch=self.refetch):
+                        if content:
+                            content_writer.add((url, content, self.claims.worker_id))
+                            print(f"✅ Scraped: {url}")
+                        else:
+                            failure_writer.add((url, error, config.SCRAPE_MAX_ATTEMPTS, self.claims.worker_id))
+                            self._count("scrape_failed")
+                            print(f"⚠️ Failed {url}: {error}")
+                        flush_due()
+        finally:
+            fetcher.report(time.monotonic() - started)
+            fetcher.close()
+            if archive is not None:
+                archive.close()
+
+    # --- Bước phân tích ---
+    def _next_micro_batch(self):
+        """
+        Chờ bài đầu tiên rồi gom thêm tối đa PIPELINE_ANALYSIS_LINGER giây (đủ 1 prompt thì gửi luôn).
+        Output: (list article_row, đã hết dữ liệu hay chưa)
+        """
+        item = self._get(self.analysis_queue)
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + config.PIPELINE_ANALYSIS_LINGER
+        while len(batch) < config.ANALYSIS_BATCH_MAX_ITEMS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._get(self.analysis_queue, timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _on_analyzed(self, rows):
+        with self._lock:
+            if self.first_analysis_at is None:
+                self.first_analysis_at = time.monotonic()
+            self.counts["analyzed"] += len(rows)
+
+    def _analysis_worker(self):
+        stats = {"calls": 0}
+        try:
+            with get_db() as conn:
+                with BatchWriter(conn, step4_report.SAVE_ANALYSIS_SQL, template=step4_report.SAVE_ANALYSIS_TEMPLATE, returning=True,
+                                 max_rows=config.ANALYSIS_COMMIT_BATCH, max_interval=config.PIPELINE_COMMIT_INTERVAL,
+                                 on_flush=self._on_analyzed) as writer, \
+                        BatchWriter(conn, step4_report.SAVE_ANALYSIS_FAILURE_SQL, template=step4_report.SAVE_ANALYSIS_FAILURE_TEMPLATE,
+                                    returning=True, max_rows=config.ANALYSIS_COMMIT_BATCH, max_interval=config.PIPELINE_COMMIT_INTERVAL,
+                                    on_flush=promote_on_failure(conn)) as failure_writer:
+                    finished = False
+                    while not finished:
+                        batch, finished = self._next_micro_batch()
+                        if not batch:
+                            continue
+                        for row, res in step4_report.iter_analyses(batch, stats):
+                            if res:
+                                writer.add(step4_report.analysis_row(res, self.claims.worker_id))
+                                print(f"  ✅ Analyzed: {res.title[:50]}...")
+                            else:
+                                failure_writer.add(step4_report.analysis_failure_row(row[0], self.claims.worker_id))
+                                self._count("analysis_failed")
+                                print(f"  ⚠️ Failed analysis for: {row[0]}")
+                        # Ghi ngay sau mỗi micro-batch để bài đầu tiên xuất hiện trong DB sớm nhất có thể
+                        writer.flush()
+                        failure_writer.flush_if_due()
+        finally:
+            self._count("ai_calls", stats["calls"])
+
+    # --- Điều phối ---
+    def _run_stage(self, name, target, *args, on_exit=None):
+        """Chạy 1 bước trong thread riêng; lỗi thì hủy cả pipeline, hết việc thì báo hết dữ liệu cho bước sau."""
+        def runner():
+            try:
+                target(*args)
+            except PipelineAborted:
+                pass
+            except Exception as e:
+                print(f"❌ [Pipeline] Bước {name} lỗi: {e}. Dừng pipeline, bài còn dở sẽ được xử lý ở lần chạy sau.")
+                self.abort.set()
+            finally:
+                if on_exit is not None:
+                    try:
+                        on_exit()
+                    except PipelineAborted:
+                        pass
+        thread = threading.Thread(target=runner, name=f"pipeline-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _process(self):
+        to_scrape, to_analyze = self._load_backlog()
+        print(f"🌊 [Pipeline] Tồn đọng: {len(to_scrape)} bài chờ cào, {len(to_analyze)} bài chờ phân tích. "
+              f"{config.PIPELINE_ANALYSIS_WORKERS} luồng phân tích, hàng đợi cào {config.PIPELINE_SCRAPE_QUEUE_SIZE} / phân tích {config.PIPELINE_ANALYSIS_QUEUE_SIZE}.")
+
+        analysis_threads = [
+            self._run_stage(f"analyze-{i}", self._analysis_worker)
+            for i in range(config.PIPELINE_ANALYSIS_WORKERS)
+        ]
+        seeder = self._run_stage("seed", self._seed_analysis, to_analyze)
+
+        def finish_scrape():
+            # Hết bài để cào -> mỗi luồng phân tích nhận 1 tín hiệu kết thúc (sau bài tồn đọng)
+            seeder.join()
+            for _ in analysis_threads:
+                self._put(self.analysis_queue, _DONE)
+
+        scrape_thread = self._run_stage("scrape", self._scrape_stage, to_scrape, on_exit=finish_scrape)
+
+        try:
+            step2_filter.filter_news(on_selected=self._on_selected, claims=self.claims)
+        except PipelineAborted:
+            print("🛑 [Pipeline] Dừng bước lọc vì pipeline bị hủy.")
+        except Exception as e:
+            # Bước lọc lỗi: vẫn cào / phân tích nốt các bài đã chọn và bài tồn đọng
+            print(f"❌ [Pipeline] Bước lọc lỗi: {e}")
+        try:
+            self._put(self.scrape_queue, _DONE)
+        except PipelineAborted:
+            pass
+
+        scrape_thread.join()
+        for thread in analysis_threads:
+            thread.join()
+
+    def run(self, insight=True):
+        """
+        insight=False: chỉ xử lý bài, không tổng hợp insight ngày (VD: tiến trình nền tự tổng hợp theo lịch riêng).
+        Output: (daily_insight | None, số bài đã phân tích)
+        """
+        self.started = time.monotonic()
+        with WorkClaims() as self.claims:
+            self._process()
+
+        total = time.monotonic() - self.started
+        metrics = get_metrics()
+        for key, value in self.counts.items():
+            metrics.set(f"pipeline_{key}", value)
+        metrics.set("pipeline_total_seconds", round(total, 3))
+        metrics.set("pipeline_aborted", int(self.abort.is_set()))
+        if self.first_analysis_at is not None:
+            ttfa = self.first_analysis_at - self.started
+            metrics.set("pipeline_time_to_first_analysis_seconds", round(ttfa, 3))
+            print(f"⏱️ [Pipeline] Bài đầu tiên được phân tích sau {ttfa:.1f}s, tổng {total:.1f}s.")
+        c = self.counts
+        if self.abort.is_set():
+            print("⚠️ [Pipeline] Đã dừng giữa chừng do 1 bước bị lỗi.")
+        print(f"🎉 [Pipeline] Chọn {c['selected']} | cào được {c['scraped']} (lỗi {c['scrape_failed']}) | "
+              f"phân tích {c['analyzed']} bài (lỗi {c['analysis_failed']}) với {c['ai_calls']} lời gọi AI.")
+
+        if not insight or not c["analyzed"]:
+            return None, c["analyzed"]
+        print("🧠 Đang tổng hợp Insight thị trường...")
+        with get_db() as conn:
+            daily_insight = generate_daily_insights(conn)
+            if daily_insight and step4_report.save_daily_insight(conn, daily_insight):
+                return daily_insight, c["analyzed"]
+        return None, c["analyzed"]
+
+def interleave_by_host_pairs(rows):
+    """interleave_by_host cho danh sách (url, title)."""
+    titles = dict(rows)
+    return [(url, titles[url]) for url in interleave_by_host(list(titles))]
+
+def run_streaming(insight=True):
+    return StreamingPipeline().run(insight)
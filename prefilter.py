@@ -0,0 +1,209 @@
+import re
+import math
+import zlib
+import unicodedata
+from collections import Counter, defaultdict
+import config
+
+# Tin PR / quảng cáo / nội dung ít giá trị tài chính (so khớp trên tiêu đề đã chuẩn hóa).
+# Chỉ dùng cụm từ rõ ràng: "ưu đãi", "giảm giá", "tài trợ" dễ trùng tin thật (ưu đãi thuế, giảm giá xăng...).
+LOW_VALUE_PATTERNS = [
+    r"\[pr\]", r"\bpr\b", r"quảng cáo", r"thông cáo báo chí", r"khuyến mãi", r"voucher", r"mã giảm giá",
+    r"minigame", r"trúng thưởng", r"quay số", r"giveaway", r"tuyển dụng", r"xổ số", r"tử vi", r"cung hoàng đạo",
+    r"\bsponsored\b", r"\badvertisement\b", r"\bpromo(tion)?\b", r"\bhoroscope\b",
+    r"\bcrossword\b", r"\bwordle\b", r"\bquiz\b",
+]
+LOW_VALUE_RE = re.compile("|".join(LOW_VALUE_PATTERNS))
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def normalize_title(title):
+    return unicodedata.normalize("NFC", title or "").lower().strip()
+
+def tokenize(title):
+    return TOKEN_RE.findall(normalize_title(title))
+
+def features(title):
+    """Unigram + bigram (tiếng Việt là ngôn ngữ đơn âm tiết nên bigram mang nhiều nghĩa hơn)."""
+    tokens = tokenize(title)
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+def shingles(title):
+    tokens = tokenize(title)
+    if len(tokens) < 2:
+        return set(tokens)
+    return {f"{a}_{b}" for a, b in zip(tokens, tokens[1:])}
+
+class TitleClassifier:
+    """Naive Bayes trên tiêu đề, học từ filter_score mà AI đã chấm trước đây."""
+    def __init__(self):
+        self.class_counts = Counter()
+        self.feature_counts = {True: Counter(), False: Counter()}
+        self.total_features = Counter()
+        self.vocabulary = set()
+
+    def fit(self, samples):
+        """samples: iterable (title, is_important)"""
+        for title, label in samples:
+            feats = features(title)
+            self.class_counts[label] += 1
+            self.feature_counts[label].update(feats)
+            self.total_features[label] += len(feats)
+            self.vocabulary.update(feats)
+        return self
+
+    @property
+    def ready(self):
+        return (
+            sum(self.class_counts.values()) >= config.PREFILTER_MIN_TRAINING_SAMPLES
+            and self.class_counts[True] > 0 and self.class_counts[False] > 0
+        )
+
+    def prob_important(self, title):
+        total = sum(self.class_counts.values())
+        vocab_size = len(self.vocabulary) + 1
+        log_probs = {}
+        for label in (True, False):
+            log_prob = math.log(self.class_counts[label] / total)
+            denominator = self.total_features[label] + vocab_size
+            for feat in features(title):
+                log_prob += math.log((self.feature_counts[label][feat] + 1) / denominator)
+            log_probs[label] = log_prob
+
+        # Chuẩn hóa về xác suất (tránh tràn số khi lấy exp)
+        top = max(log_probs.values())
+        odds = {label: math.exp(lp - top) for label, lp in log_probs.items()}
+        return odds[True] / (odds[True] + odds[False])
+
+class Prefilter:
+    """
+    Bộ lọc cục bộ chạy trước AI: loại tin PR/quảng cáo, tin trùng lặp gần đúng
+    và tin mà classifier cho rằng gần như chắc chắn không đủ điểm.
+    Một phần nhỏ tin bị loại (PREFILTER_AUDIT_RATE) vẫn được gửi AI để đo độ lệch.
+    """
+    def __init__(self, classifier=None):
+        self.classifier = classifier
+        self.stats = Counter()
+
+    @classmethod
+    def from_db(cls, cur):
+        cur.execute("""
+            SELECT title, filter_score
+            FROM articles
+            WHERE filter_score IS NOT NULL
+            AND created_at >= (NOW() AT TIME ZONE 'UTC') - make_interval(days => %s)
+        """, (config.PREFILTER_TRAINING_DAYS,))
+        classifier = TitleClassifier().fit(
+            (title, score >= config.IMPORTANCE_THRESHOLD) for title, score in cur.fetchall()
+        )
+        if not classifier.ready:
+            print(f"ℹ️ [Prefilter] Chưa đủ dữ liệu huấn luyện ({sum(classifier.class_counts.values())} bài), chỉ dùng luật.")
+            classifier = None
+        return cls(classifier)
+
+    def drop_reason(self, url, title, seen_index):
+        """
+        Trả về (lý do loại, cluster_id) hoặc (None, None) nếu nên giữ lại để AI chấm.
+        cluster_id chỉ có với tin gần trùng: cụm của tiêu đề đã thấy mà tin này trùng.
+        """
+        normalized = normalize_title(title)
+        if LOW_VALUE_RE.search(normalized):
+            return "rule: PR/quảng cáo", None
+
+        title_shingles = shingles(title)
+        cluster_id = seen_index.find_duplicate(title_shingles)
+        if cluster_id is not None:
+            return "near-duplicate", cluster_id
+        seen_index.add(title_shingles, url)
+
+        if self.classifier is not None:
+            prob = self.classifier.prob_important(title)
+            if prob < config.PREFILTER_DROP_PROBABILITY:
+                return f"classifier: p={prob:.3f}", None
+        return None, None
+
+    def split(self, articles, seen=()):
+        """
+        articles: [(url, title)], seen: [(url, title, cluster_id)] tin đã xử lý -> (kept, dropped, audited)
+        - dropped: [(url, title, reason, cluster_id)]; tin gần trùng có cluster_id (ghi 'duplicate'),
+          còn lại cluster_id None (ghi 'filtered_out')
+        - audited: set url bị loại nhưng vẫn gửi AI để đo độ lệch (đã nằm trong kept)
+        Cụm của tiêu đề đã thấy là cluster_id sẵn có, nếu chưa có thì là URL của nó (như dedup).
+        """
+        seen_index = ShingleIndex(config.PREFILTER_DUPLICATE_THRESHOLD)
+        for url, title, cluster_id in seen:
+            seen_index.add(shingles(title), cluster_id or url)
+
+        kept, dropped, audited = [], [], set()
+        for url, title in articles:
+            reason, cluster_id = self.drop_reason(url, title, seen_index)
+            self.stats["total"] += 1
+            if reason is None:
+                kept.append((url, title))
+                continue
+
+            self.stats[reason.split(":")[0]] += 1
+            # Chọn mẫu kiểm tra theo hash URL để prompt ổn định giữa các lần chạy (giữ được cache AI)
+            if zlib.crc32(url.encode("utf-8")) % 1000 < config.PREFILTER_AUDIT_RATE * 1000:
+                audited.add(url)
+                kept.append((url, title))
+            else:
+                dropped.append((url, title, reason, cluster_id))
+
+        self.stats["dropped"] += len(dropped)
+        return kept, dropped, audited
+
+    def record_audit(self, score):
+        """Ghi nhận điểm AI của 1 tin thuộc mẫu kiểm tra (tin prefilter muốn loại)."""
+        self.stats["audited"] += 1
+        if score >= config.IMPORTANCE_THRESHOLD:
+            self.stats["audit_disagree"] += 1
+
+    def record_batches(self, before, after):
+        """Số batch AI của 1 lượt lọc nếu không có prefilter (before) và sau prefilter (after)."""
+        self.stats["batches_before"] += before
+        self.stats["batches_after"] += after
+
+    def report(self):
+        total = self.stats["total"]
+        if not total:
+            return
+        dropped = self.stats["dropped"]
+        breakdown = ", ".join(
+            f"{key}: {self.stats[key]}" for key in ("rule", "near-duplicate", "classifier") if self.stats[key]
+        )
+        print(f"🧹 [Prefilter] Loại {dropped}/{total} tin ({dropped / total:.0%}) trước khi gửi AI. {breakdown}")
+        before, after = self.stats["batches_before"], self.stats["batches_after"]
+        if before:
+            print(f"   Batch AI: {before} -> {after} ({(before - after) / before:.0%} ít hơn, chưa tính cache điểm và hỏi lại).")
+        if self.stats["audited"]:
+            print(f"   Kiểm tra chéo: AI chấm đạt {self.stats['audit_disagree']}/{self.stats['audited']} tin mà prefilter định loại.")
+
+class ShingleIndex:
+    """Index đảo (shingle -> id) để tìm tiêu đề gần trùng bằng Jaccard mà không so từng cặp."""
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.entries = []
+        self.keys = []
+        self.postings = defaultdict(list)
+
+    def add(self, title_shingles, key):
+        idx = len(self.entries)
+        self.entries.append(title_shingles)
+        self.keys.append(key)
+        for sh in title_shingles:
+            self.postings[sh].append(idx)
+
+    def find_duplicate(self, title_shingles):
+        """Trả về key của tiêu đề giống nhất (Jaccard >= threshold) hoặc None."""
+        if not title_shingles:
+            return None
+        candidates = Counter()
+        for sh in title_shingles:
+            candidates.update(self.postings.get(sh, ()))
+        best, best_score = None, self.threshold
+        for idx, overlap in candidates.items():
+            union = len(title_shingles | self.entries[idx])
+            score = overlap / union if union else 0
+            if score >= best_score:
+                best, best_score = self.keys[idx], score
+        return best
@@ -2,16 +2,14 @@
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
 -- Table: articles
--- Lưu trữ thông tin bài báo và trạng thái xử lý
+-- Lưu trữ thông tin bài báo và trạng thái xử lý (hàng đợi). Chỉ giữ các cột nhỏ:
+-- dòng này bị UPDATE ở mọi bước, nội dung / kết quả phân tích nằm ở bảng article_content / article_analysis.
 CREATE TABLE IF NOT EXISTS articles (
     url TEXT PRIMARY KEY,
     title TEXT NOT NULL,
     source TEXT,
     published_date TIMESTAMP,
     image_url TEXT,
-    language VARCHAR(10) DEFAULT 'vi',
-    importance_score INT DEFAULT 5,
-    origin VARCHAR(10) DEFAULT 'VN',
     
     -- Status Definitions:
     -- 'fetched': Vừa lấy về từ RSS
@@ -19,29 +17,58 @@ CREATE TABLE IF NOT EXISTS articles (
     -- 'filtered_out': Bị loại (điểm thấp)
     -- 'scraped': Đã lấy nội dung chi tiết
     -- 'analyzed': Đã phân tích xong
+    -- 'duplicate': Trùng với 1 bài khác trong cùng cụm tin (không cào / phân tích)
+    -- 'scrape_failed': Cào lỗi quá SCRAPE_MAX_ATTEMPTS lần
+    -- 'analysis_failed': Phân tích lỗi quá ANALYSIS_MAX_ATTEMPTS lần
     status VARCHAR(50) DEFAULT 'fetched',
+
+    -- Story Cluster: URL đại diện của cụm tin trùng lặp (NULL nếu bài không trùng bài nào)
+    cluster_id TEXT,
     
-    -- Scraped Content
-    content TEXT,
-    scraped_at TIMESTAMP,
+    -- Scrape Meta
+    scrape_attempts INT DEFAULT 0,
+    scrape_error TEXT,
 
-    -- Analysis Data (JSONB mapped from Pydantic ArticleAnalysis)
-    summary TEXT,
-    tags JSONB, -- Stores {source, sectors, sentiment...}
-    author_intent TEXT,
-    impact_analysis TEXT,
-    analyzed_at TIMESTAMP,
-    model_version VARCHAR(50),
+    -- Analysis Meta
+    analysis_attempts INT DEFAULT 0,
+    analysis_error TEXT,
 
     -- Filtering Meta
     filter_score INT,
     filter_reason TEXT,
+
+    -- Work Claim: worker đang xử lý bài (lease hết hạn thì worker khác được lấy lại)
+    claimed_by TEXT,
+    claim_expires_at TIMESTAMP,
     
     -- Metadata
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Table: article_content
+-- Nội dung đã cào (ghi 1 lần ở bước 3)
+CREATE TABLE IF NOT EXISTS article_content (
+    url TEXT PRIMARY KEY REFERENCES articles(url) ON DELETE CASCADE,
+    content TEXT,
+    scraped_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Table: article_analysis
+-- Kết quả phân tích (JSONB mapped from Pydantic ArticleAnalysis, ghi 1 lần ở bước 4)
+CREATE TABLE IF NOT EXISTS article_analysis (
+    url TEXT PRIMARY KEY REFERENCES articles(url) ON DELETE CASCADE,
+    summary TEXT,
+    tags JSONB, -- Stores {source, sectors, sentiment...}
+    author_intent TEXT,
+    impact_analysis TEXT,
+    analyzed_at TIMESTAMP,
+    model_version VARCHAR(50),
+    language VARCHAR(10) DEFAULT 'vi',
+    importance_score INT DEFAULT 5,
+    origin VARCHAR(10) DEFAULT 'VN'
+);
+
 -- Table: daily_insights
 -- Lưu trữ báo cáo tổng hợp theo ngày
 CREATE TABLE IF NOT EXISTS daily_insights (
@@ -55,8 +82,31 @@ CREATE TABLE IF NOT EXISTS daily_insights (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
--- Index cho việc query hiệu quả
-CREATE INDEX IF NOT EXISTS idx_articles_status ON articles(status);
+-- Table: insight_partials
+-- Insight trung gian theo nhóm ngành trong ngày (input_hash: hash các bài đầu vào, chỉ tính lại nhóm thay đổi)
+CREATE TABLE IF NOT EXISTS insight_partials (
+    date DATE NOT NULL,
+    group_key TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    article_count INT,
+    partial JSONB,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (date, group_key)
+);
+
+-- Migration cho database đã tạo trước khi có các cột mới
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS cluster_id TEXT;
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS scrape_attempts INT DEFAULT 0;
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS scrape_error TEXT;
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS analysis_attempts INT DEFAULT 0;
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS analysis_error TEXT;
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS claim_expires_at TIMESTAMP;
+
+-- Index cho việc query hiệu quả (index theo status / published_date nằm trong migrations/)
 CREATE INDEX IF NOT EXISTS idx_articles_created_at ON articles(created_at);
+CREATE INDEX IF NOT EXISTS idx_articles_cluster_id ON articles(cluster_id);
+-- Chỉ các bài đang được giữ (gia hạn / trả lại lease theo worker)
+CREATE INDEX IF NOT EXISTS idx_articles_claimed_by ON articles(claimed_by) WHERE claimed_by IS NOT NULL;
 -- Index JSONB để query tags nhanh hơn (VD: tìm bài có sentiment='Tiêu cực')
-CREATE INDEX IF NOT EXISTS idx_articles_tags ON articles USING GIN (tags);
+CREATE INDEX IF NOT EXISTS idx_article_analysis_tags ON article_analysis USING GIN (tags);
@@ -0,0 +1,152 @@
+import time
+import random
+import threading
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from metrics import get_metrics
+
+DEFAULT_HEADERS = {
+    'User-Agent': config.USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'vi,en;q=0.9,en-US;q=0.8',
+    'Referer': 'https://www.google.com/',
+    'Cache-Control': 'max-age=0',
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+def interleave_by_host(urls):
+    """Xếp URL xen kẽ giữa các host để worker không dồn cùng lúc vào 1 host."""
+    queues = defaultdict(deque)
+    for url in urls:
+        queues[host_of(url)].append(url)
+    ordered = []
+    while queues:
+        for host in list(queues):
+            ordered.append(queues[host].popleft())
+            if not queues[host]:
+                del queues[host]
+    return ordered
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.ok = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+class Fetcher:
+    """
+    Tải HTML dùng chung 1 Session (keep-alive, không bắt tay TLS lại cho mỗi URL),
+    giới hạn số request đồng thời và khoảng cách giữa các request cho từng host,
+    retry với backoff ngẫu nhiên (jitter) khi gặp lỗi mạng / 429 / 5xx.
+    """
+    def __init__(self, per_host_concurrency=None, host_delay=None, max_retries=None, timeout=None):
+        self.per_host_concurrency = per_host_concurrency or config.SCRAPE_PER_HOST_CONCURRENCY
+        self.host_delay = config.SCRAPE_SLEEP if host_delay is None else host_delay
+        self.max_retries = config.SCRAPE_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or config.SCRAPE_TIMEOUT
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=100, pool_maxsize=self.per_host_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.stats = defaultdict(HostStats)
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._host_next_start = {}
+
+    def _slots(self, host):
+        with self._lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_concurrency)
+            return slots
+
+    def _wait_turn(self, host):
+        """Giữ khoảng cách tối thiểu host_delay giữa 2 lần bắt đầu request tới cùng 1 host."""
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._host_next_start.get(host, 0.0))
+            self._host_next_start[host] = start_at + self.host_delay
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        base = config.SCRAPE_BACKOFF_BASE * (2 ** attempt)
+        return base * random.uniform(0.5, 1.5)
+
+    def fetch(self, url):
+        """Output: (html, error) - đúng 1 trong 2 khác None."""
+        host = host_of(url)
+        stats = self.stats[host]
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            with self._slots(host):
+                self._wait_turn(host)
+                start = time.monotonic()
+                try:
+                    response = self.session.get(url, timeout=self.timeout)
+                    elapsed = time.monotonic() - start
+                    get_metrics().observe("scrape_fetch_seconds", elapsed, host=host)
+                    with self._lock:
+                        stats.requests += 1
+                        stats.seconds += elapsed
+                        stats.bytes += len(response.content)
+
+                    if response.status_code not in RETRY_STATUS:
+                        response.raise_for_status()
+                        with self._lock:
+                            stats.ok += 1
+                        return (response.text, None)
+
+                    last_error = f"HTTP {response.status_code}"
+                    header = response.headers.get("Retry-After", "")
+                    retry_after = float(header) if header.isdigit() else None
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    with self._lock:
+                        stats.requests += 1
+                        stats.seconds += time.monotonic() - start
+                    last_error = str(e)
+                except Exception as e:
+                    # Lỗi không nên retry (4xx, URL sai, ...)
+                    get_metrics().inc("scrape_errors", host=host)
+                    with self._lock:
+                        stats.errors += 1
+                    return (None, str(e))
+
+            if attempt < self.max_retries:
+                with self._lock:
+                    stats.retries += 1
+                time.sleep(self._backoff(attempt, retry_after))
+
+        with self._lock:
+            stats.errors += 1
+        get_metrics().inc("scrape_errors", host=host)
+        return (None, last_error)
+
+    def report(self, elapsed):
+        """In throughput theo từng host."""
+        if not self.stats:
+            return
+        print(f"📡 Thống kê theo host ({elapsed:.1f}s):")
+        for host, s in sorted(self.stats.items(), key=lambda item: -item[1].requests):
+            avg = s.seconds / s.requests if s.requests else 0
+            print(f"   {host:<28} ok {s.ok:>4} | lỗi {s.errors:>3} | retry {s.retries:>3} | "
+                  f"{s.ok / elapsed if elapsed else 0:5.2f} bài/s | {avg:5.2f}s/req | {s.bytes / 1024 / 1024:6.1f} MB")
+
+    def close(self):
+        self.session.close()
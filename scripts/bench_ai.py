@@ -0,0 +1,80 @@
+import sys
+import os
+import stat
+import time
+import tempfile
+import argparse
+import threading
+import concurrent.futures
+
+# Add parent directory to path to import ai_helper
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import ai_engines
+from ai_helper import call_ai_cli
+from ai_router import reset_router
+from fake_ai import make_server
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def make_fake_cli(tmp_dir, kind, cold_start, latency):
+    """Tạo file thực thi giả lập CLI để engine spawn như CLI thật."""
+    path = os.path.join(tmp_dir, f"fake-{kind}")
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\n")
+        f.write(f'exec "{sys.executable}" "{os.path.join(SCRIPTS_DIR, "fake_ai.py")}" {kind} '
+                f'--cold-start {cold_start} --latency {latency} "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+def run_calls(engine, calls, workers):
+    # Mỗi lượt bắt đầu với rate limiter / circuit breaker mới, không gọi qua cache (đo lời gọi thật)
+    reset_router()
+    prompts = [f"Bench prompt {i}" for i in range(calls)]
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda p: call_ai_cli(p, engine_override=engine, use_cache=False), prompts))
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if not r)
+    return elapsed, failed
+
+def report(name, calls, elapsed, failed):
+    print(f"  {name:<6} {calls} calls  {elapsed:7.2f}s  {calls / elapsed:8.1f} calls/s  (lỗi: {failed})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo calls/s của engine CLI (spawn mỗi lần) và HTTP gateway (worker ấm).")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=6, help="Số thread gọi song song (như step4)")
+    parser.add_argument("--concurrency", type=int, default=4, help="AI_MAX_CONCURRENCY cho mỗi engine")
+    parser.add_argument("--cold-start", type=float, default=0.5, help="Cold start giả lập của CLI (giây)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Thời gian model xử lý giả lập (giây)")
+    parser.add_argument("--rate-limit", type=int, default=1_000_000,
+                        help="AI_RATE_LIMITS (request/phút) cho mỗi engine, mặc định đủ lớn để không giới hạn")
+    args = parser.parse_args()
+
+    config.AI_MAX_CONCURRENCY = {"gemini": args.concurrency, "codex": args.concurrency}
+    config.AI_RATE_LIMITS = {"gemini": args.rate_limit, "codex": args.rate_limit}
+    print(f"📊 Benchmark {args.calls} lời gọi, {args.workers} workers, concurrency {args.concurrency}/engine")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config.GEMINI_CLI_PATH = make_fake_cli(tmp_dir, "gemini", args.cold_start, args.latency)
+        config.CODEX_CLI_PATH = make_fake_cli(tmp_dir, "codex", args.cold_start, args.latency)
+        config.AI_HTTP_ENDPOINTS = {"gemini": "", "codex": ""}
+        ai_engines.reset_engines()
+        print("🐢 CLI (spawn mỗi prompt):")
+        for engine in ("gemini", "codex"):
+            report(engine, args.calls, *run_calls(engine, args.calls, args.workers))
+
+    server = make_server(0, args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/generate"
+    config.AI_HTTP_ENDPOINTS = {"gemini": endpoint, "codex": endpoint}
+    ai_engines.reset_engines()
+    print("🚀 HTTP gateway (worker ấm, keep-alive):")
+    for engine in ("gemini", "codex"):
+        report(engine, args.calls, *run_calls(engine, args.calls, args.workers))
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import sys
+import os
+import time
+import argparse
+import threading
+
+# Add parent directory to path to import step4_report
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import ai_engines
+from ai_router import reset_router
+from step4_report import iter_analyses
+from fake_ai import make_server
+from token_budget import get_prompt_stats
+
+def make_rows(count, content_chars):
+    body = ("Ngân hàng Nhà nước điều chỉnh lãi suất điều hành thêm 0,5 điểm phần trăm. " * (content_chars // 70 + 1))[:content_chars]
+    return [(f"https://bench.local/{i}", f"Bài benchmark số {i}", f"[{i}] {body}", None) for i in range(count)]
+
+def run(rows, batch_mode):
+    config.ANALYSIS_BATCH_MODE = batch_mode
+    reset_router() # Rate limiter / circuit breaker mới cho mỗi lượt
+    stats = {"calls": 0}
+    start = time.perf_counter()
+    ok = sum(1 for _, res in iter_analyses(rows, stats) if res)
+    return time.perf_counter() - start, stats["calls"], ok
+
+def report(name, rows, elapsed, calls, ok):
+    print(f"  {name:<26} {calls:4d} lời gọi  {elapsed:7.2f}s  {elapsed / len(rows):6.3f}s/bài  "
+          f"{calls / len(rows):5.2f} lời gọi/bài  (thành công {ok}/{len(rows)})")
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh phân tích 1 bài/prompt và nhiều bài/prompt trên fake AI gateway.")
+    parser.add_argument("--articles", type=int, default=60)
+    parser.add_argument("--content-chars", type=int, default=6000)
+    parser.add_argument("--latency", type=float, default=1.0, help="Độ trễ cố định mỗi lời gọi (giây)")
+    parser.add_argument("--item-latency", type=float, default=0.3, help="Độ trễ thêm cho mỗi bài trong prompt (giây)")
+    parser.add_argument("--rate-limit", type=int, default=1_000_000,
+                        help="AI_RATE_LIMITS (request/phút), mặc định đủ lớn để không giới hạn")
+    args = parser.parse_args()
+
+    server = make_server(0, args.latency, args.item_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/generate"
+    config.AI_ENGINE = "gemini"
+    config.AI_CACHE_ENABLED = False
+    config.AI_HTTP_ENDPOINTS = {"gemini": endpoint, "codex": endpoint}
+    config.AI_MAX_CONCURRENCY = {"gemini": config.ANALYSIS_WORKERS, "codex": config.ANALYSIS_WORKERS}
+    config.AI_RATE_LIMITS = {"gemini": args.rate_limit, "codex": args.rate_limit}
+    ai_engines.reset_engines()
+
+    rows = make_rows(args.articles, args.content_chars)
+    print(f"📊 Benchmark phân tích {len(rows)} bài, {config.ANALYSIS_WORKERS} workers "
+          f"(latency {args.latency}s + {args.item_latency}s/bài)")
+    report("1 bài/prompt", rows, *run(rows, False))
+    report(f"batch ≤{config.ANALYSIS_BATCH_MAX_ITEMS} bài/prompt", rows, *run(rows, True))
+    get_prompt_stats().report()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import sys
+import os
+import re
+import time
+import glob
+import argparse
+
+# Add parent directory to path to import extractors
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from extractors import extract_content, ExtractorPool
+
+CANONICAL_RE = re.compile(
+    r'<link[^>]+rel=["\']canonical["\'][^>]+href=["\']([^"\']+)["\']'
+    r'|<meta[^>]+property=["\']og:url["\'][^>]+content=["\']([^"\']+)["\']',
+    re.IGNORECASE,
+)
+
+def page_url(html, path):
+    """URL của bài lấy từ <link rel="canonical"> / og:url, nếu không có thì dùng tên file."""
+    match = CANONICAL_RE.search(html)
+    return (match.group(1) or match.group(2)) if match else f"file://{os.path.abspath(path)}"
+
+def load_corpus(corpus_dir):
+    """Đọc các file *.html đã lưu. Output: [(url, html)]"""
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "**", "*.html"), recursive=True)):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        corpus.append((page_url(html, path), html))
+    return corpus
+
+def load_expected(corpus_dir):
+    """
+    Đoạn nội dung mong đợi của từng trang: file .expect cùng tên với file .html (tạo bởi scripts/export_fixtures.py).
+    Mỗi dòng 1 đoạn phải có, dòng "!..." là đoạn không được có, dòng "#" / trống bị bỏ qua.
+    Output: {url: (đoạn phải có, đoạn không được có)}
+    """
+    expected = {}
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "**", "*.html"), recursive=True)):
+        expect_path = path[:-len(".html")] + ".expect"
+        if not os.path.exists(expect_path):
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            url = page_url(f.read(), path)
+        present, absent = [], []
+        with open(expect_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = " ".join(line.split())
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("!"):
+                    absent.append(line[1:].strip())
+                else:
+                    present.append(line)
+        expected[url] = (present, absent)
+    return expected
+
+def run_sequential(corpus):
+    return [extract_content(url, html) for url, html in corpus]
+
+def run_process_pool(corpus, workers):
+    """Bóc tách bằng ExtractorPool (forkserver, như step3), tính cả thời gian khởi động process con."""
+    with ExtractorPool(workers) as pool:
+        futures = [(pool.submit(url, html), url) for url, html in corpus]
+        return [pool.result(future, url) for future, url in futures]
+
+def report(name, corpus, results, elapsed):
+    ok = sum(1 for _, content, _ in results if content)
+    print(f"  {name:<22} {elapsed:7.2f}s  {len(corpus) / elapsed:8.1f} bài/s  (bóc tách được {ok}/{len(corpus)})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo tốc độ bóc tách nội dung (bài/s) trên bộ HTML đã lưu.")
+    parser.add_argument("corpus_dir", help="Thư mục chứa các file .html")
+    parser.add_argument("--workers", type=int, default=config.SCRAPE_PARSE_WORKERS)
+    parser.add_argument("--repeat", type=int, default=1, help="Nhân bản corpus N lần để đo ổn định hơn")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus_dir) * args.repeat
+    if not corpus:
+        print(f"❌ Không tìm thấy file .html trong {args.corpus_dir}")
+        return
+    print(f"📊 Benchmark bóc tách {len(corpus)} trang HTML")
+
+    start = time.perf_counter()
+    results = run_sequential(corpus)
+    report("1 process", corpus, results, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = run_process_pool(corpus, args.workers)
+    report(f"ExtractorPool x{args.workers}", corpus, results, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import sys
+import os
+import time
+import argparse
+from collections import defaultdict
+from urllib.parse import urlparse
+
+# Add parent directory to path to import extractors
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from newspaper import Article
+from extractors import find_site_extractor, SITE_EXTRACTORS
+from bench_extract import load_corpus, load_expected
+
+# Trang thật đã rút gọn (1 trang / domain có extractor riêng, xuất bằng scripts/export_fixtures.py)
+# + đoạn nội dung mong đợi (file .expect cùng tên)
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html_fixtures")
+
+def newspaper_default(url, html):
+    """Cách bóc tách cũ của step3: newspaper3k với cấu hình mặc định."""
+    article = Article(url)
+    article.set_html(html)
+    article.parse()
+    return article.text
+
+def measure(fn, url, html):
+    start = time.perf_counter()
+    try:
+        text = fn(url, html) or ""
+    except Exception:
+        text = ""
+    return time.perf_counter() - start, len(text)
+
+def check_expected(corpus, expected):
+    """
+    Kiểm tra nội dung extractor theo trang có đủ các đoạn mong đợi và không lẫn đoạn ngoài thân bài
+    (phát hiện XPath hỏng khi trang đổi giao diện). Output: số trang sai.
+    """
+    failures = 0
+    checked = set()
+    for url, html in corpus:
+        if url not in expected:
+            continue
+        present, absent = expected[url]
+        if not present:
+            print(f"⚠️ {url}: file .expect chưa có đoạn nội dung mong đợi nào")
+            continue
+        checked.add(url)
+        extractor = find_site_extractor(url)
+        text = " ".join((extractor.extract(html) if extractor is not None else "").split())
+        missing = [p for p in present if p not in text]
+        leaked = [p for p in absent if p in text]
+        if missing or leaked:
+            failures += 1
+            print(f"❌ Sai nội dung: {url} (thiếu {len(missing)}/{len(present)} đoạn, lẫn {len(leaked)} đoạn không mong muốn)")
+            for p in missing:
+                print(f"   thiếu: {p[:120]!r}")
+            for p in leaked:
+                print(f"   lẫn: {p[:120]!r}")
+
+    for domain, extractor in sorted(SITE_EXTRACTORS.items()):
+        if any(find_site_extractor(url) is extractor for url in checked):
+            continue
+        print(f"⚠️ Chưa có trang mẫu kèm nội dung mong đợi cho {domain} (xuất bằng scripts/export_fixtures.py)")
+    if checked and not failures:
+        print(f"✅ {len(checked)} trang có đủ nội dung mong đợi.")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh extractor theo trang (XPath) với newspaper3k: tốc độ và độ dài nội dung.")
+    parser.add_argument("corpus_dir", nargs="?", default=FIXTURES_DIR,
+                        help="Thư mục chứa các file .html đã lưu, kèm file .expect nội dung mong đợi nếu có (mặc định: scripts/html_fixtures)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus_dir)
+    if not corpus:
+        print(f"❌ Không tìm thấy file .html trong {args.corpus_dir} (xuất trang mẫu từ HTML archive bằng scripts/export_fixtures.py)")
+        sys.exit(1)
+
+    failures = check_expected(corpus, load_expected(args.corpus_dir))
+
+    # domain -> [số trang, tg site, độ dài site, tg newspaper, độ dài newspaper, số trang site đủ dài]
+    totals = defaultdict(lambda: [0, 0.0, 0, 0.0, 0, 0])
+    for url, html in corpus:
+        extractor = find_site_extractor(url)
+        if extractor is None:
+            continue
+        row = totals[urlparse(url).netloc.lower()]
+        site_time, site_len = measure(lambda u, h: extractor.extract(h), url, html)
+        np_time, np_len = measure(newspaper_default, url, html)
+        row[0] += 1
+        row[1] += site_time
+        row[2] += site_len
+        row[3] += np_time
+        row[4] += np_len
+        row[5] += site_len >= config.MIN_ARTICLE_LENGTH
+
+    if not totals:
+        print("⚠️ Corpus không có trang nào thuộc các domain có extractor riêng.")
+        sys.exit(1 if failures else 0)
+
+    print(f"📊 {sum(r[0] for r in totals.values())} trang | ms/trang và số ký tự trung bình (site XPath vs newspaper3k)")
+    print(f"   {'domain':<24} {'trang':>5} {'site ms':>8} {'np ms':>8} {'tăng tốc':>8} {'site len':>9} {'np len':>8} {'site đạt':>8}")
+    for domain, (count, s_time, s_len, n_time, n_len, ok) in sorted(totals.items()):
+        speedup = n_time / s_time if s_time else 0
+        print(f"   {domain:<24} {count:>5} {s_time / count * 1000:>8.2f} {n_time / count * 1000:>8.2f} "
+              f"{speedup:>7.1f}x {s_len // count:>9} {n_len // count:>8} {ok:>4}/{count:<3}")
+
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import sys
+import os
+import time
+import argparse
+from datetime import datetime, timedelta, timezone
+
+# Add parent directory to path to import database_manager
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import get_db
+from step1_fetch import upsert_articles
+
+PER_ROW_SQL = """
+    INSERT INTO articles (url, title, source, published_date, image_url, status, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s, 'fetched', NOW(), NOW())
+    ON CONFLICT (url) DO UPDATE SET
+        title = EXCLUDED.title,
+        image_url = COALESCE(articles.image_url, EXCLUDED.image_url),
+        published_date = COALESCE(articles.published_date, EXCLUDED.published_date),
+        updated_at = NOW()
+    RETURNING (xmax = 0) AS is_inserted;
+"""
+
+def make_rows(count, feed_size):
+    """Sinh dữ liệu giả lập: count bài, chia đều cho các feed feed_size bài."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = []
+    for i in range(count):
+        source = f"https://bench.local/feed-{i // feed_size}.rss"
+        rows.append((
+            f"https://bench.local/article-{i}",
+            f"Bench article {i}",
+            source,
+            now - timedelta(minutes=i % 1440),
+            None,
+        ))
+    return rows
+
+def split_feeds(rows, feed_size):
+    return [rows[i:i + feed_size] for i in range(0, len(rows), feed_size)]
+
+def ingest_per_row(cur, feeds):
+    inserted = updated = 0
+    for feed_rows in feeds:
+        for row in feed_rows:
+            cur.execute(PER_ROW_SQL, row)
+            if cur.fetchone()[0]:
+                inserted += 1
+            else:
+                updated += 1
+    return inserted, updated
+
+def ingest_batched(cur, feeds):
+    inserted = updated = 0
+    for feed_rows in feeds:
+        i, u = upsert_articles(cur, feed_rows)
+        inserted += i
+        updated += u
+    return inserted, updated
+
+def run_case(cur, name, ingest_fn, feeds, total):
+    # Lần 1: toàn bộ là INSERT, lần 2: toàn bộ là UPDATE (ON CONFLICT)
+    cur.execute("TRUNCATE articles")
+    for phase in ("insert", "update"):
+        start = time.perf_counter()
+        inserted, updated = ingest_fn(cur, feeds)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<8} {phase:<7} {elapsed:8.2f}s  {total / elapsed:10.0f} rows/s  (+{inserted} / ~{updated})")
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh ingest từng dòng và ingest theo batch vào bảng articles.")
+    parser.add_argument("--rows", type=int, default=10000, help="Tổng số bài giả lập")
+    parser.add_argument("--feed-size", type=int, default=50, help="Số bài mỗi feed (1 batch = 1 feed)")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.feed_size)
+    feeds = split_feeds(rows, args.feed_size)
+    print(f"📊 Benchmark ingest {args.rows} bài ({len(feeds)} feeds x {args.feed_size} bài)")
+
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            # Bảng TEMP cùng tên nằm trước public trong search_path, nên SQL của step1
+            # ghi vào bảng tạm này chứ không chạm vào dữ liệu thật.
+            cur.execute("CREATE TEMP TABLE articles (LIKE public.articles INCLUDING ALL)")
+            run_case(cur, "per-row", ingest_per_row, feeds, args.rows)
+            run_case(cur, "batched", ingest_batched, feeds, args.rows)
+        conn.rollback()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import sys
+import os
+import time
+import argparse
+
+# Add parent directory to path to import database_manager
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import get_db
+
+# Schema riêng chứa bảng benchmark, xóa khi xong
+BENCH_SCHEMA = "bench_layout"
+
+# Cột hàng đợi (có ở cả 2 layout)
+QUEUE_COLUMNS = """
+    url TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    source TEXT,
+    published_date TIMESTAMP,
+    image_url TEXT,
+    status VARCHAR(50) DEFAULT 'fetched',
+    cluster_id TEXT,
+    scrape_attempts INT DEFAULT 0,
+    scrape_error TEXT,
+    analysis_attempts INT DEFAULT 0,
+    analysis_error TEXT,
+    filter_score INT,
+    filter_reason TEXT,
+    claimed_by TEXT,
+    claim_expires_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+"""
+
+# Layout cũ: nội dung + kết quả phân tích nằm chung dòng articles
+WIDE_DDL = f"""
+    CREATE TABLE wide ({QUEUE_COLUMNS},
+        content TEXT, scraped_at TIMESTAMP,
+        summary TEXT, tags JSONB, author_intent TEXT, impact_analysis TEXT,
+        analyzed_at TIMESTAMP, model_version VARCHAR(50),
+        language VARCHAR(10), importance_score INT, origin VARCHAR(10)
+    );
+    CREATE INDEX ON wide (status, published_date);
+"""
+
+# Layout mới: dòng hàng đợi nhỏ + bảng phụ
+NARROW_DDL = f"""
+    CREATE TABLE narrow ({QUEUE_COLUMNS});
+    CREATE INDEX ON narrow (status, published_date);
+    CREATE TABLE narrow_content (url TEXT PRIMARY KEY REFERENCES narrow(url), content TEXT, scraped_at TIMESTAMP);
+    CREATE TABLE narrow_analysis (
+        url TEXT PRIMARY KEY REFERENCES narrow(url),
+        summary TEXT, tags JSONB, author_intent TEXT, impact_analysis TEXT,
+        analyzed_at TIMESTAMP, model_version VARCHAR(50),
+        language VARCHAR(10), importance_score INT, origin VARCHAR(10)
+    );
+"""
+
+# Dữ liệu giả lập: mọi bài đã cào + phân tích (trường hợp nặng nhất cho layout cũ)
+SOURCE_SQL = """
+    CREATE TABLE source AS
+    SELECT
+        'https://bench.local/' || g AS url,
+        'Tin benchmark số ' || g AS title,
+        'https://bench.local/feed-' || (g % 20) || '.rss' AS source,
+        (NOW() AT TIME ZONE 'UTC') - g * INTERVAL '30 seconds' AS published_date,
+        'analyzed' AS status,
+        repeat('Nội dung bài báo ' || g || ' với nhiều số liệu 1.234 tỷ đồng. ', %(content_repeat)s) AS content,
+        repeat('Tóm tắt ' || g || '. ', 20) AS summary,
+        jsonb_build_object('sectors', jsonb_build_array('Ngân hàng', 'Bất động sản'),
+                           'entities', jsonb_build_array('Vingroup', 'Techcombank'),
+                           'keywords', jsonb_build_array('Lãi suất', 'FED', 'Tỷ giá'),
+                           'sentiment', 'Trung lập') AS tags,
+        repeat('Tác động ' || g || '. ', 30) AS impact_analysis
+    FROM generate_series(1, %(rows)s) AS g
+"""
+
+FILL_SQL = """
+    INSERT INTO wide (url, title, source, published_date, status, content, scraped_at, summary, tags,
+                      author_intent, impact_analysis, analyzed_at, model_version, language, importance_score, origin)
+    SELECT url, title, source, published_date, status, content, published_date, summary, tags,
+           'Tin tức', impact_analysis, published_date, 'bench', 'vi', 5, 'VN'
+    FROM source;
+
+    INSERT INTO narrow (url, title, source, published_date, status)
+    SELECT url, title, source, published_date, status FROM source;
+    INSERT INTO narrow_content (url, content, scraped_at)
+    SELECT url, content, published_date FROM source;
+    INSERT INTO narrow_analysis (url, summary, tags, author_intent, impact_analysis, analyzed_at,
+                                 model_version, language, importance_score, origin)
+    SELECT url, summary, tags, 'Tin tức', impact_analysis, published_date, 'bench', 'vi', 5, 'VN' FROM source;
+
+    DROP TABLE source;
+    VACUUM ANALYZE wide;
+    VACUUM ANALYZE narrow;
+"""
+
+# Vòng đời hàng đợi: giữ bài -> đổi status + trả lease (giống WorkClaims + các bước 2-4)
+CLAIM_SQL = """
+    UPDATE {table} SET claimed_by = 'bench', claim_expires_at = (NOW() AT TIME ZONE 'UTC') + INTERVAL '10 minutes'
+    WHERE url = ANY(%s)
+"""
+STATUS_SQL = """
+    UPDATE {table} SET status = %s, claimed_by = NULL, claim_expires_at = NULL, updated_at = NOW()
+    WHERE url = ANY(%s)
+"""
+
+def relation_bytes(cur, table):
+    """Output: (heap, toast, index) bytes."""
+    cur.execute("""
+        SELECT pg_relation_size(c.oid),
+               COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0),
+               pg_indexes_size(c.oid)
+        FROM pg_class c
+        WHERE c.oid = %s::regclass
+    """, (f"{BENCH_SCHEMA}.{table}",))
+    return cur.fetchone()
+
+def wal_lsn(cur):
+    cur.execute("SELECT pg_current_wal_lsn()")
+    return cur.fetchone()[0]
+
+def wal_bytes_since(cur, lsn):
+    cur.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (lsn,))
+    return int(cur.fetchone()[0])
+
+def mb(value):
+    return value / 1024 / 1024
+
+def run_layout(conn, table, rows, updates, batch):
+    """Chạy `updates` lượt đổi status theo batch rồi VACUUM. Output: dict số liệu."""
+    urls = [f"https://bench.local/{i}" for i in range(1, rows + 1)]
+    statuses = ("fetched", "filtered_in", "scraped", "analyzed")
+    with conn.cursor() as cur:
+        heap_before, toast_before, index_before = relation_bytes(cur, table)
+        lsn = wal_lsn(cur)
+        started = time.monotonic()
+        done = 0
+        step = 0
+        while done < updates:
+            chunk = urls[(done % rows):(done % rows) + batch]
+            cur.execute(CLAIM_SQL.format(table=table), (chunk,))
+            cur.execute(STATUS_SQL.format(table=table), (statuses[step % len(statuses)], chunk))
+            conn.commit()
+            done += len(chunk)
+            step += 1
+        update_seconds = time.monotonic() - started
+        wal = wal_bytes_since(cur, lsn)
+        heap_after, toast_after, index_after = relation_bytes(cur, table)
+
+    # VACUUM không chạy được trong transaction
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            started = time.monotonic()
+            cur.execute(f"VACUUM {table}")
+            vacuum_seconds = time.monotonic() - started
+    finally:
+        conn.autocommit = False
+
+    return {
+        "rows_per_second": done / update_seconds if update_seconds else 0,
+        "update_seconds": update_seconds,
+        "wal_mb": mb(wal),
+        "heap_before_mb": mb(heap_before),
+        "heap_after_mb": mb(heap_after),
+        "toast_mb": mb(toast_after),
+        "index_growth_mb": mb(index_after - index_before),
+        "vacuum_seconds": vacuum_seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh layout articles cũ (1 bảng rộng) và mới (articles + article_content + article_analysis).")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=200_000, help="Tổng số lượt đổi status")
+    parser.add_argument("--batch", type=int, default=500, help="Số bài mỗi lần UPDATE (như BatchWriter)")
+    parser.add_argument("--content-repeat", type=int, default=60, help="Độ dài nội dung giả lập (số câu)")
+    parser.add_argument("--keep", action="store_true", help=f"Giữ lại schema {BENCH_SCHEMA} sau khi chạy")
+    args = parser.parse_args()
+
+    with get_db() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+                cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+                cur.execute(f"SET search_path TO {BENCH_SCHEMA}, public")
+                started = time.monotonic()
+                cur.execute(WIDE_DDL)
+                cur.execute(NARROW_DDL)
+                cur.execute(SOURCE_SQL, {"rows": args.rows, "content_repeat": args.content_repeat})
+                cur.execute(FILL_SQL)
+                print(f"🧱 Đã tạo {args.rows:,} bài cho mỗi layout ({time.monotonic() - started:.1f}s).")
+            conn.autocommit = False
+
+            results = {}
+            for label, table in (("Cũ (wide)", "wide"), ("Mới (narrow)", "narrow")):
+                print(f"⏳ {label}: {args.updates:,} lượt đổi status, batch {args.batch}...")
+                results[label] = run_layout(conn, table, args.rows, args.updates, args.batch)
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                if not args.keep:
+                    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+                cur.execute("RESET search_path")
+            conn.autocommit = False
+
+    print(f"\n{'Layout':<14} {'dòng/s':>9} {'WAL MB':>8} {'heap MB trước→sau':>20} {'TOAST MB':>9} {'index +MB':>10} {'VACUUM s':>9}")
+    for label, r in results.items():
+        print(f"{label:<14} {r['rows_per_second']:>9.0f} {r['wal_mb']:>8.1f} "
+              f"{r['heap_before_mb']:>9.1f} → {r['heap_after_mb']:<8.1f} {r['toast_mb']:>9.1f} "
+              f"{r['index_growth_mb']:>10.1f} {r['vacuum_seconds']:>9.2f}")
+    old, new = results["Cũ (wide)"], results["Mới (narrow)"]
+    if old["rows_per_second"] and new["wal_mb"]:
+        print(f"\n📈 Layout mới: {new['rows_per_second'] / old['rows_per_second']:.1f}x dòng/s, "
+              f"WAL ít hơn {old['wal_mb'] / new['wal_mb']:.1f}x, VACUUM nhanh hơn {old['vacuum_seconds'] / max(new['vacuum_seconds'], 1e-6):.1f}x.")
+
+if __name__ == "__main__":
+    main()
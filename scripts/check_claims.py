@@ -0,0 +1,159 @@
+import sys
+import os
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from psycopg2.extras import execute_values
+
+# Add parent directory to path to import project modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import get_db
+from work_queue import WorkClaims, UTC_NOW
+
+# Status riêng cho self-test, không worker thật nào lấy nhầm
+TEST_STATUS = "claim_test"
+TEST_PREFIX = "claimtest://"
+
+def report():
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT status, claimed_by, count(*),
+                       count(*) FILTER (WHERE claim_expires_at < {UTC_NOW}),
+                       min(claim_expires_at)
+                FROM articles
+                WHERE claimed_by IS NOT NULL
+                GROUP BY status, claimed_by
+                ORDER BY status, claimed_by
+            """)
+            rows = cur.fetchall()
+    if not rows:
+        print("✅ Không có bài nào đang được giữ.")
+        return
+    print(f"{'status':<14} {'worker':<40} {'số bài':>7} {'hết hạn':>8}  lease sớm nhất hết hạn (UTC)")
+    for status, worker, count, expired, expires_at in rows:
+        print(f"{status:<14} {worker:<40} {count:>7} {expired:>8}  {expires_at:%Y-%m-%d %H:%M:%S}")
+
+def release_expired():
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE articles SET claimed_by = NULL, claim_expires_at = NULL
+                WHERE claim_expires_at < {UTC_NOW}
+            """)
+            count = cur.rowcount
+        conn.commit()
+    print(f"🧹 Đã trả lại {count} bài có lease hết hạn.")
+
+def claim_all(claims, chunk):
+    """Giữ lần lượt từng phần `chunk` bài tới khi hết. Output: danh sách url đã giữ."""
+    urls = []
+    while True:
+        with get_db() as conn:
+            rows = claims.claim(conn, TEST_STATUS, columns="url", order_by="url", limit=chunk)
+        if not rows:
+            return urls
+        urls.extend(r[0] for r in rows)
+
+def claim_urls(claims):
+    with get_db() as conn:
+        return {r[0] for r in claims.claim(conn, TEST_STATUS, columns="url", order_by="url")}
+
+def check(condition, message):
+    print(f"  {'✅' if condition else '❌'} {message}")
+    return condition
+
+def selftest(rows, workers, chunk):
+    """
+    Kiểm tra cơ chế giữ bài trên DB thật (nên dùng Postgres local:
+    `docker compose -f infrastructure/postgres/docker-compose.yml up -d`, chạy với USE_SSH_TUNNEL=false).
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    all_urls = {f"{TEST_PREFIX}{i:06d}" for i in range(rows)}
+    ok = True
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM articles WHERE url LIKE %s", (TEST_PREFIX + "%",))
+            execute_values(cur, "INSERT INTO articles (url, title, status, published_date) VALUES %s",
+                           [(url, url, TEST_STATUS, now - timedelta(minutes=i)) for i, url in enumerate(sorted(all_urls))])
+        conn.commit()
+
+    try:
+        # 1. Nhiều worker giữ song song: không trùng, không sót
+        print(f"🧪 {workers} worker cùng giữ {rows} bài (mỗi lần {chunk} bài)...")
+        results = [None] * workers
+        sessions = [WorkClaims() for _ in range(workers)]
+
+        def worker(i):
+            results[i] = claim_all(sessions[i], chunk)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        claimed = [url for urls in results for url in urls]
+        ok &= check(len(claimed) == len(set(claimed)), f"Không bài nào bị 2 worker giữ ({len(claimed)} lượt giữ, {time.monotonic() - started:.2f}s)")
+        ok &= check(set(claimed) == all_urls, "Mọi bài đều được giữ")
+        print(f"     Phân bổ: {[len(urls) for urls in results]}")
+        for session in sessions:
+            session.close()
+        ok &= check(claim_urls(WorkClaims()) == all_urls, "Đóng phiên thì bài được trả lại")
+        release_test_claims()
+
+        # 2. Worker chết giữa chừng (không gia hạn, không trả lại): lease hết hạn thì bài được lấy lại
+        print("🧪 Worker chết giữa chừng...")
+        crashed = WorkClaims(lease_seconds=1)
+        with get_db() as conn:
+            lost = {r[0] for r in crashed.claim(conn, TEST_STATUS, columns="url", order_by="url", limit=10)}
+        ok &= check(not (claim_urls(WorkClaims()) & lost), "Lease còn hạn: worker khác không lấy được")
+        release_test_claims(keep=crashed.worker_id)
+        time.sleep(1.5)
+        ok &= check(claim_urls(WorkClaims()) == lost, "Lease hết hạn: bài được worker khác lấy lại")
+        release_test_claims()
+
+        # 3. Phiên đang mở được gia hạn lease
+        print("🧪 Gia hạn lease...")
+        with WorkClaims(lease_seconds=2) as alive:
+            with get_db() as conn:
+                held = {r[0] for r in alive.claim(conn, TEST_STATUS, columns="url", order_by="url", limit=10)}
+            time.sleep(3)
+            ok &= check(not (claim_urls(WorkClaims()) & held), "Quá thời gian lease ban đầu nhưng bài vẫn được giữ")
+    finally:
+        with get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM articles WHERE url LIKE %s", (TEST_PREFIX + "%",))
+            conn.commit()
+
+    print("🎉 Self-test OK." if ok else "❌ Self-test FAILED.")
+    return ok
+
+def release_test_claims(keep=None):
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE articles SET claimed_by = NULL, claim_expires_at = NULL
+                WHERE url LIKE %s AND claimed_by IS DISTINCT FROM %s
+            """, (TEST_PREFIX + "%", keep))
+        conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Xem / dọn các bài đang được worker giữ (work queue trên bảng articles).")
+    parser.add_argument("--release-expired", action="store_true", help="Trả lại ngay các bài có lease đã hết hạn")
+    parser.add_argument("--selftest", action="store_true", help="Kiểm tra giữ bài song song / lease hết hạn trên DB (dùng dữ liệu giả, tự dọn)")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.selftest:
+        sys.exit(0 if selftest(args.rows, args.workers, args.chunk) else 1)
+    if args.release_expired:
+        release_expired()
+    report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import sys
+import os
+from datetime import datetime
+
+# Add parent directory to path to import project modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from dedup import assign_clusters, cluster_updates, title_shingles, title_numbers_compatible, _priority
+
+# (tên, [(url, tiêu đề, status)], các nhóm URL mong đợi cùng cụm)
+# status 'scraped' = bài đã cào (ưu tiên làm đại diện), 'filtered_in' = bài chờ cào
+CASES = [
+    ("Cùng tin, khác báo", [
+        ("a", "Ngân hàng Nhà nước giữ nguyên lãi suất điều hành", "scraped"),
+        ("b", "Ngân hàng Nhà nước tiếp tục giữ nguyên lãi suất điều hành", "filtered_in"),
+    ], [{"a", "b"}]),
+    ("Tin lặp lại hằng ngày, khác ngày", [
+        ("a", "Giá vàng hôm nay 17/10: SJC tăng mạnh, nhẫn trơn đi ngang", "scraped"),
+        ("b", "Giá vàng hôm nay 18/10: SJC tăng mạnh, nhẫn trơn đi ngang", "filtered_in"),
+        ("c", "Tỷ giá USD hôm nay 17/10", "filtered_in"),
+        ("d", "Tỷ giá USD hôm nay 18/10", "filtered_in"),
+    ], []),
+    ("Không nối chuỗi A~B~C khi A và C khác nhau", [
+        ("b", "Chứng khoán Mỹ tăng điểm", "scraped"),
+        ("a", "Fed giữ nguyên lãi suất, chứng khoán Mỹ tăng điểm", "filtered_in"),
+        ("c", "Chứng khoán Mỹ tăng điểm, giá dầu giảm mạnh", "filtered_in"),
+    ], [{"a", "b"}]),
+]
+
+def clusters_of(assignment):
+    groups = {}
+    for key, rep in assignment.items():
+        groups.setdefault(rep, set()).add(key)
+    return sorted(groups.values(), key=sorted)
+
+def main():
+    """Kiểm tra gom cụm theo tiêu đề trên các cặp tiêu đề mẫu (không cần DB)."""
+    failures = 0
+    published = datetime(2024, 10, 18)
+    for name, articles, expected in CASES:
+        items = [(url, title, _priority(status, ('scraped', 'analyzed'), 8, published)) for url, title, status in articles]
+        assignment = assign_clusters(items, title_shingles, config.DEDUP_TITLE_THRESHOLD, compatible=title_numbers_compatible)
+        got = clusters_of(assignment)
+        if got != sorted(expected, key=sorted):
+            failures += 1
+            print(f"❌ {name}: mong đợi {sorted(expected, key=sorted)}, nhận được {got}")
+            continue
+
+        # Đại diện (bài đã cào) cũng được ghi cluster_id, bài chờ cào còn lại là 'duplicate'
+        updates = {url: (cluster_id, is_duplicate) for url, cluster_id, is_duplicate in
+                   cluster_updates([(url, status, None) for url, _, status in articles], 'filtered_in', assignment)}
+        for group in expected:
+            rep = next(url for url, _, status in articles if url in group and status == 'scraped')
+            want = {url: (rep, url != rep) for url in group}
+            if {url: updates.get(url) for url in group} != want:
+                failures += 1
+                print(f"❌ {name}: cluster_id ghi sai {updates}, mong đợi {want}")
+                break
+        else:
+            print(f"✅ {name}")
+
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
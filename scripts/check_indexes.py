@@ -0,0 +1,213 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+# Add parent directory to path to import project modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import get_db
+from migrate import load_migrations, BASE_DIR
+from work_queue import WorkClaims, count_pending
+from dedup import cluster_before_scrape, cluster_before_analysis
+from insights import load_day_articles
+
+# Schema riêng chứa bảng giả lập, xóa khi xong (không đụng dữ liệu thật)
+CHECK_SCHEMA = "idx_check"
+
+# Bảng giả lập ~1 năm dữ liệu (1 bài / 30s): bài cũ phần lớn đã xong, chỉ bài 2 ngày gần nhất còn đang xử lý
+FILL_SQL = """
+    INSERT INTO articles (url, title, source, published_date, status, filter_score, created_at, updated_at)
+    SELECT
+        'https://synthetic.local/' || g,
+        'Tin giả lập số ' || g,
+        'https://synthetic.local/feed-' || (g % 20) || '.rss',
+        ts,
+        st,
+        CASE WHEN st IN ('fetched') THEN NULL ELSE g % 11 END,
+        ts, ts
+    FROM (
+        SELECT g,
+               (NOW() AT TIME ZONE 'UTC') - g * INTERVAL '30 seconds' AS ts,
+               CASE
+                   WHEN g < 5760 THEN (ARRAY['fetched', 'filtered_in', 'scraped', 'analyzed', 'filtered_out', 'filtered_out'])[g % 6 + 1]
+                   WHEN g % 20 < 13 THEN 'filtered_out'
+                   WHEN g % 20 < 18 THEN 'analyzed'
+                   WHEN g % 20 < 19 THEN 'duplicate'
+                   ELSE 'scrape_failed'
+               END AS st
+        FROM generate_series(1, %s) AS g
+    ) s
+"""
+
+FILL_CONTENT_SQL = """
+    INSERT INTO article_content (url, content, scraped_at)
+    SELECT url, repeat('Nội dung ' || title || '. ', 10), published_date
+    FROM articles WHERE status IN ('scraped', 'analyzed')
+"""
+
+FILL_ANALYSIS_SQL = """
+    INSERT INTO article_analysis (url, summary, tags, impact_analysis, analyzed_at)
+    SELECT url, 'Tóm tắt ' || title, jsonb_build_object('sectors', jsonb_build_array('Ngành ' || length(url) % 7)),
+           'Tác động ' || title, published_date
+    FROM articles WHERE status = 'analyzed'
+"""
+
+# Bảng lớn dần theo thời gian: query nóng không được quét toàn bộ
+CHECKED_TABLES = ("articles", "article_content", "article_analysis")
+
+LAST_24H = "AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'"
+
+class Capture:
+    """
+    Connection / cursor giả: ghi lại các câu SQL mà hàm của pipeline chạy (không trả dữ liệu),
+    để EXPLAIN đúng query thật thay vì chép lại.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def execute(self, sql, params=None):
+        self.queries.append((sql, params))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return (0,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+def captured(fn, *args, **kwargs):
+    """Chạy fn(conn hoặc cur, ...) trên Capture. Output: (sql, params) của câu lệnh đầu tiên."""
+    capture = Capture()
+    fn(capture, *args, **kwargs)
+    return capture.queries[0]
+
+def hot_queries():
+    """Các query nóng của pipeline: (tên, sql, params)."""
+    claims = WorkClaims()
+    queries = [
+        ("step2 claim 'fetched' 24h", *captured(claims.claim, "fetched", where=LAST_24H)),
+        ("step3 claim 'filtered_in'", *captured(claims.claim, "filtered_in", columns="url")),
+        ("step4 claim 'scraped' 24h", *captured(claims.claim, "scraped", columns="url, title, content, published_date",
+                                                join="LEFT JOIN article_content USING (url)", where=LAST_24H)),
+        ("dedup trước khi cào", *captured(cluster_before_scrape)),
+        ("dedup trước khi phân tích", *captured(cluster_before_analysis)),
+        ("insight: bài 'analyzed' 24h", *captured(load_day_articles)),
+        ("đếm bài chờ xử lý", *captured(count_pending)),
+        ("step2: tiêu đề đã xử lý 24h", f"SELECT title FROM articles WHERE status <> 'fetched' {LAST_24H}", None),
+    ]
+    return queries
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+def explain(cur, sql, params, analyze=False):
+    """EXPLAIN (FORMAT JSON); analyze=True chạy thật trong transaction rồi rollback."""
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cur.execute(f"EXPLAIN ({options}) {sql}", params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+def summarize(plan):
+    nodes = list(plan_nodes(plan["Plan"]))
+    seq_scans = [n for n in nodes if n["Node Type"] == "Seq Scan" and n.get("Relation Name") in CHECKED_TABLES]
+    indexes = sorted({n["Index Name"] for n in nodes if n.get("Index Name")})
+    return seq_scans, indexes
+
+def run_explains(conn, label, analyze):
+    """EXPLAIN toàn bộ query nóng. Output: số query còn Seq Scan trên các bảng CHECKED_TABLES."""
+    print(f"\n📋 {label}")
+    regressions = 0
+    for name, sql, params in hot_queries():
+        with conn.cursor() as cur:
+            plan = explain(cur, sql, params, analyze)
+        conn.rollback()
+        seq_scans, indexes = summarize(plan)
+        regressions += bool(seq_scans)
+        timing = f" | {plan['Execution Time']:8.2f} ms" if analyze else ""
+        print(f"   {'❌ Seq Scan' if seq_scans else '✅ Index   '} {name:<30} cost {plan['Plan']['Total Cost']:>12.1f}{timing} | {', '.join(indexes) or '-'}")
+    return regressions
+
+def build_table(conn, rows):
+    with open(os.path.join(BASE_DIR, "schema.sql"), "r", encoding="utf-8") as f:
+        schema_sql = f.read()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {CHECK_SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {CHECK_SCHEMA}")
+        cur.execute(f"SET search_path TO {CHECK_SCHEMA}, public")
+        cur.execute(schema_sql)
+        # Index cũ của schema.sql (migration 0001 thay bằng index theo status + published_date)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_articles_status ON articles(status)")
+        cur.execute("ALTER TABLE articles SET UNLOGGED")
+        started = time.monotonic()
+        cur.execute(FILL_SQL, (rows,))
+        cur.execute(FILL_CONTENT_SQL)
+        cur.execute(FILL_ANALYSIS_SQL)
+        cur.execute("ANALYZE articles")
+        cur.execute("ANALYZE article_content")
+        cur.execute("ANALYZE article_analysis")
+    print(f"🧱 Đã tạo {rows:,} bài giả lập ({time.monotonic() - started:.1f}s).")
+
+def apply_indexes(conn):
+    """Chạy các migration trên bảng giả lập (autocommit, nên CONCURRENTLY vẫn chạy được)."""
+    started = time.monotonic()
+    with conn.cursor() as cur:
+        for migration in load_migrations():
+            if migration.no_transaction:
+                for statement in migration.statements():
+                    cur.execute(statement)
+            else:
+                cur.execute(migration.sql)
+        cur.execute("ANALYZE articles")
+    print(f"🔧 Đã áp dụng migrations ({time.monotonic() - started:.1f}s).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra query nóng dùng index (EXPLAIN trên bảng giả lập, không đụng dữ liệu thật).")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (chạy thật query, có thời gian thực thi)")
+    parser.add_argument("--keep", action="store_true", help=f"Giữ lại schema {CHECK_SCHEMA} sau khi chạy")
+    args = parser.parse_args()
+
+    with get_db() as conn:
+        conn.autocommit = True
+        try:
+            build_table(conn, args.rows)
+            conn.autocommit = False
+            run_explains(conn, "Trước migrations (chỉ schema.sql):", args.analyze)
+            conn.autocommit = True
+            apply_indexes(conn)
+            conn.autocommit = False
+            regressions = run_explains(conn, "Sau migrations:", args.analyze)
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+            if not args.keep:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP SCHEMA IF EXISTS {CHECK_SCHEMA} CASCADE")
+            with conn.cursor() as cur:
+                cur.execute("RESET search_path")
+            conn.autocommit = False
+
+    if regressions:
+        print(f"\n❌ {regressions} query nóng vẫn Seq Scan trên {', '.join(CHECKED_TABLES)}.")
+        sys.exit(1)
+    print("\n🎉 Mọi query nóng đều dùng index.")
+
+if __name__ == "__main__":
+    main()
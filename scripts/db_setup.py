@@ -5,6 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database_manager import get_db
+from migrate import migrate
 
 def setup_database():
     print("🛠️ Đang khởi tạo Database Schema...")
@@ -37,6 +38,10 @@ def setup_database():
                 
     except Exception as e:
         print(f"❌ Lỗi khi setup database: {e}")
+        return
+
+    # Index / thay đổi schema sau bản gốc nằm trong migrations/
+    migrate()
 
 if __name__ == "__main__":
     setup_database()
@@ -0,0 +1,114 @@
+import sys
+import os
+import argparse
+import lxml.html
+from lxml import etree
+
+# Add parent directory to path to import project modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_archive import HtmlArchive
+from extractors import SITE_EXTRACTORS, find_site_extractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html_fixtures")
+
+# Phần không ảnh hưởng tới XPath của extractor, bỏ đi để file mẫu nhỏ (giữ nguyên cấu trúc / class của thân bài)
+DROP_XPATH = "//script|//style|//noscript|//svg|//iframe|//template|//link[not(@rel='canonical')]"
+KEEP_META = {"og:url", "og:description", "description"}
+MIN_CANDIDATE_CHARS = 40
+
+EXPECT_HEADER = """\
+# Nội dung mong đợi của trang mẫu cùng tên (kiểm tra bởi scripts/bench_extractors.py).
+# Mỗi dòng 1 đoạn phải có trong kết quả bóc tách (so sánh sau khi chuẩn hóa khoảng trắng).
+# Dòng bắt đầu bằng "!": đoạn KHÔNG được có (menu, tin liên quan, chú thích ảnh, quảng cáo...).
+# Các dòng "#" bên dưới là đoạn văn trong trang (không lấy qua XPath của extractor):
+# đọc trang gốc rồi bỏ dấu "#" ở vài đoạn đầu / giữa / cuối thân bài và thêm "!" cho đoạn không thuộc thân bài.
+"""
+
+def trim(url, html):
+    """
+    Bỏ script / style / meta không cần thiết của HTML thật, giữ nguyên phần thân trang.
+    Trang không có <link rel="canonical"> thì thêm vào để bench nhận ra URL (và extractor) của trang mẫu.
+    """
+    tree = lxml.html.fromstring(html)
+    for node in tree.xpath(DROP_XPATH):
+        node.drop_tree()
+    for node in tree.xpath("//comment()"):
+        parent = node.getparent()
+        if parent is not None:
+            parent.remove(node)
+    for node in tree.xpath("//meta"):
+        if node.get("charset") is None and (node.get("property") or node.get("name")) not in KEEP_META:
+            node.drop_tree()
+    for node in tree.iter(etree.Element):
+        for attr in list(node.attrib):
+            if attr == "style" or attr.startswith("on"):
+                del node.attrib[attr]
+    if not tree.xpath("//link[@rel='canonical']"):
+        head = tree.find("head")
+        if head is None:
+            head = etree.Element("head")
+            tree.insert(0, head)
+        head.insert(0, etree.Element("link", rel="canonical", href=url))
+    return "<!DOCTYPE html>\n" + lxml.html.tostring(tree, encoding="unicode")
+
+def candidate_paragraphs(html):
+    """Đoạn văn đủ dài trong trang (mọi thẻ <p>) làm gợi ý cho file .expect."""
+    tree = lxml.html.fromstring(html)
+    seen = []
+    for node in tree.xpath("//p"):
+        text = " ".join(node.text_content().split())
+        if len(text) >= MIN_CANDIDATE_CHARS and text not in seen:
+            seen.append(text)
+    return seen
+
+def latest_by_domain(archive, domains):
+    """URL tải gần nhất của từng domain có extractor riêng. Output: {domain: url}"""
+    latest = {}
+    for url in archive.iter_urls():
+        extractor = find_site_extractor(url)
+        for domain in domains:
+            if SITE_EXTRACTORS[domain] is extractor:
+                latest[domain] = url # iter_urls sắp xếp theo thời điểm tải -> URL sau ghi đè URL trước
+    return latest
+
+def main():
+    parser = argparse.ArgumentParser(description="Xuất trang mẫu (HTML thật đã rút gọn) cho từng domain có extractor riêng từ HTML archive.")
+    parser.add_argument("--out", default=FIXTURES_DIR, help="Thư mục ghi trang mẫu (mặc định: scripts/html_fixtures)")
+    parser.add_argument("--domain", action="append", help="Chỉ xuất domain này (lặp lại được). Mặc định: mọi domain trong SITE_EXTRACTORS")
+    parser.add_argument("--force", action="store_true", help="Ghi đè trang mẫu / file .expect đã có")
+    args = parser.parse_args()
+
+    domains = args.domain or sorted(SITE_EXTRACTORS)
+    unknown = [d for d in domains if d not in SITE_EXTRACTORS]
+    if unknown:
+        print(f"❌ Không có extractor riêng cho: {', '.join(unknown)}")
+        sys.exit(1)
+
+    archive = HtmlArchive()
+    latest = latest_by_domain(archive, domains)
+    os.makedirs(args.out, exist_ok=True)
+    for domain in domains:
+        url = latest.get(domain)
+        if url is None:
+            print(f"⚠️ Archive chưa có trang nào của {domain}")
+            continue
+        html_path = os.path.join(args.out, f"{domain}.html")
+        expect_path = os.path.join(args.out, f"{domain}.expect")
+        if os.path.exists(html_path) and not args.force:
+            print(f"⏭️ Đã có {html_path} (dùng --force để ghi đè)")
+            continue
+
+        html = trim(url, archive.get_html(url))
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        with open(expect_path, "w", encoding="utf-8") as f:
+            f.write(EXPECT_HEADER)
+            f.write(f"# {url}\n")
+            for text in candidate_paragraphs(html):
+                f.write(f"# {text}\n")
+        print(f"✅ {domain}: {url} -> {html_path} ({len(html) // 1024} KB). Chọn đoạn mong đợi trong {expect_path}.")
+    archive.close()
+
+if __name__ == "__main__":
+    main()
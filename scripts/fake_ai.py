@@ -0,0 +1,126 @@
+"""
+Stand-in giả lập Gemini/Codex để đo throughput offline (không tốn quota).
+
+  python scripts/fake_ai.py serve --port 8787 --latency 0.05 --item-latency 0.5
+      HTTP gateway: POST {"model", "prompt"} -> {"response": "..."}
+      (--item-latency: thời gian sinh thêm cho mỗi bài 'ID: n' trong prompt, như model thật sinh output dài hơn)
+  python scripts/fake_ai.py gemini --cold-start 0.5 --model x --output-format json
+  python scripts/fake_ai.py codex --cold-start 0.5 exec --model x --skip-git-repo-check -
+      Giả lập CLI: đọc prompt từ stdin, in ra đúng format của CLI thật.
+"""
+import sys
+import re
+import json
+import time
+import zlib
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ID_PATTERN = re.compile(r"ID:\s*(\d+)")
+
+def _fake_analysis(seed):
+    return {
+        "summary": f"Tóm tắt giả lập #{seed}.",
+        "language": "vi",
+        "importance_score": 1 + seed % 10,
+        "origin": "VN",
+        "tags": {
+            "source": "Fake",
+            "sectors": ["Ngân hàng"],
+            "entities": [],
+            "people": [],
+            "locations": [],
+            "keywords": ["fake"],
+            "sentiment": "Trung lập",
+        },
+        "author_intent": "Tin tức",
+        "impact_analysis": "Ổn định",
+    }
+
+def fake_response(prompt):
+    """
+    Sinh câu trả lời hợp lệ, ổn định theo prompt:
+    - Prompt có các dòng 'ID: n' -> JSON array (dùng cho lọc tin / phân tích theo batch)
+    - Prompt tổng hợp insight -> object DailyInsight
+    - Còn lại -> object ArticleAnalysis
+    """
+    ids = ID_PATTERN.findall(prompt)
+    if ids:
+        items = []
+        for raw_id in ids:
+            seed = zlib.crc32(f"{raw_id}:{prompt[:200]}".encode("utf-8"))
+            item = _fake_analysis(seed)
+            item.update({"id": int(raw_id), "score": seed % 11, "reason": "Giả lập"})
+            items.append(item)
+        return json.dumps(items, ensure_ascii=False)
+
+    if "main_trends" in prompt:
+        date_match = re.search(r'"date":\s*"([0-9-]+)"', prompt)
+        return json.dumps({
+            "date": date_match.group(1) if date_match else "2000-01-01",
+            "main_trends": ["Xu hướng giả lập"],
+            "hidden_insights": ["Insight giả lập"],
+            "media_steering_analysis": "Thận trọng",
+            "hot_topics": ["Chủ đề giả lập"],
+            "market_sentiment_overlay": "Neutral",
+        }, ensure_ascii=False)
+
+    return json.dumps(_fake_analysis(zlib.crc32(prompt.encode("utf-8"))), ensure_ascii=False)
+
+def make_handler(latency, item_latency=0.0):
+    class FakeAIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Giữ keep-alive như gateway thật
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            prompt = payload.get("prompt", "")
+            time.sleep(latency + item_latency * max(1, len(ID_PATTERN.findall(prompt))))
+            body = json.dumps({"response": fake_response(prompt)}, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeAIHandler
+
+def make_server(port=0, latency=0.0, item_latency=0.0):
+    """Tạo HTTP server giả lập (port=0 -> port ngẫu nhiên, xem server.server_address)."""
+    return ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, item_latency))
+
+def run_cli(kind, cold_start, latency):
+    time.sleep(cold_start + latency)
+    response = fake_response(sys.stdin.read())
+    if kind == "gemini":
+        print("Loaded cached credentials.")
+        print(json.dumps({"response": response}, ensure_ascii=False))
+    else:
+        print("OpenAI Codex (fake)\n--------\nuser\n...\ncodex")
+        print(response)
+        print("tokens used\n1234")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini/Codex CLI và HTTP gateway.")
+    parser.add_argument("mode", choices=["serve", "gemini", "codex"])
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ giả lập mỗi lời gọi (giây)")
+    parser.add_argument("--item-latency", type=float, default=0.0, help="Độ trễ thêm cho mỗi bài trong prompt (giây, chỉ áp dụng cho serve)")
+    parser.add_argument("--cold-start", type=float, default=0.0, help="Độ trễ khởi động CLI (giây)")
+    args, _ = parser.parse_known_args() # Bỏ qua các tham số của CLI thật (--model, exec, ...)
+
+    if args.mode == "serve":
+        server = make_server(args.port, args.latency, args.item_latency)
+        print(f"🤖 Fake AI gateway tại http://127.0.0.1:{server.server_address[1]}/generate")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        run_cli(args.mode, args.cold_start, args.latency)
+
+if __name__ == "__main__":
+    main()
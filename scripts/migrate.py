@@ -0,0 +1,161 @@
+import sys
+import os
+import re
+import hashlib
+import argparse
+
+# Add parent directory to path to import project modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_manager import get_db
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(BASE_DIR, "migrations")
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+# Dòng đầu file: chạy từng câu lệnh ở autocommit (bắt buộc cho CREATE/DROP INDEX CONCURRENTLY)
+NO_TRANSACTION_MARK = "-- migrate: no-transaction"
+
+CREATE_MIGRATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT NOW()
+    )
+"""
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, "r", encoding="utf-8") as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+        self.no_transaction = self.sql.lstrip().startswith(NO_TRANSACTION_MARK)
+
+    def statements(self):
+        """
+        Tách file thành từng câu lệnh (kết thúc bằng ';' cuối dòng), bỏ dòng comment.
+        Chỉ dùng cho file no-transaction: nhiều câu lệnh trong 1 lần execute chạy chung 1 transaction ngầm.
+        """
+        lines = [line for line in self.sql.splitlines() if not line.strip().startswith("--")]
+        return [s.strip() for s in re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE) if s.strip()]
+
+    def __repr__(self):
+        return f"{self.version}_{self.name}"
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(directory, filename)))
+    return migrations
+
+def applied_migrations(cur):
+    """Output: {version: checksum}"""
+    cur.execute(CREATE_MIGRATIONS_TABLE_SQL)
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cur.fetchall())
+
+def invalid_indexes(cur):
+    """Index INVALID còn sót lại sau khi CREATE INDEX CONCURRENTLY lỗi giữa chừng."""
+    cur.execute("""
+        SELECT c.relname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid AND n.nspname = ANY(current_schemas(false))
+    """)
+    return [r[0] for r in cur.fetchall()]
+
+def apply_migration(conn, migration):
+    """Chạy 1 migration và ghi vào schema_migrations (lỗi thì raise)."""
+    record = ("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+              (migration.version, migration.name, migration.checksum))
+    if migration.no_transaction:
+        conn.commit()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in migration.statements():
+                    cur.execute(statement)
+                cur.execute(*record)
+        finally:
+            conn.autocommit = False
+        return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(migration.sql)
+            cur.execute(*record)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def migrate(target=None, dry_run=False):
+    """Áp dụng các migration chưa chạy theo thứ tự version (tới `target` nếu có). Output: True nếu thành công."""
+    migrations = load_migrations()
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            applied = applied_migrations(cur)
+        conn.commit()
+
+        for migration in migrations:
+            if migration.version in applied and applied[migration.version] != migration.checksum:
+                print(f"⚠️ {migration} đã chạy nhưng file bị sửa sau đó (checksum khác). Hãy tạo migration mới thay vì sửa file cũ.")
+
+        pending = [m for m in migrations if m.version not in applied and (target is None or m.version <= target)]
+        if not pending:
+            print("✅ Database đã ở phiên bản mới nhất.")
+            return True
+
+        for migration in pending:
+            mode = "no-transaction" if migration.no_transaction else "transaction"
+            if dry_run:
+                print(f"📝 [dry-run] Sẽ chạy {migration} ({mode})")
+                continue
+            print(f"🚀 Đang chạy {migration} ({mode})...")
+            try:
+                apply_migration(conn, migration)
+            except Exception as e:
+                print(f"❌ {migration} lỗi: {e}")
+                with conn.cursor() as cur:
+                    invalid = invalid_indexes(cur)
+                conn.rollback()
+                if invalid:
+                    print(f"⚠️ Index INVALID cần DROP INDEX CONCURRENTLY trước khi chạy lại: {', '.join(invalid)}")
+                return False
+            print(f"✅ {migration}")
+    return True
+
+def print_status():
+    migrations = load_migrations()
+    with get_db() as conn:
+        with conn.cursor() as cur:
+            applied = applied_migrations(cur)
+        conn.commit()
+    for migration in migrations:
+        if migration.version not in applied:
+            state = "⏳ chưa chạy"
+        elif applied[migration.version] != migration.checksum:
+            state = "⚠️ đã chạy, file đã bị sửa"
+        else:
+            state = "✅ đã chạy"
+        print(f"{state:<28} {migration}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Áp dụng các migration trong migrations/ (theo dõi ở bảng schema_migrations).")
+    parser.add_argument("--status", action="store_true", help="Chỉ xem migration nào đã / chưa chạy")
+    parser.add_argument("--dry-run", action="store_true", help="Liệt kê migration sẽ chạy, không thay đổi DB")
+    parser.add_argument("--target", default=None, help="Chỉ chạy tới version này (VD: 0001)")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status()
+        return
+    sys.exit(0 if migrate(args.target, args.dry_run) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import sys
+import os
+import time
+import argparse
+import concurrent.futures
+
+# Add parent directory to path to import project modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from html_archive import HtmlArchive
+from extractors import ExtractorPool
+from scrape_engine import host_of
+
+# Bài lỗi / chưa cào mà bóc tách lại thành công thì chuyển 'scraped'; bài đã phân tích giữ nguyên trạng thái.
+# URL trong archive nhưng đã bị xóa khỏi articles thì bỏ qua (article_content tham chiếu articles).
+SAVE_REEXTRACT_SQL = """
+    WITH v(url, content) AS (VALUES %s),
+    saved AS (
+        INSERT INTO article_content (url, content, scraped_at)
+        SELECT v.url, v.content, NOW() FROM v JOIN articles ON articles.url = v.url
+        ON CONFLICT (url) DO UPDATE SET content = EXCLUDED.content
+    )
+    UPDATE articles
+    SET status = CASE WHEN articles.status IN ('filtered_in', 'scrape_failed') THEN 'scraped' ELSE articles.status END,
+        scrape_error = NULL,
+        updated_at = NOW()
+    FROM v
+    WHERE articles.url = v.url
+"""
+
+def iter_extracted(archive, urls, workers):
+    """Đọc HTML từ archive và bóc tách bằng process pool, giới hạn số trang đang xử lý để không đầy RAM."""
+    max_in_flight = workers * 4
+    with ExtractorPool(workers) as pool:
+        in_flight = {} # future -> url
+        for url in urls:
+            if len(in_flight) >= max_in_flight:
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield pool.result(future, in_flight.pop(future))
+            html = archive.get_html(url)
+            if html is None:
+                yield (url, None, "Không có trong archive")
+                continue
+            in_flight[pool.submit(url, html)] = url
+        for future in concurrent.futures.as_completed(in_flight):
+            yield pool.result(future, in_flight[future])
+
+def main():
+    parser = argparse.ArgumentParser(description="Bóc tách lại nội dung bài báo từ HTML archive (không gọi mạng).")
+    parser.add_argument("--since", type=float, default=None, help="Chỉ xử lý HTML tải trong N ngày gần đây")
+    parser.add_argument("--domain", default=None, help="Chỉ xử lý URL thuộc domain này (VD: cafef.vn)")
+    parser.add_argument("--workers", type=int, default=config.SCRAPE_PARSE_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ bóc tách và thống kê, không ghi DB")
+    args = parser.parse_args()
+
+    archive = HtmlArchive()
+    since = time.time() - args.since * 86400 if args.since else None
+    urls = archive.iter_urls(since)
+    if args.domain:
+        urls = [u for u in urls if host_of(u) == args.domain or host_of(u).endswith("." + args.domain)]
+    if not urls:
+        print("⚠️ Không có HTML nào trong archive khớp điều kiện.")
+        return
+    print(f"🗄️ Bóc tách lại {len(urls)} trang từ archive ({args.workers} process)...")
+
+    started = time.monotonic()
+    ok = failed = 0
+    if args.dry_run:
+        for url, content, error in iter_extracted(archive, urls, args.workers):
+            if content:
+                ok += 1
+            else:
+                failed += 1
+                print(f"⚠️ {url}: {error}")
+    else:
+        from database_manager import get_db, BatchWriter
+        with get_db() as conn:
+            with BatchWriter(conn, SAVE_REEXTRACT_SQL, max_rows=config.SCRAPE_COMMIT_BATCH, max_interval=config.SCRAPE_COMMIT_INTERVAL) as writer:
+                for url, content, error in iter_extracted(archive, urls, args.workers):
+                    if content:
+                        writer.add((url, content))
+                        ok += 1
+                    else:
+                        failed += 1
+                        print(f"⚠️ {url}: {error}")
+                    writer.flush_if_due()
+
+    elapsed = time.monotonic() - started
+    print(f"🎉 Xong: {ok} bài bóc tách được, {failed} lỗi, {elapsed:.1f}s ({len(urls) / elapsed if elapsed else 0:.1f} trang/s).")
+    archive.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,11 @@ import feedparser
 import time
 import calendar
 import re
+import os
+import json
+import concurrent.futures
+import requests
+from psycopg2.extras import execute_values
 from datetime import datetime, timedelta, timezone
 import config
 from database_manager import get_db
@@ -34,8 +39,112 @@ def extract_image(entry):
             
     return None
 
-def fetch_rss():
-    print(f"--- Đang quét {len(config.RSS_URLS)} nguồn RSS ---")
+def load_feed_state():
+    """Đọc ETag/Last-Modified đã lưu của các nguồn RSS từ lần chạy trước."""
+    if not os.path.exists(config.FEED_STATE_FILE):
+        return {}
+    try:
+        with open(config.FEED_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Không đọc được feed state, bỏ qua conditional GET: {e}")
+        return {}
+
+def save_feed_state(state):
+    """Ghi feed state ra file (ghi file tạm rồi rename để không bị hỏng khi crash)."""
+    tmp_path = config.FEED_STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, config.FEED_STATE_FILE)
+
+def fetch_feed(rss_url, state):
+    """
+    Tải và parse 1 nguồn RSS (Chạy trong Thread).
+    Gửi kèm ETag/Last-Modified của lần trước, nếu server trả 304 thì bỏ qua bước parse.
+    Output: (rss_url, entries, new_state, error) - entries = None nghĩa là feed không đổi.
+    """
+    headers = {'User-Agent': config.USER_AGENT}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('modified'):
+        headers['If-Modified-Since'] = state['modified']
+
+    try:
+        response = requests.get(rss_url, headers=headers, timeout=config.RSS_TIMEOUT)
+        if response.status_code == 304:
+            return (rss_url, None, state, None)
+        response.raise_for_status()
+
+        feed = feedparser.parse(response.content)
+        new_state = {
+            'etag': response.headers.get('ETag'),
+            'modified': response.headers.get('Last-Modified'),
+        }
+        return (rss_url, feed.entries, new_state, None)
+
+    except Exception as e:
+        return (rss_url, None, state, str(e))
+
+UPSERT_ARTICLES_SQL = """
+    INSERT INTO articles (url, title, source, published_date, image_url, status, created_at, updated_at)
+    VALUES %s
+    ON CONFLICT (url) DO UPDATE SET
+        title = EXCLUDED.title,
+        image_url = COALESCE(articles.image_url, EXCLUDED.image_url),
+        published_date = COALESCE(articles.published_date, EXCLUDED.published_date),
+        updated_at = NOW()
+    RETURNING (xmax = 0) AS is_inserted;
+"""
+
+def entry_to_row(entry, source, now):
+    """
+    Chuẩn hóa 1 entry RSS thành tuple (url, title, source, published_date, image_url).
+    Trả về None nếu bài không có link hoặc đã quá 24h.
+    """
+    title = entry.get('title', 'No Title')
+    link = entry.get('link', '')
+    if not link:
+        return None
+
+    published_parsed = entry.get('published_parsed')
+    if published_parsed:
+        published_date = datetime.fromtimestamp(calendar.timegm(published_parsed), tz=timezone.utc).replace(tzinfo=None)
+    else:
+        published_date = now
+
+    # Chỉ lấy bài trong vòng 24h qua (So sánh ở UTC)
+    if now - published_date > timedelta(hours=24):
+        return None
+
+    return (link, title, source, published_date, extract_image(entry))
+
+def upsert_articles(cur, rows):
+    """
+    Upsert toàn bộ bài của 1 feed trong 1 câu lệnh (1 round trip thay vì 1 lần / bài).
+    Output: (inserted_count, updated_count)
+    """
+    # ON CONFLICT không cho phép 1 câu lệnh cập nhật cùng 1 dòng 2 lần -> khử trùng URL trước
+    unique_rows = {}
+    for row in rows:
+        unique_rows[row[0]] = row
+    if not unique_rows:
+        return 0, 0
+
+    results = execute_values(
+        cur,
+        UPSERT_ARTICLES_SQL,
+        list(unique_rows.values()),
+        template="(%s, %s, %s, %s, %s, 'fetched', NOW(), NOW())",
+        page_size=len(unique_rows),
+        fetch=True,
+    )
+    inserted = sum(1 for r in results if r[0])
+    return inserted, len(results) - inserted
+
+def fetch_rss(urls=None):
+    """Quét các nguồn RSS (mặc định: toàn bộ config.RSS_URLS). Output: (total_articles, new_articles_count)"""
+    urls = config.RSS_URLS if urls is None else urls
+    print(f"--- Đang quét {len(urls)} nguồn RSS ---")
     if config.TEST_MODE:
         print(f"Chế độ TEST: Giới hạn {config.TEST_LIMIT} bài mỗi nguồn.")
 
@@ -43,64 +152,63 @@ def fetch_rss():
     updated_articles_count = 0
     total_articles = 0
     skipped_count = 0
+    not_modified_count = 0
+
+    feed_state = load_feed_state()
+    max_workers = max(1, min(config.RSS_FETCH_WORKERS, len(urls)))
     
     with get_db() as conn:
-        with conn.cursor() as cur:
-            for rss_url in config.RSS_URLS:
-                feed = feedparser.parse(rss_url)
-                print(f"[{rss_url}] Lấy được {len(feed.entries)} bài.")
+        with conn.cursor() as cur, concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Tải song song, xử lý feed nào xong trước thì ghi DB trước
+            futures = [executor.submit(fetch_feed, url, feed_state.get(url, {})) for url in urls]
+
+            for future in concurrent.futures.as_completed(futures):
+                rss_url, feed_entries, new_state, error = future.result()
+                if error:
+                    print(f"❌ [{rss_url}] Lỗi tải RSS: {error}")
+                    continue
+                if feed_entries is None:
+                    not_modified_count += 1
+                    print(f"[{rss_url}] Không có thay đổi (304).")
+                    continue
+
+                print(f"[{rss_url}] Lấy được {len(feed_entries)} bài.")
                 
-                entries = feed.entries[:config.TEST_LIMIT] if config.TEST_MODE else feed.entries
+                entries = feed_entries[:config.TEST_LIMIT] if config.TEST_MODE else feed_entries
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                rows = []
                 
                 for entry in entries:
                     total_articles += 1
                     try:
-                        # Chuẩn hóa dữ liệu
-                        title = entry.get('title', 'No Title')
-                        link = entry.get('link', '')
-                        published_parsed = entry.get('published_parsed')
-                        published_parsed = entry.get('published_parsed')
-                        if published_parsed:
-                            published_date = datetime.fromtimestamp(calendar.timegm(published_parsed), tz=timezone.utc).replace(tzinfo=None)
-                        else:
-                            published_date = datetime.now(timezone.utc).replace(tzinfo=None)
-                        
-                        # Chỉ lấy bài trong vòng 24h qua (So sánh ở UTC)
-                        if datetime.now(timezone.utc).replace(tzinfo=None) - published_date > timedelta(hours=24):
-                            skipped_count += 1
-                            continue
-                            
-                        source = rss_url
-                        image_url = extract_image(entry)
-
-                        if not link: continue
-
-                        # Upsert vào DB
-                        cur.execute("""
-                            INSERT INTO articles (url, title, source, published_date, image_url, status, created_at, updated_at)
-                            VALUES (%s, %s, %s, %s, %s, 'fetched', NOW(), NOW())
-                            ON CONFLICT (url) DO UPDATE SET
-                                title = EXCLUDED.title,
-                                image_url = COALESCE(articles.image_url, EXCLUDED.image_url),
-                                published_date = COALESCE(articles.published_date, EXCLUDED.published_date),
-                                updated_at = NOW()
-                            RETURNING (xmax = 0) AS is_inserted;
-                        """, (link, title, source, published_date, image_url))
-                        
-                        result = cur.fetchone()
-                        if result:
-                            if result[0]: # is_inserted
-                                new_articles_count += 1
-                            else:
-                                updated_articles_count += 1
-                            
+                        row = entry_to_row(entry, rss_url, now)
                     except Exception as e:
                         print(f"⚠️ Lỗi xử lý bài: {e}")
                         continue
-            
-            conn.commit()
+                    if row is None:
+                        skipped_count += 1
+                        continue
+                    rows.append(row)
+
+                # Upsert cả feed trong 1 lệnh, commit theo từng feed để lỗi 1 feed không kéo theo feed khác
+                try:
+                    inserted, updated = upsert_articles(cur, rows)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"❌ [{rss_url}] Lỗi ghi DB: {e}")
+                    continue
+
+                new_articles_count += inserted
+                updated_articles_count += updated
+                feed_state[rss_url] = new_state
+
+    # Chỉ lưu ETag/Last-Modified sau khi đã commit, tránh mất bài nếu crash giữa chừng
+    save_feed_state(feed_state)
 
-    print(f"✅ Đã cập nhật database: +{new_articles_count} bài mới, {updated_articles_count} bài cũ được cập nhật (Tổng quét: {total_articles}, Bỏ qua: {skipped_count} bài quá 24h)")
+    if not_modified_count:
+        print(f"💤 {not_modified_count}/{len(urls)} nguồn không có bài mới (304).")
+    print(f"✅ Đã cập nhật database: +{new_articles_count} bài mới, {updated_articles_count} bài cũ được cập nhật (Tổng quét: {total_articles}, Bỏ qua: {skipped_count} bài quá 24h hoặc thiếu link)")
     
     return total_articles, new_articles_count
 
@@ -1,100 +1,321 @@
-import json
 import config
+import json
 import random
-from ai_helper import call_ai_cli
+import concurrent.futures
+from psycopg2.extras import execute_values
+from ai_helper import call_ai_cli, cache_key
+from ai_cache import get_cache
 from database_manager import get_db
+from work_queue import claim_session
+from prefilter import Prefilter
+from ai_json import extract_array, AIJSONError
+from models import FilterScore
+from token_budget import pack, prompt_budget
+from metrics import get_metrics
 
-def filter_news():
-    print(f"\n--- [Step 2] Filtering News (Threshold: {config.IMPORTANCE_THRESHOLD}) ---")
+# Tăng khi đổi FILTER_PROMPT / cách chấm điểm để không dùng lại điểm đã cache theo prompt cũ
+FILTER_PROMPT_VERSION = 1
+
+FILTER_PROMPT = """
+    Bạn là một chuyên gia phân tích tài chính. Hãy đánh giá tầm quan trọng của các tin tức sau (điểm từ 0-10).
+    Hệ thống chỉ lấy những tin >= {threshold}.
     
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            # 1. Lấy danh sách bài có status = 'fetched' TRONG VÒNG 24H QUA
-            cur.execute("""
-                SELECT url, title 
-                FROM articles 
-                WHERE status = 'fetched' 
-                AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'
-            """)
-            raw_news = cur.fetchall() # [(url, title), ...]
-            
-            if not raw_news:
-                print("⚠️ Không có bài báo nào cần lọc (status='fetched').")
-                return []
-
-            # TEST MODE Logic
-            if config.TEST_MODE:
-                mode_desc = "ngẫu nhiên" if config.TEST_RANDOM else "mới nhất"
-                print(f"🛠️ [TEST MODE] Giới hạn {config.TEST_LIMIT * 2} bài {mode_desc} để gửi AI lọc.")
-                
-                if config.TEST_RANDOM:
-                    random.shuffle(raw_news)
-                
-                raw_news = raw_news[:config.TEST_LIMIT * 2]
-
-            # 2. Prepare & Run AI Filtering in Batches
-            articles_map = {i: (url, title) for i, (url, title) in enumerate(raw_news)}
-            all_ids = list(articles_map.keys())
-            batch_size = 50 # Xử lý 50 bài mỗi đợt để đảm bảo độ chính xác
-            selected_urls = []
-            
-            print(f"🔍 Bắt đầu đánh giá {len(all_ids)} bài báo (Batch size: {batch_size})...")
-
-            for i in range(0, len(all_ids), batch_size):
-                batch_ids = all_ids[i:i + batch_size]
-                prompt_list = [f"ID: {bid} | Title: {articles_map[bid][1]}" for bid in batch_ids]
-                prompt_text = "\n".join(prompt_list)
-
-                query = f"""
-                Bạn là một chuyên gia phân tích tài chính. Hãy đánh giá tầm quan trọng của các tin tức sau (điểm từ 0-10).
-                Hệ thống chỉ lấy những tin >= {config.IMPORTANCE_THRESHOLD}.
-                
-                Yêu cầu Output JSON Array duy nhất, mỗi phần tử chứa:
-                - id: ID của bài báo (số nguyên)
-                - score: Điểm quan trọng (0-10)
-                - reason: Lý do ngắn gọn (1 câu tiếng Việt)
+    Yêu cầu Output JSON Array duy nhất, mỗi phần tử chứa:
+    - id: ID của bài báo (số nguyên)
+    - score: Điểm quan trọng (0-10)
+    - reason: Lý do ngắn gọn (1 câu tiếng Việt)
+
+    Ví dụ: [{{"id": 0, "score": 8, "reason": "Ảnh hưởng tỷ giá"}}, {{"id": 1, "score": 2, "reason": "Tin PR"}}]
+
+    Danh sách bài báo:
+    {items}
+    """
+
+# Chỉ ghi bài worker vẫn đang giữ và còn ở 'fetched' (lease hết hạn, worker khác đã lấy lại thì bỏ qua).
+# RETURNING: các URL đã ghi.
+SAVE_SCORES_SQL = """
+    UPDATE articles
+    SET status = v.status, filter_score = v.filter_score, filter_reason = v.filter_reason
+    FROM (VALUES %s) AS v(url, status, filter_score, filter_reason, worker)
+    WHERE articles.url = v.url AND articles.claimed_by = v.worker AND articles.status = 'fetched'
+    RETURNING articles.url
+"""
+
+# Tin prefilter loại vì gần trùng: ghi 'duplicate' + cluster_id của tin đã thấy (giống dedup.cluster_before_scrape),
+# tin đại diện chưa có cluster_id thì được ghi cluster_id = URL của nó để tra cụm từ bài nào cũng ra.
+SAVE_DUPLICATES_SQL = """
+    WITH v(url, cluster_id, filter_reason, worker) AS (VALUES %s),
+    reps AS (
+        UPDATE articles
+        SET cluster_id = articles.url
+        WHERE articles.url IN (SELECT cluster_id FROM v) AND articles.cluster_id IS NULL
+    )
+    UPDATE articles
+    SET status = 'duplicate', cluster_id = v.cluster_id, filter_reason = v.filter_reason, updated_at = NOW()
+    FROM v
+    WHERE articles.url = v.url AND articles.claimed_by = v.worker AND articles.status = 'fetched'
+    RETURNING articles.url
+"""
+
+def render_item(item):
+    bid, title = item
+    return f"ID: {bid} | Title: {title}"
+
+def build_batches(items, token_budget, max_items):
+    """
+    Chia danh sách (id, title) thành các batch sao cho phần danh sách bài
+    trong prompt không vượt quá token_budget và không quá max_items bài.
+    """
+    return pack(items, render_item, prompt_budget(config.FILTER_MODEL, token_budget), max_items)
+
+def _score_cache_key(title):
+    """Điểm cache theo từng tiêu đề (không theo cả prompt batch: batch đổi thành phần thì vẫn trúng cache)."""
+    key = f"filter-score:v{FILTER_PROMPT_VERSION}:{config.IMPORTANCE_THRESHOLD}\x00{' '.join(title.split())}"
+    return cache_key(key, model=config.FILTER_MODEL)
+
+def cached_scores(items):
+    """items: [(id, title)] -> (list[(id, score, reason)] đã có điểm trong cache, list[(id, title)] chưa có)"""
+    cache = get_cache()
+    if cache is None:
+        return [], list(items)
+    hits, misses = [], []
+    for bid, title in items:
+        cached = cache.get(_score_cache_key(title))
+        if cached is None:
+            misses.append((bid, title))
+        else:
+            value = json.loads(cached)
+            hits.append((bid, value["score"], value["reason"]))
+    get_metrics().inc("filter_score_cache", len(hits), result="hit")
+    get_metrics().inc("filter_score_cache", len(misses), result="miss")
+    return hits, misses
+
+def _cache_scores(scored):
+    """scored: [(title, score, reason)] - chỉ lưu các bài AI trả về đúng định dạng."""
+    cache = get_cache()
+    if cache is None:
+        return
+    for title, score, reason in scored:
+        value = json.dumps({"score": score, "reason": reason}, ensure_ascii=False)
+        cache.put(_score_cache_key(title), "filter-score", config.FILTER_MODEL, value)
+
+def count_batches(news):
+    """Số batch AI cho danh sách [(url, title)] theo cách chia batch hiện tại."""
+    items = [(bid, title) for bid, (url, title) in enumerate(news)]
+    return len(build_batches(items, token_budget=config.FILTER_PROMPT_TOKEN_BUDGET, max_items=config.FILTER_BATCH_MAX_ITEMS))
+
+def score_batch(batch):
+    """
+    Gửi 1 batch tiêu đề (chưa có trong cache) cho AI chấm điểm (Chạy trong Thread).
+    Output: (list[(id, score, reason)], list[id] các bài AI bỏ sót hoặc trả sai định dạng)
+    """
+    prompt_text = "\n".join(render_item(item) for item in batch)
+    query = FILTER_PROMPT.format(threshold=config.IMPORTANCE_THRESHOLD, items=prompt_text)
+
+    # Không cache cả câu trả lời batch: điểm được cache theo từng tiêu đề bên dưới
+    response_text = call_ai_cli(query, model=config.FILTER_MODEL, use_cache=False)
+    try:
+        result = extract_array(response_text, FilterScore)
+    except AIJSONError as e:
+        print(f"  ❌ Lỗi xử lý batch: {e}")
+        return [], [bid for bid, _ in batch]
+
+    titles = dict(batch)
+    scored = {}
+    for item in result.items:
+        if item.id in titles and item.id not in scored:
+            scored[item.id] = (item.id, item.score, item.reason)
+    _cache_scores([(titles[bid], score, reason) for bid, score, reason in scored.values()])
+    missing = [bid for bid, _ in batch if bid not in scored]
+    return list(scored.values()), missing
 
-                Ví dụ: [{{"id": 0, "score": 8, "reason": "Ảnh hưởng tỷ giá"}}, {{"id": 1, "score": 2, "reason": "Tin PR"}}]
+def save_scores(cur, rows, worker):
+    """
+    Ghi kết quả cả batch bằng 1 câu UPDATE ... FROM (VALUES ...). rows: [(url, status, score, reason)]
+    Output: set URL đã ghi (bài không còn do worker giữ thì bị bỏ qua).
+    """
+    if not rows:
+        return set()
+    # Ép kiểu ::int để cột điểm toàn NULL (kết quả prefilter) không bị Postgres suy ra là text
+    returned = execute_values(cur, SAVE_SCORES_SQL, [(*row, worker) for row in rows],
+                              template="(%s, %s, %s::int, %s, %s)", page_size=len(rows), fetch=True)
+    return {r[0] for r in returned}
 
-                Danh sách bài báo:
-                {prompt_text}
-                """
+def save_duplicates(cur, rows, worker):
+    """
+    Ghi tin gần trùng do prefilter loại. rows: [(url, cluster_id, reason)]
+    Output: set URL đã ghi (bài không còn do worker giữ thì bị bỏ qua).
+    """
+    if not rows:
+        return set()
+    returned = execute_values(cur, SAVE_DUPLICATES_SQL, [(*row, worker) for row in rows], page_size=len(rows), fetch=True)
+    return {r[0] for r in returned}
 
-                print(f"--- Processing batch {i//batch_size + 1}/{(len(all_ids)-1)//batch_size + 1} ---")
-                response_text = call_ai_cli(query, model=config.FILTER_MODEL)
-                if not response_text:
-                    continue
+def filter_chunk(conn, cur, raw_news, worker, prefilter=None, on_selected=None):
+    """
+    Lọc 1 lượt bài worker đang giữ: prefilter cục bộ rồi AI chấm điểm theo batch song song.
+    Output: (danh sách URL được chọn, số bài bỏ qua vì không còn giữ)
+    """
+    stats = {"skipped": 0}
+    # 1. Lọc cục bộ (PR, tin trùng, classifier) trước khi tốn lời gọi AI
+    audited_urls = set()
+    if prefilter is not None:
+        cur.execute("""
+            SELECT url, title, cluster_id FROM articles
+            WHERE status <> 'fetched'
+            AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'
+        """)
+        seen = cur.fetchall()
+        all_news = raw_news
+        raw_news, dropped, audited_urls = prefilter.split(raw_news, seen)
+        # Số batch AI nếu không có prefilter / sau prefilter (cùng cách chia batch, chưa tính cache)
+        prefilter.record_batches(count_batches(all_news), count_batches(raw_news))
+        try:
+            saved = save_scores(cur, [(url, 'filtered_out', None, f"[prefilter] {reason}")
+                                      for url, title, reason, cluster_id in dropped if cluster_id is None], worker)
+            saved |= save_duplicates(cur, [(url, cluster_id, f"[prefilter] {reason}")
+                                           for url, title, reason, cluster_id in dropped if cluster_id is not None], worker)
+            conn.commit()
+            stats["skipped"] += len(dropped) - len(saved)
+        except Exception as e:
+            conn.rollback()
+            print(f"  ❌ Lỗi ghi kết quả prefilter: {e}")
 
-                try:
-                    cleaned_text = response_text.replace("```json", "").replace("```", "").strip()
-                    ai_results = json.loads(cleaned_text)
+    # 2. Prepare & Run AI Filtering in Batches (song song)
+    articles_map = {i: (url, title) for i, (url, title) in enumerate(raw_news)}
+    titles = dict(raw_news)
+    selected_urls = []
+
+    def record(ai_results):
+        """Ghi điểm của 1 batch (hoặc các bài trúng cache) rồi chuyển bài đạt ngưỡng cho on_selected."""
+        rows = {}
+        for idx, score, reason in ai_results:
+            url, title = articles_map[idx]
+            if url in audited_urls:
+                prefilter.record_audit(score)
+
+            if score >= config.IMPORTANCE_THRESHOLD:
+                status = 'filtered_in'
+                print(f"  ✅ [{score}] {title}")
+            else:
+                status = 'filtered_out'
+            rows[url] = (url, status, score, reason)
+
+        try:
+            saved = save_scores(cur, list(rows.values()), worker)
+            conn.commit() # Lưu sau mỗi batch
+        except Exception as e:
+            conn.rollback()
+            print(f"  ❌ Lỗi ghi DB batch: {e}")
+            return
+
+        stats["skipped"] += len(rows) - len(saved)
+        batch_selected = [url for url, status, _, _ in rows.values() if status == 'filtered_in' and url in saved]
+        selected_urls.extend(batch_selected)
+        if on_selected is not None and batch_selected:
+            on_selected([(url, titles[url]) for url in batch_selected])
+
+    # Tiêu đề đã được chấm (cùng phiên bản prompt) thì dùng lại điểm, chỉ gửi AI các tiêu đề chưa có
+    hits, misses = cached_scores([(bid, title) for bid, (url, title) in articles_map.items()])
+    if hits:
+        print(f"♻️ Dùng lại điểm đã chấm của {len(hits)} tiêu đề (cache).")
+        record(hits)
+
+    batches = build_batches(
+        misses,
+        token_budget=config.FILTER_PROMPT_TOKEN_BUDGET,
+        max_items=config.FILTER_BATCH_MAX_ITEMS,
+    )
+    
+    print(f"🔍 Bắt đầu đánh giá {len(misses)} bài báo ({len(batches)} batch, {config.FILTER_WORKERS} luồng song song)...")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.FILTER_WORKERS) as executor:
+        pending = {executor.submit(score_batch, batch): 0 for batch in batches}
+        done_count = 0
+
+        try:
+            while pending:
+                finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    attempt = pending.pop(future)
+                    done_count += 1
+                    print(f"--- Processed batch {done_count}/{len(batches)} ---")
+                    ai_results, missing = future.result()
+
+                    # Chỉ hỏi lại các bài bị thiếu; hết lượt thì để 'fetched' cho lần chạy sau
+                    if missing and attempt < config.FILTER_BATCH_RETRIES:
+                        retry_batches = build_batches(
+                            [(bid, articles_map[bid][1]) for bid in missing],
+                            token_budget=config.FILTER_PROMPT_TOKEN_BUDGET,
+                            max_items=config.FILTER_BATCH_MAX_ITEMS,
+                        )
+                        print(f"  🔁 Hỏi lại {len(missing)} bài bị thiếu trong câu trả lời.")
+                        batches.extend(retry_batches)
+                        for batch in retry_batches:
+                            pending[executor.submit(score_batch, batch)] = attempt + 1
+                    if ai_results:
+                        record(ai_results)
+        except BaseException:
+            # on_selected lỗi (VD: pipeline bị hủy) -> không gửi AI các batch chưa chạy
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return selected_urls, stats["skipped"]
+
+def filter_news(on_selected=None, claims=None):
+    """
+    Chấm điểm các bài 'fetched' trong 24h qua. Output: danh sách URL được chọn.
+    Giữ bài theo từng lượt WORK_CLAIM_LIMIT bài (nhiều worker chia nhau việc) và lặp tới khi hết bài.
+    on_selected([(url, title)]): gọi sau mỗi batch đã commit (chế độ pipeline chuyển ngay sang bước cào).
+    claims: phiên WorkClaims dùng chung (mặc định mở phiên riêng, trả lại bài khi xong).
+    """
+    print(f"\n--- [Step 2] Filtering News (Threshold: {config.IMPORTANCE_THRESHOLD}) ---")
+    
+    selected_urls = []
+    skipped = 0
+    with claim_session(claims) as claims, get_db() as conn:
+        with conn.cursor() as cur:
+            prefilter = None
+            rounds = 0
+            while True:
+                # Giữ các bài có status = 'fetched' TRONG VÒNG 24H QUA (bài worker khác đang giữ thì bỏ qua).
+                # Bài chưa chấm được vẫn do phiên này giữ nên không bị lấy lại ở lượt sau.
+                raw_news = claims.claim(
+                    conn, 'fetched',
+                    where="AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'",
+                ) # [(url, title), ...]
+                
+                if not raw_news:
+                    if not rounds:
+                        print("⚠️ Không có bài báo nào cần lọc (status='fetched').")
+                    break
+                rounds += 1
+
+                # TEST MODE Logic
+                if config.TEST_MODE:
+                    mode_desc = "ngẫu nhiên" if config.TEST_RANDOM else "mới nhất"
+                    print(f"🛠️ [TEST MODE] Giới hạn {config.TEST_LIMIT * 2} bài {mode_desc} để gửi AI lọc.")
                     
-                    for res in ai_results:
-                        idx = res.get('id')
-                        score = res.get('score', 0)
-                        reason = res.get('reason', '')
-                        
-                        if idx in articles_map:
-                            url, title = articles_map[idx]
-                            
-                            if score >= config.IMPORTANCE_THRESHOLD:
-                                status = 'filtered_in'
-                                selected_urls.append(url)
-                                print(f"  ✅ [{score}] {title}")
-                            else:
-                                status = 'filtered_out'
-                            
-                            cur.execute("""
-                                UPDATE articles 
-                                SET status = %s, filter_score = %s, filter_reason = %s 
-                                WHERE url = %s
-                            """, (status, score, reason, url))
+                    if config.TEST_RANDOM:
+                        random.shuffle(raw_news)
                     
-                    conn.commit() # Lưu sau mỗi batch
-                except Exception as e:
-                    print(f"  ❌ Lỗi xử lý batch: {e}")
-            
-            return selected_urls
+                    raw_news = raw_news[:config.TEST_LIMIT * 2]
+
+                if config.PREFILTER_ENABLED and prefilter is None:
+                    prefilter = Prefilter.from_db(cur)
+                chunk_selected, chunk_skipped = filter_chunk(conn, cur, raw_news, claims.worker_id, prefilter, on_selected)
+                selected_urls.extend(chunk_selected)
+                skipped += chunk_skipped
+                if config.TEST_MODE:
+                    break
+
+    if skipped:
+        print(f"⚠️ Bỏ qua {skipped} kết quả: bài đã hết lease (worker khác lấy lại) hoặc đã đổi trạng thái.")
+    # Báo cáo 1 lần sau khi AI đã chấm cả mẫu kiểm tra
+    if prefilter is not None:
+        prefilter.report()
+    
+    return selected_urls
 
 if __name__ == "__main__":
     filter_news()
\ No newline at end of file
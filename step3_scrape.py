@@ -1,9 +1,16 @@
 import signal
 import time
+import queue
+import threading
 import concurrent.futures
-from newspaper import Article, Config
-from database_manager import get_db
+from database_manager import get_db, BatchWriter
+from work_queue import claim_session
+from dedup import cluster_before_scrape, promote_on_failure
+from scrape_engine import Fetcher, interleave_by_host
+from extractors import ExtractorPool
+from html_archive import HtmlArchive, ArchiveWriter, is_archivable
 import config
+from metrics import get_metrics
 import random
 
 # Timeout handler
@@ -13,92 +20,230 @@ def handler(signum, frame):
 # Register signal
 signal.signal(signal.SIGALRM, handler)
 
-import requests
+# Nội dung ghi vào article_content, articles chỉ đổi status (dòng hàng đợi giữ nhỏ).
+# Chỉ ghi bài worker vẫn đang giữ và còn ở 'filtered_in': lease đã hết hạn (worker khác lấy lại)
+# hoặc bài vừa bị gom cụm thành 'duplicate' thì bỏ qua. RETURNING: các URL đã ghi (BatchWriter returning=True).
+SAVE_CONTENT_SQL = """
+    WITH v(url, content, worker) AS (VALUES %s),
+    moved AS (
+        UPDATE articles
+        SET status = 'scraped', scrape_error = NULL
+        FROM v
+        WHERE articles.url = v.url AND articles.claimed_by = v.worker AND articles.status = 'filtered_in'
+        RETURNING articles.url
+    )
+    INSERT INTO article_content (url, content, scraped_at)
+    SELECT v.url, v.content, NOW() FROM v JOIN moved ON moved.url = v.url
+    ON CONFLICT (url) DO UPDATE SET content = EXCLUDED.content, scraped_at = EXCLUDED.scraped_at
+    RETURNING url
+"""
 
-def scrape_single_url(url):
+# Tăng bộ đếm lỗi; quá số lần cho phép thì chuyển 'scrape_failed' để không bị lấy lại mãi
+SAVE_FAILURE_SQL = """
+    UPDATE articles
+    SET scrape_attempts = COALESCE(articles.scrape_attempts, 0) + 1,
+        scrape_error = v.error,
+        status = CASE WHEN COALESCE(articles.scrape_attempts, 0) + 1 >= v.max_attempts
+                      THEN 'scrape_failed' ELSE articles.status END,
+        updated_at = NOW()
+    FROM (VALUES %s) AS v(url, error, max_attempts, worker)
+    WHERE articles.url = v.url AND articles.claimed_by = v.worker AND articles.status = 'filtered_in'
+    RETURNING articles.url
+"""
+SAVE_FAILURE_TEMPLATE = "(%s, %s, %s::int, %s)"
+
+def scrape_stream(urls, fetcher, archive=None, on_idle=None, refetch=()):
+    """
+    Cào theo 2 giai đoạn nối với nhau bằng hàng đợi có giới hạn:
+    - I/O: SCRAPE_CONCURRENCY thread tải HTML (Fetcher dùng chung) rồi đẩy vào hàng đợi,
+      hàng đợi đầy thì thread tải phải chờ (backpressure).
+      Có archive: URL đã lưu HTML thì đọc từ archive (không gọi mạng), trừ URL trong `refetch`
+      (bài đã cào lỗi: phải tải lại, không bóc tách mãi 1 bản HTML hỏng).
+      HTML vừa tải được lưu vào archive qua ArchiveWriter (thread riêng, ghi theo lô), kể cả trang
+      bóc tách lỗi (sửa extractor rồi bóc tách lại bằng scripts/reextract.py); chỉ bỏ trang hỏng (is_archivable).
+    - CPU: process pool (ExtractorPool) bóc tách nội dung, không bị GIL kìm như khi parse trong thread.
+    urls có thể là list hoặc iterable chờ dữ liệu (VD: đọc từ hàng đợi của pipeline).
+    on_idle(): gọi định kỳ trên thread của caller khi đang chờ (VD: ghi nốt lô DB đã quá hạn).
+    Yield (url, content, error) theo thứ tự hoàn thành.
+    """
+    html_queue = queue.Queue(maxsize=config.SCRAPE_HTML_QUEUE_SIZE)
+    stop = threading.Event()
+    feeding_done = threading.Event()
+    max_in_flight = config.SCRAPE_PARSE_WORKERS * 2
+    download_futures = []
+    archive_writer = ArchiveWriter(archive) if archive is not None else None
+
+    def download(url):
+        if stop.is_set():
+            return
+        try:
+            html = archive.get_html(url) if archive is not None and url not in refetch else None
+            if html is not None:
+                item = (url, html, None)
+            else:
+                item = (url, *fetcher.fetch(url))
+                if archive_writer is not None and is_archivable(item[1]):
+                    archive_writer.submit(url, item[1])
+        except Exception as e:
+            item = (url, None, str(e))
+        while not stop.is_set():
+            try:
+                html_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.SCRAPE_CONCURRENCY) as io_pool, \
+            ExtractorPool(config.SCRAPE_PARSE_WORKERS) as cpu_pool:
+        def feed():
+            try:
+                for url in urls:
+                    if stop.is_set():
+                        break
+                    download_futures.append(io_pool.submit(download, url))
+            except RuntimeError:
+                pass # Pool đã đóng do caller dừng giữa chừng
+            finally:
+                feeding_done.set()
+
+        threading.Thread(target=feed, daemon=True).start()
+        in_flight = {} # future -> url
+        received = 0
+        try:
+            while True:
+                # Đọc cờ trước số lượng: feed() chỉ bật cờ sau khi đã submit URL cuối cùng
+                all_submitted = feeding_done.is_set()
+                if all_submitted and received >= len(download_futures) and not in_flight:
+                    break
+                if len(in_flight) < max_in_flight:
+                    try:
+                        url, html, error = html_queue.get(timeout=0.05)
+                    except queue.Empty:
+                        if on_idle is not None:
+                            on_idle()
+                    else:
+                        received += 1
+                        get_metrics().observe("scrape_html_queue_depth", html_queue.qsize())
+                        get_metrics().observe("scrape_parse_in_flight", len(in_flight))
+                        if error:
+                            yield (url, None, error)
+                        else:
+                            in_flight[cpu_pool.submit(url, html)] = url
+                else:
+                    concurrent.futures.wait(in_flight, timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in [f for f in in_flight if f.done()]:
+                    yield cpu_pool.result(future, in_flight.pop(future))
+        finally:
+            # Caller dừng giữa chừng: giải phóng các thread đang chờ đẩy vào hàng đợi đầy
+            stop.set()
+            while not all(f.done() for f in list(download_futures)):
+                try:
+                    html_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if archive_writer is not None:
+                archive_writer.close()
+
+def claim_to_scrape(conn, claims):
+    """Giữ 1 lượt (WORK_CLAIM_LIMIT bài) bài đã qua bộ lọc (bài worker khác đang giữ thì bỏ qua). Output: [(url, scrape_attempts)]"""
+    rows = claims.claim(conn, 'filtered_in', columns="url, scrape_attempts")
+    
+    # GIỚI HẠN TRONG TEST MODE
+    if config.TEST_MODE and rows:
+        if config.TEST_RANDOM:
+            print(f"🛠️ [TEST MODE] Lấy ngẫu nhiên {config.TEST_LIMIT} bài để cào nội dung.")
+            random.shuffle(rows)
+        else:
+            print(f"🛠️ [TEST MODE] Lấy {config.TEST_LIMIT} bài mới nhất để cào nội dung.")
+        rows = rows[:config.TEST_LIMIT]
+    return rows
+
+def claimed_urls(claims, rows, refetch, stats):
     """
-    Hàm cào dữ liệu cho 1 URL (Chạy trong Thread).
-    Sử dụng requests với headers để tránh bị chặn 403.
+    Yield URL của lượt bài đã giữ, hết lượt thì giữ tiếp lượt sau cho tới khi không còn bài
+    (chạy trên thread cấp URL của scrape_stream nên dùng connection riêng).
+    Bài cào lỗi ở lượt trước vẫn do phiên này giữ nên không bị lấy lại.
+    refetch: thêm các URL đã cào lỗi trước đây. stats["claimed"]: tổng số bài đã giữ.
     """
-    try:
-        headers = {
-            'User-Agent': config.USER_AGENT,
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'vi,en;q=0.9,en-US;q=0.8',
-            'Referer': 'https://www.google.com/',
-            'Cache-Control': 'max-age=0',
-        }
-        
-        # 1. Tải HTML bằng requests (tốt hơn newspaper.download trong việc giả lập browser)
-        response = requests.get(url, headers=headers, timeout=config.SCRAPE_TIMEOUT)
-        response.raise_for_status()
-        html = response.text
-        
-        # 2. Dùng newspaper để parse HTML
-        article = Article(url)
-        article.set_html(html)
-        article.parse()
-        
-        content = article.text
-        if not content or len(content) < config.MIN_ARTICLE_LENGTH:
-            return (url, None, f"Content too short ({len(content) if content else 0} chars)")
-            
-        return (url, content, None)
-        
-    except Exception as e:
-        return (url, None, str(e))
-
-def scrape_articles():
+    while rows:
+        refetch.update(url for url, attempts in rows if attempts)
+        stats["claimed"] += len(rows)
+        yield from interleave_by_host([url for url, _ in rows])
+        if config.TEST_MODE:
+            return
+        with get_db() as conn:
+            rows = claim_to_scrape(conn, claims)
+
+def scrape_articles(claims=None):
     print("\n--- [Step 3] Scraping Content (Parallel) ---")
     
-    with get_db() as conn:
+    with claim_session(claims) as claims, get_db() as conn:
         with conn.cursor() as cur:
-            # 1. Get articles that passed the filter
-            cur.execute("SELECT url FROM articles WHERE status = 'filtered_in'")
-            rows = cur.fetchall()
-            
-            # GIỚI HẠN TRONG TEST MODE
-            if config.TEST_MODE:
-                if config.TEST_RANDOM:
-                    print(f"🛠️ [TEST MODE] Lấy ngẫu nhiên {config.TEST_LIMIT} bài để cào nội dung.")
-                    random.shuffle(rows)
-                else:
-                    print(f"🛠️ [TEST MODE] Lấy {config.TEST_LIMIT} bài mới nhất để cào nội dung.")
-                rows = rows[:config.TEST_LIMIT]
-            
+            # 0. Gom cụm tin trùng theo tiêu đề, chỉ cào bài đại diện của mỗi cụm
+            duplicate_count = cluster_before_scrape(cur)
+            conn.commit()
+            if duplicate_count:
+                print(f"🧬 Bỏ qua {duplicate_count} bài trùng tin với bài khác (status='duplicate').")
+
+            # 1. Giữ lượt bài đầu tiên (các lượt sau được giữ dần trong lúc cào)
+            rows = claim_to_scrape(conn, claims)
             if not rows:
                 print("⚠️ Không có bài báo nào cần cào (status='filtered_in').")
                 return []
 
-            target_urls = [r[0] for r in rows]
-            print(f"🚀 Bắt đầu cào {len(target_urls)} bài (5 threads)...")
-
-            success_count = 0
-            
-            # 2. Run Parallel Scraping
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                results = list(executor.map(scrape_single_url, target_urls))
-            
-            # 3. Update DB Sequentially
-            for url, content, error in results:
-                if content:
-                    try:
-                        cur.execute("""
-                            UPDATE articles 
-                            SET content = %s, scraped_at = NOW(), status = 'scraped'
-                            WHERE url = %s
-                        """, (content, url))
-                        success_count += 1
-                        print(f"✅ Scraped: {url}")
-                    except Exception as e:
-                        print(f"❌ DB Error {url}: {e}")
-                else:
-                    print(f"⚠️ Failed {url}: {error}")
-                    # Optional: Update status to 'failed' or keep 'filtered_in' to retry later
-            
-            conn.commit()
-            print(f"🎉 Hoàn tất cào {success_count}/{len(target_urls)} bài.")
-            return target_urls
+            print(f"🚀 Bắt đầu cào {len(rows)} bài của lượt đầu ({config.SCRAPE_CONCURRENCY} threads tải, tối đa {config.SCRAPE_PER_HOST_CONCURRENCY}/host, {config.SCRAPE_PARSE_WORKERS} process parse)...")
+
+            # 2. Run Parallel Scraping, ghi DB theo lô ngay khi có kết quả (không giữ toàn bộ nội dung trong RAM)
+            fetcher = Fetcher()
+            archive = HtmlArchive() if config.HTML_ARCHIVE_ENABLED else None
+            refetch = set()
+            claim_stats = {"claimed": 0}
+            target_urls = claimed_urls(claims, rows, refetch, claim_stats)
+            started = time.monotonic()
+            scraped_urls = []
+            failed_count = 0
+
+            content_writer = BatchWriter(conn, SAVE_CONTENT_SQL, max_rows=config.SCRAPE_COMMIT_BATCH, max_interval=config.SCRAPE_COMMIT_INTERVAL, returning=True)
+            failure_writer = BatchWriter(conn, SAVE_FAILURE_SQL, template=SAVE_FAILURE_TEMPLATE, max_rows=config.SCRAPE_COMMIT_BATCH, max_interval=config.SCRAPE_COMMIT_INTERVAL, returning=True,
+                                         on_flush=promote_on_failure(conn))
+            try:
+                with content_writer, failure_writer:
+                    for url, content, error in scrape_stream(target_urls, fetcher, archive, refetch=refetch):
+                        if content:
+                            scraped_urls.append(url)
+                            print(f"✅ Scraped: {url}")
+                        else:
+                            failed_count += 1
+                            print(f"⚠️ Failed {url}: {error}")
+                        try:
+                            if content:
+                                content_writer.add((url, content, claims.worker_id))
+                            else:
+                                failure_writer.add((url, error, config.SCRAPE_MAX_ATTEMPTS, claims.worker_id))
+                            # Ghi lô còn lại của writer kia nếu đã quá hạn
+                            content_writer.flush_if_due()
+                            failure_writer.flush_if_due()
+                        except Exception as e:
+                            # Lô lỗi được giữ lại trong writer, ghi cùng lô sau
+                            print(f"  ❌ Lỗi ghi DB lô kết quả cào ({content_writer.pending + failure_writer.pending} bài chờ ghi lại): {e}")
+            except Exception as e:
+                # Bài chưa ghi được vẫn ở 'filtered_in', được cào lại ở lần chạy sau
+                print(f"❌ Lỗi DB khi cào / ghi kết quả ({content_writer.pending + failure_writer.pending} bài chưa ghi được): {e}")
+
+            skipped = content_writer.skipped + failure_writer.skipped
+            if skipped:
+                print(f"⚠️ Bỏ qua {skipped} kết quả: bài đã hết lease (worker khác lấy lại) hoặc đã đổi trạng thái (VD: 'duplicate').")
+            fetcher.report(time.monotonic() - started)
+            fetcher.close()
+            if archive is not None:
+                stats = archive.stats()
+                print(f"🗄️ HTML archive: {stats['urls']} URL, {stats['blobs']} bản HTML, "
+                      f"{stats['raw_bytes'] / 1024 / 1024:.1f} MB -> {stats['stored_bytes'] / 1024 / 1024:.1f} MB sau nén.")
+                archive.close()
+
+            print(f"🎉 Hoàn tất cào {len(scraped_urls)}/{claim_stats['claimed']} bài ({failed_count} lỗi, sẽ thử lại tối đa {config.SCRAPE_MAX_ATTEMPTS} lần).")
+            return scraped_urls
 
 if __name__ == "__main__":
     scrape_articles()
\ No newline at end of file
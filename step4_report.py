@@ -1,11 +1,106 @@
 import concurrent.futures
 import json
-from datetime import datetime, date, timezone
+import time
+from datetime import datetime
 import config
 import random
-from ai_helper import call_ai_cli
-from models import ArticleAnalysis, ArticleTags, DailyInsight
-from database_manager import get_db
+from ai_helper import call_ai_cli, discard_cached
+from models import ArticleAnalysis, AnalysisResult
+from ai_json import extract_object, extract_array, AIJSONError
+from database_manager import get_db, BatchWriter
+from work_queue import claim_session
+from dedup import cluster_before_analysis, promote_on_failure
+from token_budget import select_content, pack, prompt_budget
+from insights import generate_daily_insights
+
+# Kết quả ghi vào article_analysis, articles chỉ đổi status (dòng hàng đợi giữ nhỏ).
+# Chỉ ghi bài worker vẫn đang giữ và còn ở 'scraped' (hết lease / đã thành 'duplicate' thì bỏ qua).
+SAVE_ANALYSIS_SQL = """
+    WITH v(url, summary, tags, author_intent, impact_analysis, analyzed_at,
+           model_version, language, importance_score, origin, worker) AS (VALUES %s),
+    moved AS (
+        UPDATE articles
+        SET status = 'analyzed'
+        FROM v
+        WHERE articles.url = v.url AND articles.claimed_by = v.worker AND articles.status = 'scraped'
+        RETURNING articles.url
+    )
+    INSERT INTO article_analysis (url, summary, tags, author_intent, impact_analysis, analyzed_at,
+                                  model_version, language, importance_score, origin)
+    SELECT v.url, v.summary, v.tags, v.author_intent, v.impact_analysis, v.analyzed_at,
+           v.model_version, v.language, v.importance_score, v.origin
+    FROM v JOIN moved ON moved.url = v.url
+    ON CONFLICT (url) DO UPDATE SET
+        summary = EXCLUDED.summary, tags = EXCLUDED.tags, author_intent = EXCLUDED.author_intent,
+        impact_analysis = EXCLUDED.impact_analysis, analyzed_at = EXCLUDED.analyzed_at,
+        model_version = EXCLUDED.model_version, language = EXCLUDED.language,
+        importance_score = EXCLUDED.importance_score, origin = EXCLUDED.origin
+    RETURNING url
+"""
+SAVE_ANALYSIS_TEMPLATE = "(%s, %s, %s::jsonb, %s::text, %s::text, %s::timestamp, %s, %s, %s::int, %s, %s)"
+
+# Tăng bộ đếm lượt phân tích lỗi; quá số lần cho phép thì chuyển 'analysis_failed' để không gọi AI lại mãi
+SAVE_ANALYSIS_FAILURE_SQL = """
+    UPDATE articles
+    SET analysis_attempts = COALESCE(articles.analysis_attempts, 0) + 1,
+        analysis_error = v.error,
+        status = CASE WHEN COALESCE(articles.analysis_attempts, 0) + 1 >= v.max_attempts
+                      THEN 'analysis_failed' ELSE articles.status END,
+        updated_at = NOW()
+    FROM (VALUES %s) AS v(url, error, max_attempts, worker)
+    WHERE articles.url = v.url AND articles.claimed_by = v.worker AND articles.status = 'scraped'
+    RETURNING articles.url
+"""
+SAVE_ANALYSIS_FAILURE_TEMPLATE = "(%s, %s, %s::int, %s)"
+ANALYSIS_FAILURE_ERROR = "AI lỗi hoặc trả về sai định dạng"
+
+def analysis_failure_row(url, worker):
+    """Dòng ghi DB của 1 bài phân tích lỗi (sau khi đã thử batch + riêng từng bài)."""
+    return (url, ANALYSIS_FAILURE_ERROR, config.ANALYSIS_MAX_ATTEMPTS, worker)
+
+def analysis_row(res, worker):
+    """Dòng ghi DB của 1 kết quả phân tích. worker: WorkClaims.worker_id đang giữ bài."""
+    return (
+        res.url,
+        res.summary,
+        res.tags.model_dump_json(),
+        res.author_intent,
+        res.impact_analysis,
+        res.analyzed_at,
+        res.model_version,
+        res.language,
+        res.importance_score,
+        res.origin,
+        worker,
+    )
+
+ANALYSIS_FIELDS = """
+        "summary": "Tóm tắt 3 câu, tập trung vào số liệu và sự kiện",
+        "language": "vi hoặc en",
+        "importance_score": 1-10,
+        "origin": "VN hoặc Global",
+        "tags": {
+            "source": "Nguồn báo",
+            "sectors": ["Bất động sản", "Ngân hàng", ...],
+            "entities": ["Vingroup", "Techcombank", ...],
+            "people": ["Phạm Nhật Vượng", ...],
+            "locations": ["TP.HCM", "Hà Nội"],
+            "keywords": ["FED", "Lãi suất", ...],
+            "sentiment": "Tích cực/Tiêu cực/Trung lập"
+        },
+        "author_intent": "Mục đích bài viết (PR, Tin tức, Cảnh báo, ...)",
+        "impact_analysis": "Dự đoán tác động ngắn hạn (Tăng/Giảm/Ổn định) đến thị trường liên quan."
+"""
+
+def build_analysis(url, title, result):
+    """Map kết quả AI (AnalysisResult đã validate) sang ArticleAnalysis."""
+    return ArticleAnalysis(
+        url=url,
+        title=title,
+        **result.model_dump(exclude={"id"}),
+        analyzed_at=datetime.now(),
+        model_version=config.GEMINI_MODEL
+    )
 
 def analyze_single_article(article_row):
     """
@@ -15,8 +110,8 @@ def analyze_single_article(article_row):
     """
     url, title, content, published_date = article_row
     
-    # Cắt ngắn nội dung nếu quá dài
-    content_snippet = content[:config.MAX_CHARS_PER_ARTICLE]
+    # Rút gọn theo ngân sách token: giữ đoạn đầu + câu nhiều số liệu, không cắt ngang câu
+    content_snippet = select_content(content, config.ANALYSIS_ARTICLE_TOKEN_BUDGET)
     
     prompt = f"""
     Phân tích bài báo tài chính sau và trích xuất thông tin dưới dạng JSON.
@@ -25,199 +120,251 @@ def analyze_single_article(article_row):
     Nội dung: {content_snippet}
     
     Yêu cầu Output JSON đúng định dạng sau (không markdown):
-    {{
-        "summary": "Tóm tắt 3 câu, tập trung vào số liệu và sự kiện",
-        "language": "vi hoặc en",
-        "importance_score": 1-10,
-        "origin": "VN hoặc Global",
-        "tags": {{
-            "source": "Nguồn báo",
-            "sectors": ["Bất động sản", "Ngân hàng", ...],
-            "entities": ["Vingroup", "Techcombank", ...],
-            "people": ["Phạm Nhật Vượng", ...],
-            "locations": ["TP.HCM", "Hà Nội"],
-            "keywords": ["FED", "Lãi suất", ...],
-            "sentiment": "Tích cực/Tiêu cực/Trung lập"
-        }},
-        "author_intent": "Mục đích bài viết (PR, Tin tức, Cảnh báo, ...)",
-        "impact_analysis": "Dự đoán tác động ngắn hạn (Tăng/Giảm/Ổn định) đến thị trường liên quan."
-    }}
+    {{{ANALYSIS_FIELDS}    }}
     """
     
     try:
         response = call_ai_cli(prompt, model=config.GEMINI_MODEL)
-        cleaned = response.replace("```json", "").replace("```", "").strip()
-        data = json.loads(cleaned)
-        
-        # Validate & Map to Pydantic Model
-        analysis = ArticleAnalysis(
-            url=url,
-            title=title,
-            summary=data.get("summary", ""),
-            language=data.get("language", "vi"),
-            importance_score=data.get("importance_score", 5),
-            origin=data.get("origin", "VN"),
-            tags=ArticleTags(**data.get("tags", {})),
-            author_intent=data.get("author_intent"),
-            impact_analysis=data.get("impact_analysis"),
-            analyzed_at=datetime.now(),
-            model_version=config.GEMINI_MODEL
-        )
-        return analysis
+        return build_analysis(url, title, extract_object(response, AnalysisResult))
         
     except Exception as e:
+        discard_cached(prompt, model=config.GEMINI_MODEL)
         print(f"❌ Error analyzing {url}: {e}")
         return None
 
-def generate_daily_insights(analyzed_articles):
+def render_batch_item(bid, article_row):
+    url, title, content, published_date = article_row
+    return f"ID: {bid}\nBài báo: {title}\nNội dung: {select_content(content, config.ANALYSIS_ARTICLE_TOKEN_BUDGET)}"
+
+def build_analysis_batches(items, token_budget, max_items):
     """
-    Tổng hợp insight từ danh sách các bài báo đã phân tích trong ngày.
+    Chia [(id, article_row)] thành các batch sao cho phần nội dung bài trong prompt
+    không vượt quá token_budget (và giới hạn của model), không quá max_items bài.
     """
-    if not analyzed_articles:
-        return None
-
-    # Gom nội dung để gửi cho AI tổng hợp
-    articles_text = ""
-    for idx, art in enumerate(analyzed_articles):
-        articles_text += f"[{idx+1}] {art.title} (Sentiment: {art.tags.sentiment})\n"
-        articles_text += f"   Summary: {art.summary}\n"
-        articles_text += f"   Impact: {art.impact_analysis}\n\n"
+    return pack(items, lambda item: render_batch_item(*item), prompt_budget(config.GEMINI_MODEL, token_budget), max_items)
 
+def analyze_batch(batch):
+    """
+    Phân tích nhiều bài trong 1 lời gọi AI (Chạy trong Thread).
+    Input: batch [(id, article_row)]
+    Output: (list[(id, ArticleAnalysis)], list[id] các bài thiếu / sai định dạng cần phân tích lại)
+    """
+    items_text = "\n\n---\n\n".join(render_batch_item(bid, row) for bid, row in batch)
     prompt = f"""
-    Dựa trên {len(analyzed_articles)} bài báo tài chính sau đây, hãy tổng hợp thành Báo Cáo Chiến Lược Ngày.
+    Phân tích từng bài báo tài chính sau và trích xuất thông tin dưới dạng JSON.
     
-    Danh sách bài báo:
-    {articles_text}
+    Danh sách bài báo (mỗi bài bắt đầu bằng ID, ngăn cách bởi ---):
+    {items_text}
     
-    Yêu cầu Output JSON (không markdown):
+    Yêu cầu Output JSON Array duy nhất (không markdown), mỗi bài 1 phần tử theo đúng định dạng sau:
     {{
-        "date": "{datetime.now(timezone.utc).date()}",
-        "main_trends": ["Xu hướng chính 1", "Xu hướng chính 2"],
-        "hidden_insights": ["Insight không hiển nhiên mà bạn nhận ra từ dữ liệu trên"],
-        "media_steering_analysis": "Phân tích xem truyền thông đang muốn lái dư luận theo hướng nào (FUD, FOMO, hay Thận trọng).",
-        "hot_topics": ["Chủ đề 1", "Chủ đề 2"],
-        "market_sentiment_overlay": "Nhận định chung về tâm lý thị trường (Bullish/Bearish/Neutral) và lý do."
-    }}
+        "id": ID của bài báo (số nguyên),{ANALYSIS_FIELDS}    }}
     """
-    
+    rows_by_id = dict(batch)
+    results = []
+
+    response = call_ai_cli(prompt, model=config.GEMINI_MODEL)
     try:
-        response = call_ai_cli(prompt, model=config.GEMINI_MODEL)
-        cleaned = response.replace("```json", "").replace("```", "").strip()
-        data = json.loads(cleaned)
-        
-        return DailyInsight(**data)
+        parsed = extract_array(response, AnalysisResult)
+    except AIJSONError as e:
+        discard_cached(prompt, model=config.GEMINI_MODEL)
+        print(f"  ❌ Lỗi xử lý batch phân tích ({len(batch)} bài): {e}")
+        return [], list(rows_by_id)
+
+    # Phần tử sai định dạng / bị cắt cụt -> bài tương ứng vẫn nằm trong rows_by_id để phân tích lại
+    for item in parsed.items:
+        if item.id not in rows_by_id:
+            continue
+        url, title, _, _ = rows_by_id.pop(item.id)
+        results.append((item.id, build_analysis(url, title, item)))
+
+    if rows_by_id:
+        # Không để cache trả lại đúng câu trả lời thiếu này khi chạy lại
+        discard_cached(prompt, model=config.GEMINI_MODEL)
+    return results, list(rows_by_id)
+
+def iter_analyses(rows, stats):
+    """
+    Phân tích song song, yield (article_row, ArticleAnalysis | None) theo thứ tự hoàn thành.
+    Chế độ batch: bài lỗi trong batch được gom thành batch mới (tối đa ANALYSIS_BATCH_RETRIES lần),
+    sau đó mới phân tích riêng từng bài. stats["calls"] đếm số lời gọi AI.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.ANALYSIS_WORKERS) as executor:
+        pending = {}
+
+        def submit_single(row):
+            pending[executor.submit(analyze_single_article, row)] = ("single", row, 0)
+
+        def submit_batches(items, attempt):
+            for batch in build_analysis_batches(items, config.ANALYSIS_PROMPT_TOKEN_BUDGET, config.ANALYSIS_BATCH_MAX_ITEMS):
+                pending[executor.submit(analyze_batch, batch)] = ("batch", batch, attempt)
+
+        if config.ANALYSIS_BATCH_MODE:
+            submit_batches(list(enumerate(rows)), 0)
+        else:
+            for row in rows:
+                submit_single(row)
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                kind, payload, attempt = pending.pop(future)
+                stats["calls"] += 1
+                if kind == "single":
+                    yield payload, future.result()
+                    continue
+
+                try:
+                    results, failed_ids = future.result()
+                except Exception as e:
+                    print(f"  ❌ Lỗi gọi AI cho batch {len(payload)} bài: {e}")
+                    results, failed_ids = [], [bid for bid, _ in payload]
+                for bid, analysis in results:
+                    yield rows[bid], analysis
+
+                failed = [(bid, rows[bid]) for bid in failed_ids]
+                if not failed:
+                    continue
+                if attempt < config.ANALYSIS_BATCH_RETRIES and len(failed) > 1:
+                    submit_batches(failed, attempt + 1)
+                else:
+                    for _, row in failed:
+                        submit_single(row)
+
+def save_daily_insight(conn, daily_insight):
+    """Lưu (ghi đè theo ngày) Daily Insight vào DB. Output: True nếu thành công."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO daily_insights (date, main_trends, hidden_insights, media_steering_analysis, hot_topics, market_sentiment_overlay, created_at)
+                VALUES (%s, %s::jsonb, %s::jsonb, %s, %s::jsonb, %s, NOW() AT TIME ZONE 'UTC')
+                ON CONFLICT (date) DO UPDATE SET
+                    main_trends = EXCLUDED.main_trends,
+                    hidden_insights = EXCLUDED.hidden_insights,
+                    media_steering_analysis = EXCLUDED.media_steering_analysis,
+                    hot_topics = EXCLUDED.hot_topics,
+                    market_sentiment_overlay = EXCLUDED.market_sentiment_overlay,
+                    created_at = NOW() AT TIME ZONE 'UTC';
+            """, (
+                daily_insight.date,
+                json.dumps(daily_insight.main_trends, ensure_ascii=False),
+                json.dumps(daily_insight.hidden_insights, ensure_ascii=False),
+                daily_insight.media_steering_analysis,
+                json.dumps(daily_insight.hot_topics, ensure_ascii=False),
+                daily_insight.market_sentiment_overlay
+            ))
+        conn.commit()
+        print("✅ Đã lưu Daily Insight vào Database.")
+        return True
     except Exception as e:
-        print(f"❌ Error generating insights: {e}")
-        return None
+        conn.rollback()
+        print(f"❌ DB Error saving insight: {e}")
+        return False
+
+def claim_to_analyze(conn, claims):
+    """
+    Giữ 1 lượt (WORK_CLAIM_LIMIT bài) bài chờ phân tích trong 24h (bài worker khác đang giữ thì bỏ qua).
+    Bài phân tích lỗi vẫn do phiên này giữ nên không bị lấy lại ở lượt sau.
+    Output: [(url, title, content, published_date)]
+    """
+    rows = claims.claim(
+        conn, 'scraped',
+        columns="url, title, content, published_date",
+        join="LEFT JOIN article_content USING (url)",
+        where="AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'",
+    )
+    
+    # GIỚI HẠN TRONG TEST MODE
+    if config.TEST_MODE and rows:
+        if config.TEST_RANDOM:
+            print(f"🛠️ [TEST MODE] Lấy ngẫu nhiên {config.TEST_LIMIT} bài để phân tích.")
+            random.shuffle(rows)
+        else:
+            print(f"🛠️ [TEST MODE] Lấy {config.TEST_LIMIT} bài mới nhất để phân tích.")
+        rows = rows[:config.TEST_LIMIT]
+    return rows
 
-def generate_report():
+def generate_report(insight=True, claims=None):
     print("\n--- [Step 4] Analyzing & Reporting ---")
     
     all_processed_analyses = []
-    
-    with get_db() as conn:
+    analyzed = {} # url -> ArticleAnalysis chờ ghi; chỉ bài đã ghi được mới tính là đã phân tích
+
+    def on_saved(rows):
+        all_processed_analyses.extend(analyzed.pop(row[0]) for row in rows)
+
+    with claim_session(claims) as claims, get_db() as conn:
         with conn.cursor() as cur:
-            # 1. Get articles available for analysis
-            cur.execute("""
-                SELECT url, title, content, published_date 
-                FROM articles 
-                WHERE status = 'scraped' 
-                AND published_date >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '24 hours'
-            """)
-            rows = cur.fetchall()
-            
-            # GIỚI HẠN TRONG TEST MODE
-            if config.TEST_MODE:
-                if config.TEST_RANDOM:
-                    print(f"🛠️ [TEST MODE] Lấy ngẫu nhiên {config.TEST_LIMIT} bài để phân tích.")
-                    random.shuffle(rows)
-                else:
-                    print(f"🛠️ [TEST MODE] Lấy {config.TEST_LIMIT} bài mới nhất để phân tích.")
-                rows = rows[:config.TEST_LIMIT]
-            
-            if not rows:
+            # 0. Gom cụm theo nội dung, chỉ phân tích bài đại diện của mỗi cụm
+            duplicate_count = cluster_before_analysis(cur)
+            conn.commit()
+            if duplicate_count:
+                print(f"🧬 Bỏ qua {duplicate_count} bài có nội dung trùng lặp (status='duplicate').")
+
+            # 1-2. Giữ từng lượt bài chờ phân tích, Analyze & Save theo lô khi các task hoàn thành
+            # (lô còn lại luôn được ghi khi thoát `with`). Lặp tới khi không còn bài để giữ.
+            total_articles = 0
+            mode_desc = (f"batch tối đa {config.ANALYSIS_BATCH_MAX_ITEMS} bài/prompt" if config.ANALYSIS_BATCH_MODE else "1 bài/prompt")
+            stats = {"calls": 0}
+            started = time.monotonic()
+            writer = BatchWriter(conn, SAVE_ANALYSIS_SQL, template=SAVE_ANALYSIS_TEMPLATE, returning=True, on_flush=on_saved,
+                                 max_rows=config.ANALYSIS_COMMIT_BATCH, max_interval=config.ANALYSIS_COMMIT_INTERVAL)
+            failure_writer = BatchWriter(conn, SAVE_ANALYSIS_FAILURE_SQL, template=SAVE_ANALYSIS_FAILURE_TEMPLATE, returning=True,
+                                         on_flush=promote_on_failure(conn), max_rows=config.ANALYSIS_COMMIT_BATCH, max_interval=config.ANALYSIS_COMMIT_INTERVAL)
+            try:
+                with writer, failure_writer:
+                    while True:
+                        rows = claim_to_analyze(conn, claims)
+                        if not rows:
+                            break
+                        total_articles += len(rows)
+                        print(f"🔍 Bắt đầu phân tích {len(rows)} bài báo ({config.ANALYSIS_WORKERS} Hybrid workers, {mode_desc}, ghi DB theo lô {config.ANALYSIS_COMMIT_BATCH} bài / {config.ANALYSIS_COMMIT_INTERVAL:.0f}s)...")
+
+                        count = 0
+                        for row, res in iter_analyses(rows, stats):
+                            count += 1
+                            if res:
+                                print(f"  ✅ [{count}/{len(rows)}] Analyzed: {res.title[:50]}...")
+                            else:
+                                print(f"  ⚠️ [{count}/{len(rows)}] Failed analysis for: {row[0]}")
+                            try:
+                                if res:
+                                    analyzed[res.url] = res
+                                    writer.add(analysis_row(res, claims.worker_id))
+                                else:
+                                    failure_writer.add(analysis_failure_row(row[0], claims.worker_id))
+                                writer.flush_if_due()
+                                failure_writer.flush_if_due()
+                            except Exception as e:
+                                # Lô lỗi được giữ lại trong writer, ghi cùng lô sau
+                                print(f"  ❌ Lỗi ghi DB lô phân tích ({writer.pending + failure_writer.pending} bài chờ ghi lại): {e}")
+                        if config.TEST_MODE:
+                            break
+            except Exception as e:
+                # Bài chưa ghi được vẫn ở 'scraped', được phân tích lại ở lần chạy sau
+                print(f"❌ Lỗi DB khi phân tích / ghi kết quả ({writer.pending + failure_writer.pending} bài chưa ghi được): {e}")
+
+            if not total_articles:
                 print("⚠️ Không có bài báo nào cần phân tích (status='scraped').")
                 return None, 0
- 
-            total_articles = len(rows)
-            print(f"🔍 Bắt đầu phân tích {total_articles} bài báo (6 Hybrid workers, update immediately)...")
-            
-            # 2. Analyze & Save sequentially as tasks complete
-            with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-                # Submit all tasks
-                future_to_url = {executor.submit(analyze_single_article, row): row[0] for row in rows}
-                
-                count = 0
-                for future in concurrent.futures.as_completed(future_to_url):
-                    url = future_to_url[future]
-                    count += 1
-                    try:
-                        res = future.result()
-                        if res:
-                            all_processed_analyses.append(res)
-                            # Update DB immediately for this article
-                            cur.execute("""
-                                UPDATE articles
-                                SET summary = %s, tags = %s::jsonb, author_intent = %s, 
-                                    impact_analysis = %s, analyzed_at = %s, model_version = %s, 
-                                    language = %s, importance_score = %s, origin = %s, 
-                                    status = 'analyzed'
-                                WHERE url = %s
-                            """, (
-                                res.summary,
-                                res.tags.model_dump_json(),
-                                res.author_intent,
-                                res.impact_analysis,
-                                res.analyzed_at, # res.analyzed_at is already UTC from get_now_utc()
-                                res.model_version,
-                                res.language,
-                                res.importance_score,
-                                res.origin,
-                                res.url
-                            ))
-                            conn.commit() # Commit ngay lập tức
-                            print(f"  ✅ [{count}/{total_articles}] Analyzed & Saved: {res.title[:50]}...")
-                        else:
-                            print(f"  ⚠️ [{count}/{total_articles}] Failed analysis for: {url}")
-                            
-                    except Exception as e:
-                        print(f"  ❌ [{count}/{total_articles}] Unexpected error for {url}: {e}")
-            
+            skipped = writer.skipped + failure_writer.skipped
+            if skipped:
+                print(f"⚠️ Bỏ qua {skipped} kết quả: bài đã hết lease (worker khác lấy lại) hoặc đã đổi trạng thái (VD: 'duplicate').")
+            if failure_writer.written:
+                print(f"⚠️ {failure_writer.written} bài phân tích lỗi (quá {config.ANALYSIS_MAX_ATTEMPTS} lượt thì chuyển 'analysis_failed').")
+            elapsed = time.monotonic() - started
+            print(f"📈 {stats['calls']} lời gọi AI cho {total_articles} bài "
+                  f"({stats['calls'] / total_articles:.2f} lời gọi/bài, {elapsed / total_articles:.2f}s/bài, tổng {elapsed:.1f}s).")
             print(f"🎉 Hoàn tất phân tích {len(all_processed_analyses)}/{total_articles} bài.")
 
-            # 4. Generate Daily Insights (from ALL articles analyzed in last 24h)
+            # 4. Generate Daily Insights (from ALL articles analyzed in last 24h, chỉ tính lại nhóm ngành có bài mới)
             
-            if all_processed_analyses:
+            if insight and all_processed_analyses:
                 print("🧠 Đang tổng hợp Insight thị trường...")
-                daily_insight = generate_daily_insights(all_processed_analyses)
+                daily_insight = generate_daily_insights(conn)
                 
-                if daily_insight:
-                    # Save Insight to DB
-                    try:
-                        cur.execute("""
-                            INSERT INTO daily_insights (date, main_trends, hidden_insights, media_steering_analysis, hot_topics, market_sentiment_overlay, created_at)
-                            VALUES (%s, %s::jsonb, %s::jsonb, %s, %s::jsonb, %s, NOW() AT TIME ZONE 'UTC')
-                            ON CONFLICT (date) DO UPDATE SET
-                                main_trends = EXCLUDED.main_trends,
-                                hidden_insights = EXCLUDED.hidden_insights,
-                                media_steering_analysis = EXCLUDED.media_steering_analysis,
-                                hot_topics = EXCLUDED.hot_topics,
-                                market_sentiment_overlay = EXCLUDED.market_sentiment_overlay,
-                                created_at = NOW() AT TIME ZONE 'UTC';
-                        """, (
-                            daily_insight.date,
-                            json.dumps(daily_insight.main_trends, ensure_ascii=False),
-                            json.dumps(daily_insight.hidden_insights, ensure_ascii=False),
-                            daily_insight.media_steering_analysis,
-                            json.dumps(daily_insight.hot_topics, ensure_ascii=False),
-                            daily_insight.market_sentiment_overlay
-                        ))
-                        conn.commit()
-                        print("✅ Đã lưu Daily Insight vào Database.")
-                        return daily_insight, len(all_processed_analyses)
-                        
-                    except Exception as e:
-                        print(f"❌ DB Error saving insight: {e}")
+                if daily_insight and save_daily_insight(conn, daily_insight):
+                    return daily_insight, len(all_processed_analyses)
             
             return None, len(all_processed_analyses)
 
@@ -0,0 +1,153 @@
+import re
+import threading
+import config
+
+# Ước lượng số ký tự / token: tiếng Việt có dấu bị tokenizer tách nhỏ hơn nhiều so với tiếng Anh
+CHARS_PER_TOKEN = {"vi": 2.6, "en": 4.0}
+DEFAULT_CHARS_PER_TOKEN = 3.0
+
+VI_CHARS_RE = re.compile(r"[àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]", re.IGNORECASE)
+LETTERS_RE = re.compile(r"[^\W\d_]", re.UNICODE)
+# Chỉ tách câu khi dấu kết câu đứng trước khoảng trắng (giữ nguyên "1.000 tỷ", "TP.HCM")
+SENTENCE_BREAK_RE = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"”’)]))\s+")
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*\s*(?:%|tỷ|triệu|nghìn|ngàn|USD|VND|đồng|bps|điểm)?", re.IGNORECASE)
+
+# Số đoạn đầu bài (sapo, đoạn mở đầu) luôn được giữ nếu còn ngân sách
+LEAD_PARAGRAPHS = 2
+
+def detect_language(text):
+    """'vi' nếu tỉ lệ chữ có dấu tiếng Việt đủ lớn, ngược lại 'en'."""
+    sample = (text or "")[:2000]
+    letters = len(LETTERS_RE.findall(sample))
+    if not letters:
+        return "en"
+    return "vi" if len(VI_CHARS_RE.findall(sample)) / letters > 0.05 else "en"
+
+def estimate_tokens(text, language=None):
+    """Ước lượng số token của text theo ngôn ngữ (không cần tokenizer của model)."""
+    if not text:
+        return 1
+    ratio = CHARS_PER_TOKEN.get(language or detect_language(text), DEFAULT_CHARS_PER_TOKEN)
+    return int(len(text) / ratio) + 1
+
+def model_token_limit(model, default=None):
+    """Giới hạn token cho phần nội dung trong 1 prompt của model (config.MODEL_PROMPT_TOKEN_LIMITS)."""
+    return config.MODEL_PROMPT_TOKEN_LIMITS.get(model, default or config.DEFAULT_PROMPT_TOKEN_LIMIT)
+
+def prompt_budget(model, stage_budget):
+    """Ngân sách token của 1 bước, không vượt quá giới hạn của model."""
+    return min(stage_budget, model_token_limit(model))
+
+def split_sentences(paragraph):
+    return [s.strip() for s in SENTENCE_BREAK_RE.split(paragraph) if s.strip()]
+
+def _truncate_words(text, max_tokens, language):
+    """Cắt tại ranh giới từ (chỉ dùng khi 1 câu đơn lẻ đã vượt ngân sách)."""
+    max_chars = int(max_tokens * CHARS_PER_TOKEN.get(language, DEFAULT_CHARS_PER_TOKEN))
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip() + "…"
+
+def select_content(text, max_tokens, language=None):
+    """
+    Chọn nội dung bài vừa ngân sách token mà không cắt ngang câu:
+    1. Giữ các đoạn đầu bài (LEAD_PARAGRAPHS) - nơi báo chí đặt thông tin chính.
+    2. Phần còn lại ưu tiên các câu chứa nhiều số liệu, giữ nguyên thứ tự xuất hiện trong bài.
+    Kết quả ổn định với cùng input (để prompt trúng AI cache).
+    """
+    text = (text or "").strip()
+    language = language or detect_language(text)
+    if estimate_tokens(text, language) <= max_tokens:
+        return text
+
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    # (vị trí đoạn, vị trí câu, câu)
+    sentences = [(pi, si, s) for pi, p in enumerate(paragraphs) for si, s in enumerate(split_sentences(p))]
+    chosen = set()
+    used = 0
+
+    for pi, si, sentence in sentences:
+        if pi >= LEAD_PARAGRAPHS:
+            break
+        cost = estimate_tokens(sentence, language)
+        if used + cost > max_tokens:
+            break
+        chosen.add((pi, si))
+        used += cost
+
+    if not chosen and sentences:
+        # Câu đầu tiên đã dài hơn cả ngân sách
+        return _truncate_words(sentences[0][2], max_tokens, language)
+
+    rest = [(pi, si, s) for pi, si, s in sentences if (pi, si) not in chosen and pi >= LEAD_PARAGRAPHS]
+    rest.sort(key=lambda item: (-len(NUMBER_RE.findall(item[2])), item[0], item[1]))
+    for pi, si, sentence in rest:
+        cost = estimate_tokens(sentence, language)
+        if used + cost <= max_tokens:
+            chosen.add((pi, si))
+            used += cost
+
+    selected = []
+    current_paragraph = None
+    for pi, si, sentence in sentences:
+        if (pi, si) not in chosen:
+            continue
+        if pi != current_paragraph:
+            selected.append([])
+            current_paragraph = pi
+        selected[-1].append(sentence)
+    return "\n".join(" ".join(group) for group in selected)
+
+def pack(items, render, token_budget, max_items):
+    """
+    Chia items thành các batch sao cho tổng token (ước lượng) của render(item)
+    không vượt quá token_budget và không quá max_items phần tử (item quá lớn vẫn đi riêng 1 batch).
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for item in items:
+        item_tokens = estimate_tokens(render(item))
+        if current and (current_tokens + item_tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+# Nhóm kích thước prompt để so sánh latency (token ước lượng)
+SIZE_BUCKETS = (1000, 4000, 16000, 64000)
+
+class PromptStats:
+    """Thống kê kích thước prompt và latency theo model, để cân chỉnh chi phí / chất lượng."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def record(self, model, prompt_tokens, seconds, response_chars=0):
+        bucket = next((b for b in SIZE_BUCKETS if prompt_tokens <= b), None)
+        with self._lock:
+            entry = self._calls.setdefault((model, bucket), [0, 0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += prompt_tokens
+            entry[2] += seconds
+            entry[3] += response_chars
+
+    def report(self):
+        with self._lock:
+            items = sorted(self._calls.items(), key=lambda item: (item[0][0], item[0][1] or float("inf")))
+        if not items:
+            return
+        print("📏 Kích thước prompt / latency theo model:")
+        for (model, bucket), (calls, tokens, seconds, response_chars) in items:
+            label = f"≤{bucket}" if bucket else f">{SIZE_BUCKETS[-1]}"
+            print(f"   {model:<24} {label:>7} tok | {calls:>4} lời gọi | TB {tokens // calls:>6} tok | "
+                  f"{seconds / calls:6.2f}s/lời gọi | {tokens / seconds if seconds else 0:8.0f} tok/s | "
+                  f"output TB {response_chars // calls} ký tự")
+
+_prompt_stats = PromptStats()
+
+def get_prompt_stats():
+    return _prompt_stats
@@ -0,0 +1,133 @@
+import os
+import uuid
+import socket
+import threading
+from contextlib import contextmanager
+import config
+from database_manager import get_db
+
+UTC_NOW = "(NOW() AT TIME ZONE 'UTC')"
+
+# Lấy các bài đang chờ ở 1 status chưa bị ai giữ (hoặc lease đã hết hạn - worker cũ đã chết).
+# SKIP LOCKED: 2 worker chạy cùng lúc không chờ nhau và không lấy trùng bài.
+CLAIM_SQL = f"""
+    WITH claimed AS (
+        UPDATE articles a
+        SET claimed_by = %(worker)s, claim_expires_at = {UTC_NOW} + make_interval(secs => %(lease)s)
+        FROM (
+            SELECT url FROM articles
+            WHERE status = %(status)s {{where}}
+            AND (claimed_by IS NULL OR claim_expires_at < {UTC_NOW})
+            ORDER BY {{order_by}}
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        ) c
+        WHERE a.url = c.url
+        RETURNING a.*
+    )
+    SELECT {{columns}} FROM claimed {{join}} ORDER BY {{order_by}}
+"""
+
+EXTEND_SQL = f"""
+    UPDATE articles SET claim_expires_at = {UTC_NOW} + make_interval(secs => %s)
+    WHERE claimed_by = %s
+"""
+
+RELEASE_SQL = "UPDATE articles SET claimed_by = NULL, claim_expires_at = NULL WHERE claimed_by = %s"
+
+def count_pending(cur):
+    """
+    Số bài bước 2-4 xử lý được ngay, cùng điều kiện với các lệnh giữ bài:
+    'fetched' / 'scraped' trong 24h, 'filtered_in' mọi thời điểm, chưa bị worker khác giữ (hoặc lease đã hết hạn).
+    """
+    cur.execute(f"""
+        SELECT count(*) FROM articles
+        WHERE (status = 'filtered_in'
+               OR (status IN ('fetched', 'scraped') AND published_date >= {UTC_NOW} - INTERVAL '24 hours'))
+        AND (claimed_by IS NULL OR claim_expires_at < {UTC_NOW})
+    """)
+    return cur.fetchone()[0]
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class WorkClaims:
+    """
+    Phiên giữ bài (lease) của 1 worker trên bảng articles, để nhiều process / máy chạy song song
+    không xử lý trùng bài:
+    - claim(): giữ các bài đang chờ ở 1 status (claimed_by, claim_expires_at).
+    - Trong lúc phiên mở, 1 thread gia hạn lease mỗi lease/3 giây.
+    - Đóng phiên: trả lại mọi bài còn giữ. Worker chết giữa chừng thì lease tự hết hạn
+      sau WORK_LEASE_SECONDS và bài được worker khác lấy lại.
+    Status trong DB vẫn quyết định bài ở bước nào; claim chỉ cho biết ai đang xử lý.
+    """
+    def __init__(self, lease_seconds=None):
+        self.worker_id = new_worker_id()
+        self.lease_seconds = lease_seconds or config.WORK_LEASE_SECONDS
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def claim(self, conn, status, columns="url, title", where="", order_by="published_date DESC, url", limit=None, urls=None, join=""):
+        """
+        Giữ tối đa `limit` bài có status (và điều kiện `where` bổ sung, VD khung 24h) rồi commit.
+        urls: chỉ giữ trong danh sách này. join: lấy thêm cột từ bảng phụ (VD: article_content).
+        Output: các dòng `columns` của bài đã giữ được.
+        """
+        if urls is not None:
+            where += " AND url = ANY(%(urls)s)"
+        sql = CLAIM_SQL.format(where=where, order_by=order_by, columns=columns, join=join)
+        with conn.cursor() as cur:
+            cur.execute(sql, {
+                "worker": self.worker_id,
+                "lease": self.lease_seconds,
+                "status": status,
+                "limit": limit if limit is not None else config.WORK_CLAIM_LIMIT,
+                "urls": list(urls or []),
+            })
+            rows = cur.fetchall()
+        conn.commit()
+        return rows
+
+    def _extend_loop(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                with get_db() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(EXTEND_SQL, (self.lease_seconds, self.worker_id))
+                    conn.commit()
+            except Exception as e:
+                print(f"⚠️ [Claims] Không gia hạn được lease ({self.worker_id}): {e}")
+
+    def start(self):
+        self._heartbeat = threading.Thread(target=self._extend_loop, name="claims-heartbeat", daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        try:
+            with get_db() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(RELEASE_SQL, (self.worker_id,))
+                conn.commit()
+        except Exception as e:
+            # Không trả được thì lease vẫn tự hết hạn
+            print(f"⚠️ [Claims] Không trả lại được các bài đang giữ ({self.worker_id}): {e}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+@contextmanager
+def claim_session(claims=None):
+    """Dùng phiên có sẵn (VD: pipeline giữ bài xuyên suốt các bước) hoặc mở phiên mới cho 1 bước."""
+    if claims is not None:
+        yield claims
+        return
+    with WorkClaims() as claims:
+        yield claims